@@ -9,6 +9,59 @@ load_dotenv()
 # Configure device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Model weight precision: "fp32", "fp16" or "bf16" (see backend/utils/loader.py)
+precision = os.getenv("MESHMIND_PRECISION", "fp32")
+
+# Compile the guided denoiser (CUDA graphs on GPU) and warm it up at startup
+compile_denoiser = os.getenv("MESHMIND_COMPILE_DENOISER", "0") == "1"
+
+# Classifier-free guidance sigma window, e.g. "0.3,20" (unset: guide at every step),
+# and how the scale ramps up across it: "constant", "linear" or "cosine"
+guidance_interval = tuple(
+    float(x) for x in os.getenv("MESHMIND_GUIDANCE_INTERVAL", "").split(",") if x.strip()
+) or None
+guidance_ramp = os.getenv("MESHMIND_GUIDANCE_RAMP", "constant")
+
+# Mesh decoding: SDF query memory budget and coarse-to-fine stride (0 samples densely)
+decode_memory_mb = float(os.getenv("MESHMIND_DECODE_MEMORY_MB", "512"))
+# Coarse-to-fine decoding is opt-in: it assumes a roughly exact SDF, so on
+# learned fields the mesh can differ slightly from dense extraction
+decode_coarse_stride = int(os.getenv("MESHMIND_DECODE_COARSE_STRIDE", "0")) or None
+# Distance from the surface, in coarse cell diagonals, within which it still
+# samples densely; raise it for meshes closer to dense extraction
+decode_coarse_band = float(os.getenv("MESHMIND_DECODE_COARSE_BAND", "1.0"))
+# Grid size of the quick preview mesh shown before the full decode (0 disables)
+preview_resolution = int(os.getenv("MESHMIND_PREVIEW_RESOLUTION", "40"))
+# Decode the denoised latent every this many sampling steps while sampling
+# runs, to show the shape emerging (0 disables live previews)
+live_preview_steps = int(os.getenv("MESHMIND_LIVE_PREVIEW_STEPS", "8"))
+# Grid size of those live previews, kept very coarse so they stay cheap
+live_preview_resolution = int(os.getenv("MESHMIND_LIVE_PREVIEW_RESOLUTION", "24"))
+# Compile the fused SDF/texture field MLPs used for mesh decoding
+compile_fields = os.getenv("MESHMIND_COMPILE_FIELDS", "0") == "1"
+# Cap on cached query grid positions and encodings shared across decodes
+grid_cache_mb = float(os.getenv("MESHMIND_GRID_CACHE_MB", "1024"))
+# Default DECIMATION_PRESETS entry (see backend/mesh_utils.py) for exports
+decimation = os.getenv("MESHMIND_DECIMATION", "balanced")
+# Mesh repair worker processes (0: repair in-process) and per-mesh time limit
+repair_workers = int(os.getenv("MESHMIND_REPAIR_WORKERS", "2"))
+repair_timeout_s = float(os.getenv("MESHMIND_REPAIR_TIMEOUT_S", "120"))
+# Also meshopt-compress GLB exports (EXT_meshopt_compression); about 3x smaller
+# again, but viewers need a meshopt decoder to open them
+glb_meshopt = os.getenv("MESHMIND_GLB_MESHOPT", "0") == "1"
+# Cap on download files encoded on demand and cached across sessions
+export_cache_mb = float(os.getenv("MESHMIND_EXPORT_CACHE_MB", "256"))
+
+# Request batching (see backend/scheduler.py)
+batch_window_ms = float(os.getenv("MESHMIND_BATCH_WINDOW_MS", "100"))
+max_batch_size = int(os.getenv("MESHMIND_MAX_BATCH_SIZE", "4"))
+# Wall-clock limit for one generation, sampling through export (0: none)
+generation_timeout_s = float(os.getenv("MESHMIND_GENERATION_TIMEOUT_S", "0"))
+
+# Sampled latent cache (see backend/latent_cache.py)
+latent_cache_dir = os.getenv("MESHMIND_LATENT_CACHE_DIR", os.path.join(os.getcwd(), "latent_cache"))
+latent_cache_max_mb = float(os.getenv("MESHMIND_LATENT_CACHE_MB", "512"))
+
 # Configure Gemini API
 api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
@@ -17,4 +70,29 @@ os.environ["GEMINI_API_KEY"] = api_key
 genai.configure(api_key=api_key)
 
 # Expose objects
-__all__ = ["device", "genai"]
+__all__ = [
+    "device",
+    "genai",
+    "precision",
+    "compile_denoiser",
+    "guidance_interval",
+    "guidance_ramp",
+    "decode_memory_mb",
+    "decode_coarse_stride",
+    "decode_coarse_band",
+    "preview_resolution",
+    "live_preview_steps",
+    "live_preview_resolution",
+    "grid_cache_mb",
+    "compile_fields",
+    "batch_window_ms",
+    "max_batch_size",
+    "generation_timeout_s",
+    "decimation",
+    "repair_workers",
+    "repair_timeout_s",
+    "glb_meshopt",
+    "export_cache_mb",
+    "latent_cache_dir",
+    "latent_cache_max_mb",
+]
@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from backend.config import export_cache_mb
+
+
+class ExportCache:
+    """
+    Size-bounded LRU cache of generated meshes encoded as download files,
+    shared by all sessions.
+
+    Sessions only keep the finished MeshArtifact. A format is encoded the
+    first time its download is requested, so switching back and forth between
+    formats does not encode again, while the least recently used files are
+    evicted once the total exceeds max_bytes rather than staying around with
+    idle sessions.
+
+    Args:
+        max_bytes (int): Total size of the cached files. Larger files are
+            encoded but never stored.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(len(data) for data in self._entries.values())
+
+    def get(self, mesh_id, mesh, format):
+        """
+        Returns the file for a mesh in a format, e.g. "glb", encoding it on a
+        miss.
+
+        Args:
+            mesh_id (str): Unique id of the mesh, e.g. of its history entry.
+            mesh (MeshArtifact): The mesh to encode.
+            format (str): One of EXPORT_FORMATS.
+        """
+        key = (mesh_id, format)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+
+        data = mesh.to_bytes(format)
+        with self._lock:
+            if len(data) <= self.max_bytes and key not in self._entries:
+                self._entries[key] = data
+                self._evict()
+        return data
+
+    def _evict(self):
+        total = sum(len(data) for data in self._entries.values())
+        while total > self.max_bytes and self._entries:
+            _, data = self._entries.popitem(last=False)
+            total -= len(data)
+
+
+@lru_cache()
+def get_export_cache():
+    return ExportCache(max_bytes=int(export_cache_mb * 1024**2))
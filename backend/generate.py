@@ -1,51 +1,272 @@
-from backend.utils.loader import get_models, load_diffusion_pipeline
+import secrets
+from concurrent.futures import Future, ThreadPoolExecutor
+from backend.utils.loader import get_models, load_diffusion_pipeline, warmup_denoisers
 from backend.utils.text import TextModel
 from backend.utils.diffuser import DiffusionModel
-from backend.config import device
+from backend.scheduler import BatchScheduler, GenerationRequest
+from backend.meshmind.models.stf.grid_cache import query_grid_cache
+from backend.meshmind.util.cancellation import CancellationToken
+from backend.config import device, batch_window_ms, max_batch_size, compile_denoiser, grid_cache_mb
+from backend.config import preview_resolution, generation_timeout_s, repair_workers
+from backend.config import precision as default_precision
+import streamlit as st
 import torch
 
-d_model, text_model, xm, diffusion = get_models(device)
+# Load the default model set up front so the first request doesn't wait
+get_models(device, default_precision)
+if compile_denoiser:
+    warmup_denoisers(device, default_precision)
+query_grid_cache().max_bytes = int(grid_cache_mb * 1024**2)
 #diffusion_p = load_diffusion_pipeline(device)
 
 torch.backends.cudnn.deterministic = True
 torch.backends.cudnn.benchmark = False
 
 
+def load_models(precision):
+    """
+    get_models() for a precision, with its compiled denoisers warmed up on
+    first use like those of the default precision at startup.
+    """
+    models = get_models(device, precision)
+    if compile_denoiser:
+        warmup_denoisers(device, precision)
+    return models
+
+
+def run_text_batch(requests):
+    """
+    Runs a group of compatible text requests as one sampling run.
+    """
+    first = requests[0]
+    _, text_model, xm, diffusion = load_models(first.precision)
+    text = TextModel(text_model, diffusion, xm)
+    return text.sample_batch(
+        [r.prompt for r in requests],
+        [r.seed for r in requests],
+        guidance_scales=[r.guidance_scale for r in requests],
+        karras_steps=first.steps,
+        sigma_min=first.sigma_min,
+        sigma_max=first.sigma_max,
+        sampler=first.sampler,
+        callbacks=[r.on_step for r in requests],
+        cancel_tokens=[r.cancel_token for r in requests]
+    )
+
+
+@st.cache_resource
+def get_text_scheduler():
+    """
+    One scheduler per server process, shared by all sessions.
+    """
+    return BatchScheduler(
+        run_text_batch, max_batch_size=max_batch_size, window_ms=batch_window_ms
+    )
+
+
+@st.cache_resource
+def get_decode_executor():
+    """
+    Background worker for full-resolution decoding, shared by all sessions.
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="meshmind-decode")
+
+
+@st.cache_resource
+def get_finish_executor():
+    """
+    Background workers for CPU-bound post-processing of decoded meshes
+    (decimation, repair and export), shared by all sessions. Kept apart from
+    the decode worker so that the next request's decode can use the GPU
+    meanwhile.
+    """
+    return ThreadPoolExecutor(
+        max_workers=max(repair_workers, 1), thread_name_prefix="meshmind-finish"
+    )
+
+
+def _then(future, fn, executor):
+    """
+    Returns a future for fn(future.result()), run on executor once future
+    has finished.
+    """
+    result = Future()
+
+    def copy_result(done):
+        if done.exception() is not None:
+            result.set_exception(done.exception())
+        else:
+            result.set_result(done.result())
+
+    def start(done):
+        if done.exception() is not None:
+            result.set_exception(done.exception())
+        else:
+            executor.submit(fn, done.result()).add_done_callback(copy_result)
+
+    future.add_done_callback(start)
+    return result
+
+
+@st.cache_resource
+def get_sampling_executor():
+    """
+    Background worker for image-conditioned sampling, shared by all sessions.
+    Text requests are sampled by the text scheduler instead.
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="meshmind-sample")
+
+
 class GenerateModel:
     def __init__(
         self,
         prompt,
         guidance_scale,
         num_inference_steps,
-        frame_size,
+        sigma_max,
         output_type,
         return_dict,
+        sampler=None,
+        seed=None,
+        precision=None,
+        resolution=None,
     ):
         self.prompt = prompt
         self.guidance_scale = guidance_scale
         self.steps = num_inference_steps
-        self.frame_size = frame_size
+        self.sigma_max = sigma_max
         self.output_type = output_type
         self.return_dict = return_dict
+        self.sampler = sampler
+        # A fresh seed per unseeded request, so it neither repeats the last
+        # mesh for the same prompt nor hits the latent cache
+        self.seed = seed if seed is not None else secrets.randbits(63)
+        # Weight precision: "fp32", "fp16" or "bf16"
+        self.precision = precision or default_precision
+        # Marching cubes grid size (None: the transmitter's default)
+        self.resolution = resolution
+        # Checked by sampling and decoding, see cancel()
+        self.cancel_token = CancellationToken(timeout=generation_timeout_s)
+
+    def cancel(self):
+        """
+        Stops this generation's sampling or decoding within one step, e.g.
+        once the user has abandoned it.
+        """
+        self.cancel_token.cancel()
 
     def text(self):
-        text = TextModel(text_model, diffusion, xm)
-        latents = text.generate(
-            self.prompt,
+        return self.decode(self.text_latent())
+
+    def text_latent(self, on_step=None):
+        """
+        Samples a latent for the prompt, batched with concurrent requests.
+        """
+        return self.submit_latent(on_step=on_step).result()
+
+    def submit_latent(self, diffusion=False, on_step=None):
+        """
+        Starts sampling a latent in the background.
+
+        Args:
+            diffusion (bool): Condition on an image generated from the prompt
+                instead of on the prompt itself.
+            on_step (callable): Optional step callback, e.g. a LivePreview.
+
+        Returns:
+            Future: Resolves to the latent, or raises Cancelled if on_step
+                or cancel() stopped sampling, or it ran past its deadline.
+        """
+        if diffusion:
+            return get_sampling_executor().submit(self.diffusion_latent, on_step)
+        request = GenerationRequest(
+            prompt=self.prompt,
+            seed=self.seed,
             guidance_scale=self.guidance_scale,
-            karras_steps=self.steps,
-            sigma_max=self.frame_size
+            steps=self.steps,
+            sigma_max=self.sigma_max,
+            sampler=self.sampler,
+            precision=self.precision,
+            on_step=on_step,
+            cancel_token=self.cancel_token,
+        )
+        return get_text_scheduler().submit(request)
+
+    def decode(self, latent, resolution=None):
+        """
+        Decodes a latent into a mesh, at self.resolution unless given.
+        """
+        _, text_model, xm, diffusion = load_models(self.precision)
+        return TextModel(text_model, diffusion, xm).decode(
+            latent, resolution or self.resolution, cancel_token=self.cancel_token
         )
 
-        return latents
+    def decode_progressive(self, latent, finish=None):
+        """
+        Decodes a coarse preview mesh right away, and the full-resolution
+        mesh on the background decode worker.
+
+        Args:
+            latent (torch.Tensor): Latent from text_latent() or diffusion_latent().
+            finish (callable): Optional post-processing, e.g. repair and
+                export, run on a separate worker so the decode worker is free
+                for the next request. Takes the full mesh and returns the
+                future's result.
+
+        Returns:
+            tuple: (preview mesh, or None if previews are disabled, Future)
+        """
+        preview = self.decode(latent, preview_resolution) if preview_resolution else None
+
+        full_mesh = get_decode_executor().submit(self.decode, latent)
+        if finish is not None:
+            full_mesh = _then(full_mesh, finish, get_finish_executor())
+        return preview, full_mesh
+
+    @staticmethod
+    def generate_batch(
+        prompts,
+        seeds,
+        guidance_scales,
+        num_inference_steps=None,
+        sigma_max=None,
+        sampler=None,
+        precision=None,
+        resolutions=None,
+    ):
+        """
+        Generates one mesh per text prompt in a single batched sampling run.
+        """
+        _, text_model, xm, diffusion = load_models(precision or default_precision)
+        text = TextModel(text_model, diffusion, xm)
+        return text.generate_batch(
+            prompts,
+            seeds,
+            guidance_scales=guidance_scales,
+            karras_steps=num_inference_steps,
+            sigma_max=sigma_max,
+            sampler=sampler,
+            resolutions=resolutions
+        )
 
     def diffusion(self):
+        return self.decode(self.diffusion_latent())
+
+    def diffusion_latent(self, on_step=None):
+        """
+        Samples a latent conditioned on an image generated from the prompt.
+        """
+        d_model, _, xm, diffusion = load_models(self.precision)
         diffuser = DiffusionModel(d_model, diffusion, xm)
         image = diffuser.gen_image(self.prompt, diffusion_p)
-        latents = diffuser.generate(
+        latent = diffuser.sample(
             guidance_scale=self.guidance_scale,
-            sigma_max=self.frame_size,
-            karras_steps=self.steps
+            sigma_max=self.sigma_max,
+            karras_steps=self.steps,
+            sampler=self.sampler,
+            seed=self.seed,
+            on_step=on_step,
+            cancel_token=self.cancel_token
         )
-        return latents
+        return latent
 
@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import threading
+from functools import lru_cache
+
+import numpy as np
+import torch
+
+from backend.config import latent_cache_dir, latent_cache_max_mb
+from backend.meshmind.models.download import MODEL_PATHS, URL_HASHES
+
+
+def latent_cache_key(checkpoint, **settings):
+    """
+    Content address for a sampled latent.
+
+    Args:
+        checkpoint (str): Model name in MODEL_PATHS, e.g. "text_model".
+        **settings: Everything else that determines the latent (prompt or
+            image hash, seed, guidance scale, sigma schedule, sampler...).
+    """
+    fields = dict(checkpoint=URL_HASHES[MODEL_PATHS[checkpoint]], **settings)
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+class LatentCache:
+    """
+    On-disk cache of [d_latent] latents stored as fp16 .npy files, evicting
+    the least recently used entries once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key, device):
+        """
+        Returns the cached latent as a float32 tensor on device, or None.
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                latent = np.load(path)
+            except (FileNotFoundError, ValueError):
+                return None
+            # Mark as recently used
+            os.utime(path)
+        return torch.from_numpy(latent).to(device=device, dtype=torch.float32)
+
+    def put(self, key, latent):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "wb") as f:
+                np.save(f, latent.detach().to(torch.float16).cpu().numpy())
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+@lru_cache()
+def get_latent_cache():
+    return LatentCache(latent_cache_dir, max_bytes=int(latent_cache_max_mb * 1024**2))
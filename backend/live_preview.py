@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+class LivePreview:
+    """
+    Sampling step callback that decodes the current denoised latent into a
+    very coarse mesh every few steps, so the UI can show the shape emerging
+    and let the user stop a bad generation early.
+
+    Decoding runs on a worker thread (and its own CUDA stream) so sampling
+    never waits for it. A step arriving while the previous preview is still
+    decoding is skipped.
+
+    Args:
+        decode (callable): Takes a latent and a grid size, returns a mesh.
+        resolution (int): Grid size of the preview meshes.
+        every (int): Decode a preview every this many sampling steps. 0
+            decodes none, leaving only the ability to cancel.
+    """
+
+    def __init__(self, decode, resolution, every):
+        self.decode = decode
+        self.resolution = resolution
+        self.every = every
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meshmind-preview")
+        self._stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._latest = None
+        self._version = 0
+        self._polled = 0
+        self._step = None
+        self._cancelled = threading.Event()
+
+    def __call__(self, step, total, latent):
+        """
+        Called by the sampler after every step with the step index, the
+        number of steps and the denoised latent. Returns False once the
+        preview was cancelled, which stops sampling.
+        """
+        if self._cancelled.is_set():
+            return False
+        self._step = (step, total)
+        busy = self._pending is not None and not self._pending.done()
+        if self.every and step % self.every == 0 and not busy:
+            latent = latent.detach().clone()
+            event = None
+            if latent.is_cuda:
+                event = torch.cuda.Event()
+                event.record()
+            try:
+                self._pending = self._executor.submit(self._decode, step, total, latent, event)
+            except RuntimeError:
+                # Closed from the UI thread since the check above
+                return False
+        return True
+
+    def _decode(self, step, total, latent, event):
+        with torch.no_grad():
+            if event is None:
+                mesh = self.decode(latent, self.resolution)
+            else:
+                with torch.cuda.stream(self._stream):
+                    self._stream.wait_event(event)
+                    mesh = self.decode(latent, self.resolution)
+                self._stream.synchronize()
+        with self._lock:
+            self._latest = (step, total, mesh)
+            self._version += 1
+
+    @property
+    def progress(self):
+        """
+        (step, total) of the last sampling step seen, or None before the first.
+        """
+        return self._step
+
+    def poll(self):
+        """
+        Returns (step, total, mesh) for a preview finished since the last
+        poll, or None.
+        """
+        with self._lock:
+            if self._version == self._polled:
+                return None
+            self._polled = self._version
+            return self._latest
+
+    def cancel(self):
+        """
+        Stops sampling at the next step.
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def close(self):
+        """
+        Cancels sampling, if still running, and frees the decode worker.
+        """
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,71 +1,542 @@
+import io
+import os
+
 import numpy as np
 import trimesh
-import pymeshfix
+import torch
+from scipy import sparse, spatial
+
+from backend.config import glb_meshopt, repair_timeout_s, repair_workers
+from backend.meshmind.rendering.gltf import write_glb
+from backend.meshmind.rendering.mesh import write_obj, write_stl
+from backend.meshmind.rendering.ply_util import write_ply
+from backend.meshmind.util.cancellation import check_cancelled
+from backend.repair_pool import RepairPool
+
+# Presets for decimate_mesh(). Decimation never collapses an edge whose
+# quadric error exceeds max_error, given relative to the bounding box
+# diagonal, and collapses every edge below it, also once the mesh is down to
+# target_faces. Looser presets therefore never leave more faces than tighter
+# ones. None keeps the marching cubes mesh as is.
+DECIMATION_PRESETS = {
+    "off": None,
+    "lossless": dict(target_faces=None, max_error=1e-4),
+    "balanced": dict(target_faces=50_000, max_error=2e-3),
+    "light": dict(target_faces=15_000, max_error=5e-3),
+}
+
+# Download formats offered for generated meshes, see MeshArtifact.to_bytes()
+EXPORT_FORMATS = ("obj", "ply", "stl", "glb")
+
+
+_REPAIR_POOL = None
+
+
+def get_repair_pool():
+    """
+    The process-wide pool that repair_mesh() runs PyMeshFix in.
+    """
+    global _REPAIR_POOL
+    if _REPAIR_POOL is None:
+        _REPAIR_POOL = RepairPool(repair_workers, timeout=repair_timeout_s or None)
+    return _REPAIR_POOL
+
+
+class MeshArtifact:
+    """
+    A decoded mesh in host memory, shared by the viewer, decimation, repair
+    and exporters so that it is copied off the device only once.
+
+    The arrays are handed out as is by trimesh(), pyvista() and export(), so
+    treat them as read-only.
+
+    Args:
+        vertices (np.ndarray): [N x 3] float64 vertex positions (float32
+            after compact()).
+        faces (np.ndarray): [M x 3] int64 triangles (int32 after compact()).
+        colors (np.ndarray): Optional [N x 4] uint8 RGBA vertex colors.
+    """
+
+    def __init__(self, vertices, faces, colors=None):
+        self.vertices = vertices
+        self.faces = faces
+        self.colors = colors
+        self._trimesh = None
+
+    @classmethod
+    def from_decoder_output(cls, decoder_output):
+        """
+        Converts a Shap-E MeshDecoderOutput (TorchMesh), keeping its RGB
+        vertex channels as colors. CUDA tensors are copied into pinned host
+        buffers with non-blocking copies and a single synchronization.
+        """
+        verts = getattr(decoder_output, "verts", None)
+        faces = getattr(decoder_output, "faces", None)
+
+        if verts is None or faces is None:
+            raise ValueError("Decoder output missing verts/faces attributes.")
+
+        # Handle Shap-E [N,4] face format
+        if faces.shape[1] == 4:
+            faces = faces[:, 1:]
+
+        channels = getattr(decoder_output, "vertex_channels", None) or {}
+        rgb = None
+        if all(name in channels for name in "RGB"):
+            rgb = [channels[name] for name in "RGB"]
+
+        if not isinstance(verts, torch.Tensor):
+            colors = None
+            if rgb is not None:
+                colors = _pack_colors(np.stack([np.asarray(ch) for ch in rgb], axis=1))
+            return cls(
+                np.asarray(verts, dtype=np.float64), np.asarray(faces, dtype=np.int64), colors
+            )
+
+        colors = None
+        if rgb is not None:
+            # Pack on the device, so only 4 bytes per vertex are transferred
+            colors = torch.stack(rgb, dim=1).clamp(0, 1).mul(255).round().to(torch.uint8)
+            colors = torch.cat([colors, torch.full_like(colors[:, :1], 255)], dim=1)
+        return cls(*_to_host(verts.double(), faces.long(), colors))
+
+    def trimesh(self):
+        """
+        A trimesh.Trimesh view of the arrays, created once.
+        """
+        if self._trimesh is None:
+            self._trimesh = trimesh.Trimesh(
+                vertices=self.vertices,
+                faces=self.faces,
+                vertex_colors=self.colors,
+                process=False,
+            )
+        return self._trimesh
+
+    def pyvista(self):
+        """
+        A pyvista.PolyData for the viewer, with RGB colors as "colors" point
+        data if there are any.
+        """
+        import pyvista as pv
+
+        mesh = pv.PolyData.from_regular_faces(self.vertices, self.faces)
+        if self.colors is not None:
+            mesh.point_data["colors"] = self.colors[:, :3]
+        return mesh
+
+    def export(self, file_path):
+        """
+        Writes the mesh, in the format given by the file extension. PLY, STL,
+        OBJ and GLB go through the vectorized writers, other formats through
+        trimesh.
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        writer = _WRITERS.get(extension)
+        if writer is None:
+            self.trimesh().export(file_path)
+            return
+        with open(file_path, "wb") as f:
+            writer(self, f)
+
+    def to_bytes(self, format):
+        """
+        Encodes the mesh as a file of the given format, e.g. "glb", in memory.
+        """
+        writer = _WRITERS.get("." + format.lower())
+        if writer is None:
+            return self.trimesh().export(file_type=format)
+        f = io.BytesIO()
+        writer(self, f)
+        return f.getvalue()
+
+    def compact(self):
+        """
+        A copy with float32 vertices and int32 faces, about half the size, for
+        keeping a finished mesh around to export on demand. Every format but
+        OBJ stores float32 positions anyway.
+        """
+        return MeshArtifact(
+            self.vertices.astype(np.float32), self.faces.astype(np.int32), self.colors
+        )
+
+    @property
+    def is_empty(self):
+        return len(self.faces) == 0
+
+
+def _write_ply(mesh, f):
+    rgb = None if mesh.colors is None else mesh.colors[:, :3]
+    write_ply(f, coords=mesh.vertices, rgb=rgb, faces=mesh.faces)
+
+
+def _write_obj(mesh, f):
+    rgb = None if mesh.colors is None else mesh.colors[:, :3] / 255.0
+    write_obj(f, coords=mesh.vertices, faces=mesh.faces, rgb=rgb)
+
+
+def _write_stl(mesh, f):
+    write_stl(f, coords=mesh.vertices, faces=mesh.faces)
+
+
+def _write_glb(mesh, f):
+    rgb = None if mesh.colors is None else mesh.colors[:, :3]
+    write_glb(f, coords=mesh.vertices, faces=mesh.faces, rgb=rgb, compress=glb_meshopt)
+
+
+_WRITERS = {".ply": _write_ply, ".obj": _write_obj, ".stl": _write_stl, ".glb": _write_glb}
+
+
+def _pack_colors(rgb):
+    """
+    Converts [N x 3] colors in [0, 1] to [N x 4] uint8 RGBA.
+    """
+    colors = np.full((len(rgb), 4), 255, dtype=np.uint8)
+    colors[:, :3] = np.round(np.clip(rgb, 0, 1) * 255)
+    return colors
+
+
+def _to_host(*tensors):
+    """
+    Copies tensors (or None) to numpy arrays. CUDA tensors go through pinned
+    buffers with non-blocking copies, followed by one synchronization.
+    """
+    hosts = []
+    for tensor in tensors:
+        if tensor is not None:
+            tensor = tensor.detach()
+            if tensor.is_cuda:
+                host = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+                host.copy_(tensor, non_blocking=True)
+                tensor = host
+        hosts.append(tensor)
+    if any(t is not None and t.is_cuda for t in tensors):
+        torch.cuda.current_stream().synchronize()
+    return [None if t is None else t.numpy() for t in hosts]
 
 
 def build_trimesh(decoder_output):
     """
     Converts Shap-E MeshDecoderOutput into a trimesh.Trimesh object.
-    Handles tensor → numpy conversions safely.
     """
-    verts = getattr(decoder_output, "verts", None)
-    faces = getattr(decoder_output, "faces", None)
+    return MeshArtifact.from_decoder_output(decoder_output).trimesh()
 
-    if verts is None or faces is None:
-        raise ValueError("Decoder output missing verts/faces attributes.")
 
-    # Convert to numpy
-    verts_np = verts.cpu().numpy() if hasattr(verts, "cpu") else np.asarray(verts)
-    faces_np = faces.cpu().numpy() if hasattr(faces, "cpu") else np.asarray(faces)
+def decimate_mesh(mesh, target_faces=None, max_error=None, max_passes=100, cancel_token=None):
+    """
+    Simplifies a mesh by quadric edge collapse, interpolating vertex colors
+    along the collapsed edges.
+
+    Each pass collapses a batch of the cheapest edges at once, choosing them
+    so that no triangle is touched by two collapses. Edges on open borders,
+    collapses that would make the mesh non-manifold and collapses that would
+    flip a triangle are skipped.
+
+    Args:
+        mesh (MeshArtifact): Mesh to simplify; it is left unchanged.
+        target_faces (int): Face count to collapse down to. Without
+            max_error decimation stops there; with it, decimation carries on
+            below target_faces as long as max_error allows.
+        max_error (float): Never move the surface further than about this
+            distance, relative to the bounding box diagonal.
+        max_passes (int): Upper bound on the number of collapse passes.
+        cancel_token (CancellationToken): Optional token checked every pass.
+
+    Returns:
+        MeshArtifact: The simplified mesh, or mesh itself if there was
+            nothing to do.
+    """
+    if target_faces is None and max_error is None:
+        return mesh
+    if len(mesh.faces) == 0:
+        return mesh
+    if max_error is None and len(mesh.faces) <= target_faces:
+        return mesh
+
+    verts = np.array(mesh.vertices, dtype=np.float64)
+    faces = np.array(mesh.faces, dtype=np.int64)
+    colors = None if mesh.colors is None else mesh.colors.astype(np.float64)
 
-    # Handle Shap-E [N,4] face format
-    if faces_np.shape[1] == 4:
-        faces_np = faces_np[:, 1:]
+    if max_error is None:
+        max_cost = np.inf
+    else:
+        max_cost = (max_error * np.linalg.norm(np.ptp(verts, axis=0))) ** 2
+    quadrics = _vertex_quadrics(verts, faces)
 
-    return trimesh.Trimesh(vertices=verts_np, faces=faces_np.astype(np.int64), process=False)
+    for _ in range(max_passes):
+        check_cancelled(cancel_token)
+        budget = np.inf
+        if target_faces is not None and len(faces) > target_faces:
+            # Interior collapses remove two faces each
+            budget = (len(faces) - target_faces + 1) // 2
+        elif max_error is None:
+            break
+        collapses = _select_collapses(verts, faces, quadrics, max_cost, budget)
+        if collapses is None:
+            break
 
-def save_mesh_as(decoder_output, file_path):
+        keep, remove, positions, t = collapses
+        verts[keep] = positions
+        quadrics[keep] += quadrics[remove]
+        if colors is not None:
+            colors[keep] += (colors[remove] - colors[keep]) * t[:, None]
+        remap = np.arange(len(verts))
+        remap[remove] = keep
+        faces = remap[faces]
+        faces = faces[
+            (faces[:, 0] != faces[:, 1])
+            & (faces[:, 1] != faces[:, 2])
+            & (faces[:, 2] != faces[:, 0])
+        ]
+
+    # Drop the vertices collapsed away
+    used = np.unique(faces)
+    remap = np.full(len(verts), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    return MeshArtifact(
+        verts[used],
+        remap[faces],
+        None if colors is None else np.round(colors[used]).astype(np.uint8),
+    )
+
+
+# Rounds of edge selection per decimation pass, see _select_collapses()
+_SELECTION_ROUNDS = 8
+
+
+def _vertex_quadrics(verts, faces):
+    """
+    Sum of the [4 x 4] plane quadrics of the faces around each vertex.
+    """
+    tri = verts[faces]
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+    planes = np.concatenate([normals, -(normals * tri[:, 0]).sum(1, keepdims=True)], axis=1)
+    face_quadrics = (planes[:, :, None] * planes[:, None, :]).reshape(-1, 16)
+    return (_incidence(faces, len(verts)) @ face_quadrics).reshape(-1, 4, 4)
+
+
+def _incidence(faces, num_verts):
+    """
+    Sparse [num_verts x num_faces] vertex-face incidence matrix.
+    """
+    return sparse.csr_matrix(
+        (
+            np.ones(faces.size),
+            (faces.ravel(), np.repeat(np.arange(len(faces)), 3)),
+        ),
+        shape=(num_verts, len(faces)),
+    )
+
+
+def _select_collapses(verts, faces, quadrics, max_cost, budget):
+    """
+    Picks a batch of edges that can be collapsed at the same time.
+
+    Returns:
+        tuple: (kept vertex, removed vertex, new position of the kept vertex,
+            color interpolation weight of the removed vertex) per edge, or
+            None if no edge can be collapsed.
+    """
+    num_verts = len(verts)
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    # Unique on scalar keys is much faster than on rows
+    keys, edge_faces = np.unique(edges[:, 0] * num_verts + edges[:, 1], return_counts=True)
+    edges = np.stack([keys // num_verts, keys % num_verts], axis=1)
+
+    # Lock the vertices on open borders or non-manifold edges
+    locked = np.zeros(num_verts, dtype=bool)
+    locked[edges[edge_faces != 2].ravel()] = True
+    edges = edges[~locked[edges].any(axis=1)]
+    if not len(edges):
+        return None
+
+    # Link condition: the endpoints share exactly the two opposite vertices
+    incidence = _incidence(faces, num_verts)
+    neighbors = (incidence @ incidence.T).astype(bool).tocsr()
+    neighbors.setdiag(False)
+    neighbors.eliminate_zeros()
+    shared = np.asarray(neighbors[edges[:, 0]].multiply(neighbors[edges[:, 1]]).sum(axis=1))
+    edges = edges[shared[:, 0] == 2]
+    if not len(edges):
+        return None
+
+    # Best of the endpoints, the midpoint and the quadric optimum
+    a, b = edges[:, 0], edges[:, 1]
+    q = quadrics[a] + quadrics[b]
+    candidates = [verts[a], verts[b], (verts[a] + verts[b]) / 2]
+    det = np.linalg.det(q[:, :3, :3])
+    solvable = np.abs(det) > 1e-12
+    optimum = candidates[2].copy()
+    optimum[solvable] = np.linalg.solve(q[solvable, :3, :3], -q[solvable, :3, 3:])[..., 0]
+    # Quadric optima can land far away from the edge on nearly flat patches
+    edge_length = np.linalg.norm(verts[b] - verts[a], axis=1)
+    far = np.linalg.norm(optimum - candidates[2], axis=1) > edge_length
+    optimum[far] = candidates[2][far]
+    candidates = np.stack(candidates + [optimum], axis=1)
+    homogeneous = np.concatenate([candidates, np.ones((*candidates.shape[:2], 1))], axis=2)
+    costs = ((homogeneous @ q) * homogeneous).sum(axis=2)
+    best = costs.argmin(axis=1)
+    cost = np.maximum(costs[np.arange(len(edges)), best], 0)
+    positions = candidates[np.arange(len(edges)), best]
+
+    eligible = cost <= max_cost
+    if not eligible.any():
+        return None
+    a, b, cost, positions = a[eligible], b[eligible], cost[eligible], positions[eligible]
+
+    # Keep an edge only if it is the cheapest one touching every face around
+    # its endpoints, so that each face is changed by at most one collapse.
+    # Later rounds fill in edges away from the faces claimed so far.
+    rank = np.empty(len(cost), dtype=np.int64)
+    rank[np.argsort(cost, kind="stable")] = np.arange(len(cost))
+    selected = np.zeros(len(cost), dtype=bool)
+    candidate = np.ones(len(cost), dtype=bool)
+    for _ in range(_SELECTION_ROUNDS):
+        vertex_rank = np.full(num_verts, len(cost), dtype=np.int64)
+        np.minimum.at(vertex_rank, a[candidate], rank[candidate])
+        np.minimum.at(vertex_rank, b[candidate], rank[candidate])
+        face_rank = vertex_rank[faces].min(axis=1)
+        vertex_win = np.full(num_verts, len(cost), dtype=np.int64)
+        np.minimum.at(vertex_win, faces.ravel(), np.repeat(face_rank, 3))
+        winners = candidate & (vertex_win[a] == rank) & (vertex_win[b] == rank)
+        if not winners.any():
+            break
+        selected |= winners
+
+        # Drop candidates touching a face around a selected edge
+        blocked = np.zeros(num_verts, dtype=bool)
+        blocked[a[selected]] = True
+        blocked[b[selected]] = True
+        blocked[faces[blocked[faces].any(axis=1)].ravel()] = True
+        candidate &= ~blocked[a] & ~blocked[b]
+        if not candidate.any():
+            break
+
+    # Skip collapses that would flip one of the faces they move
+    owner = np.full(num_verts, -1, dtype=np.int64)
+    owner[a[selected]] = np.flatnonzero(selected)
+    owner[b[selected]] = np.flatnonzero(selected)
+    face_owner = owner[faces].max(axis=1)
+    moved = face_owner >= 0
+    moved_faces = faces[moved]
+    moved_owner = face_owner[moved]
+    in_a = moved_faces == a[moved_owner, None]
+    in_b = moved_faces == b[moved_owner, None]
+    survives = (in_a | in_b).sum(axis=1) == 1
+    old_tri = verts[moved_faces]
+    new_tri = np.where((in_a | in_b)[..., None], positions[moved_owner, None], old_tri)
+    old_normals = np.cross(old_tri[:, 1] - old_tri[:, 0], old_tri[:, 2] - old_tri[:, 0])
+    new_normals = np.cross(new_tri[:, 1] - new_tri[:, 0], new_tri[:, 2] - new_tri[:, 0])
+    alignment = (old_normals * new_normals).sum(axis=1) / np.maximum(
+        np.linalg.norm(old_normals, axis=1) * np.linalg.norm(new_normals, axis=1), 1e-24
+    )
+    flips = moved_owner[survives & (alignment < 0.2)]
+    selected[flips] = False
+
+    order = np.flatnonzero(selected)
+    order = order[np.argsort(rank[order], kind="stable")]
+    if np.isfinite(budget):
+        order = order[: int(budget)]
+    if not len(order):
+        return None
+
+    a, b, positions = a[order], b[order], positions[order]
+    ab = verts[b] - verts[a]
+    t = np.clip(
+        ((positions - verts[a]) * ab).sum(axis=1) / np.maximum((ab * ab).sum(axis=1), 1e-24), 0, 1
+    )
+    return a, b, positions, t
+
+def save_mesh_as(decoder_output, file_path, decimation="off", cancel_token=None):
     """
     Saves a Shap-E MeshDecoderOutput to .obj file.
+
+    Args:
+        decimation (str): Name of a DECIMATION_PRESETS entry to simplify the
+            mesh with before repair and export.
     """
-    mesh = build_trimesh(decoder_output)
-    repair_mesh(mesh, file_path)
+    finalize_mesh(decoder_output, file_path, decimation, cancel_token=cancel_token)
     return file_path
 
 
-def repair_mesh(mesh, output_path, verbose=True):
+def finalize_mesh(decoder_output, file_path=None, decimation="off", cancel_token=None):
+    """
+    Simplifies, repairs and optionally exports a decoded mesh, and returns the
+    repaired MeshArtifact. Safe to run on a background worker.
+
+    Args:
+        file_path (str): Where to save the mesh, or None to leave exporting
+            to the caller, e.g. on demand through an ExportCache.
+        decimation (str): Name of a DECIMATION_PRESETS entry.
+        cancel_token (CancellationToken): Optional token checked before
+            decimation, between its passes and before repair and export.
+    """
+    check_cancelled(cancel_token)
+    mesh = MeshArtifact.from_decoder_output(decoder_output)
+    mesh = simplify_mesh(mesh, decimation, cancel_token=cancel_token)
+    return repair_mesh(mesh, file_path, cancel_token=cancel_token)
+
+
+def simplify_mesh(mesh, decimation, cancel_token=None):
+    """
+    Applies a DECIMATION_PRESETS entry, by name, to a MeshArtifact.
+    """
+    preset = DECIMATION_PRESETS[decimation]
+    if preset is None:
+        return mesh
+    num_faces = len(mesh.faces)
+    mesh = decimate_mesh(mesh, **preset, cancel_token=cancel_token)
+    print(f"Decimated mesh ({decimation}): {num_faces} -> {len(mesh.faces)} faces")
+    return mesh
+
+
+def repair_mesh(mesh, output_path=None, verbose=True, cancel_token=None):
     """
     Repair a mesh using PyMeshFix.
     - Fills holes
     - Fixes non-manifold edges
     - Outputs repaired mesh as OBJ (default) or same as input extension
+    - Falls back to the unrepaired mesh if repair fails or times out
     
     Args:
-        input_path (str): Path to input mesh (.obj, .stl, etc.)
-        output_path (str): Path to save repaired mesh. Defaults to input_path + '_repaired.obj'
+        mesh (MeshArtifact): Mesh to repair.
+        output_path (str): Path to save the repaired mesh to, or None.
         verbose (bool): Print stats before and after
+        cancel_token (CancellationToken): Optional token checked before
+            saving the repaired mesh.
+
+    Returns:
+        MeshArtifact: The repaired (or, failing that, the input) mesh.
     """
     if mesh.is_empty:
         raise ValueError("Mesh is empty or invalid.")
 
     if verbose:
         print(f"Loaded mesh: {len(mesh.vertices)} vertices, {len(mesh.faces)} faces")
-    
-    # Extract vertices and faces
-    vertices = mesh.vertices
-    faces = mesh.faces
-
-    # Repair using PyMeshFix
-    meshfix = pymeshfix.MeshFix(vertices, faces)
-    meshfix.repair(verbose=verbose)  # fixes holes, non-manifold edges
 
-    # Reconstruct repaired mesh
-    repaired_mesh = trimesh.Trimesh(vertices=meshfix.v, faces=meshfix.f, process=False)
+    # Repair using PyMeshFix, in a worker process
+    repaired = get_repair_pool().repair(mesh.vertices, mesh.faces, verbose=verbose)
+    if repaired is None:
+        print("Exporting the unrepaired mesh instead")
+        repaired_mesh = mesh
+    else:
+        vertices, faces = repaired
+        # Carry vertex colors over from the nearest original vertex, since
+        # repair may add or move vertices
+        colors = None
+        if mesh.colors is not None:
+            _, nearest = spatial.cKDTree(mesh.vertices).query(vertices)
+            colors = mesh.colors[nearest]
+        repaired_mesh = MeshArtifact(vertices, faces, colors)
 
     if verbose:
         print(f"Repaired mesh: {len(repaired_mesh.vertices)} vertices, {len(repaired_mesh.faces)} faces")
 
     # Save repaired mesh
-    repaired_mesh.export(output_path)
-    if verbose:
-        print(f"Saved repaired mesh to: {output_path}")
+    check_cancelled(cancel_token)
+    if output_path is not None:
+        repaired_mesh.export(output_path)
+        if verbose:
+            print(f"Saved repaired mesh to: {output_path}")
+    return repaired_mesh
@@ -22,9 +22,15 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import math
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
 import numpy as np
 import torch as th
 
+from ..util.cancellation import Cancelled, check_cancelled
 from .gaussian_diffusion import GaussianDiffusion, mean_flat
 
 
@@ -85,6 +91,7 @@ class GaussianToKarrasDenoiser:
         self.alpha_cumprod_to_t = interpolate.interp1d(
             diffusion.alphas_cumprod, np.arange(0, diffusion.num_timesteps)
         )
+        self._device_tables = {}
 
     def sigma_to_t(self, sigma):
         alpha_cumprod = 1.0 / (sigma**2 + 1)
@@ -95,22 +102,180 @@ class GaussianToKarrasDenoiser:
         else:
             return float(self.alpha_cumprod_to_t(alpha_cumprod))
 
+    def sigmas_to_t(self, sigmas):
+        """
+        A vectorized sigma_to_t() which stays on the device of sigmas, rather
+        than forcing a host sync on every denoiser call.
+        """
+        tables = self.tables(sigmas.device)
+        alphas_cumprod = tables["alphas_cumprod_ascending"]
+        num_timesteps = len(alphas_cumprod)
+        alpha_cumprod = (1.0 / (sigmas**2 + 1)).double()
+
+        # Same linear interpolation as scipy's interp1d.
+        hi = th.searchsorted(alphas_cumprod, alpha_cumprod).clamp(1, num_timesteps - 1)
+        lo = hi - 1
+        x_lo, x_hi = alphas_cumprod[lo], alphas_cumprod[hi]
+        y_lo, y_hi = (num_timesteps - 1 - lo).double(), (num_timesteps - 1 - hi).double()
+        t = (y_hi - y_lo) / (x_hi - x_lo) * (alpha_cumprod - x_lo) + y_lo
+
+        t = th.where(alpha_cumprod <= alphas_cumprod[0], num_timesteps - 1, t)
+        t = th.where(alpha_cumprod > alphas_cumprod[-1], 0, t)
+        return t.long()
+
+    def tables(self, device):
+        """
+        Get the diffusion schedule as tensors on a device, built once per
+        device.
+        """
+        device = th.device(device)
+        if device not in self._device_tables:
+            diffusion = self.diffusion
+            timestep_map = getattr(diffusion, "timestep_map", None)
+            self._device_tables[device] = dict(
+                alphas_cumprod_ascending=th.tensor(
+                    diffusion.alphas_cumprod[::-1].copy(), device=device
+                ),
+                sqrt_recip_alphas_cumprod=th.tensor(
+                    diffusion.sqrt_recip_alphas_cumprod, device=device
+                ).float(),
+                sqrt_recipm1_alphas_cumprod=th.tensor(
+                    diffusion.sqrt_recipm1_alphas_cumprod, device=device
+                ).float(),
+                timestep_map=None
+                if timestep_map is None
+                else th.tensor(timestep_map, dtype=th.long, device=device),
+            )
+        return self._device_tables[device]
+
     def denoise(self, x_t, sigmas, clip_denoised=True, model_kwargs=None):
-        t = th.tensor(
-            [self.sigma_to_t(sigma) for sigma in sigmas.cpu().numpy()],
-            dtype=th.long,
-            device=sigmas.device,
-        )
+        t = self.sigmas_to_t(sigmas)
         c_in = append_dims(1.0 / (sigmas**2 + 1) ** 0.5, x_t.ndim)
+        if self.diffusion.model_mean_type == "epsilon":
+            return None, self._predict_xstart_from_eps(
+                x_t * c_in, t, clip_denoised=clip_denoised, model_kwargs=model_kwargs
+            )
         out = self.diffusion.p_mean_variance(
             self.model, x_t * c_in, t, clip_denoised=clip_denoised, model_kwargs=model_kwargs
         )
         return None, out["pred_xstart"]
 
+    def _predict_xstart_from_eps(self, x, t, clip_denoised=True, model_kwargs=None):
+        """
+        The pred_xstart of diffusion.p_mean_variance() for an epsilon model,
+        using the on-device tables and skipping the unused variance terms.
+        """
+        tables = self.tables(x.device)
+        model_t = t if tables["timestep_map"] is None else tables["timestep_map"][t]
+        model_output = self.model(x, model_t, **(model_kwargs or {}))
+        if isinstance(model_output, tuple):
+            model_output, _ = model_output
+        if self.diffusion.model_var_type in ["learned", "learned_range"]:
+            model_output, _ = th.split(model_output, x.shape[1], dim=1)
+        pred_xstart = (
+            append_dims(tables["sqrt_recip_alphas_cumprod"][t], x.ndim) * x
+            - append_dims(tables["sqrt_recipm1_alphas_cumprod"][t], x.ndim) * model_output
+        )
+        if clip_denoised:
+            pred_xstart = pred_xstart.clamp(-1, 1)
+        return pred_xstart
+
+
+class CompiledGuidedDenoiser:
+    """
+    A GaussianToKarrasDenoiser, optionally with classifier-free guidance,
+    compiled as a single torch.compile region. On CUDA the region is
+    captured as a CUDA graph, which is replayed for every call with the
+    same batch shape.
+
+    Use compiled_guided_denoiser() to get one, so that the compiled graphs
+    are reused across sampling runs.
+    """
+
+    def __init__(self, model, diffusion: GaussianDiffusion, clip_denoised: bool):
+        self.denoiser = GaussianToKarrasDenoiser(model, diffusion)
+        self.clip_denoised = clip_denoised
+        self._compiled = {}
+
+    def __call__(self, x_t, sigma, guidance_scale=None, model_kwargs=None):
+        """
+        :param guidance_scale: None for no guidance, or a tensor broadcasting
+                               against x_t. Scales are tensors so that one
+                               graph serves all of them.
+        """
+        device_type = x_t.device.type
+        if device_type not in self._compiled:
+            self._compiled[device_type] = th.compile(
+                self._denoise,
+                mode="reduce-overhead" if device_type == "cuda" else "default",
+                dynamic=False,
+            )
+        if device_type == "cuda":
+            th.compiler.cudagraph_mark_step_begin()
+        x_0 = self._compiled[device_type](x_t, sigma, guidance_scale, model_kwargs or {})
+        # CUDA graph outputs are overwritten by the next replay, but samplers
+        # hold on to previous denoiser outputs.
+        return x_0.clone()
+
+    def _denoise(self, x_t, sigma, guidance_scale, model_kwargs):
+        if guidance_scale is None:
+            _, x_0 = self.denoiser.denoise(
+                x_t, sigma, clip_denoised=self.clip_denoised, model_kwargs=model_kwargs
+            )
+            return x_0
+        x_t = th.cat([x_t, x_t], dim=0)
+        sigma = th.cat([sigma, sigma], dim=0)
+        _, x_0 = self.denoiser.denoise(
+            x_t, sigma, clip_denoised=self.clip_denoised, model_kwargs=model_kwargs
+        )
+        cond_x_0, uncond_x_0 = th.split(x_0, len(x_0) // 2, dim=0)
+        return uncond_x_0 + guidance_scale * (cond_x_0 - uncond_x_0)
+
+
+_COMPILED_DENOISERS_LOCK = threading.Lock()
+
+
+def compiled_guided_denoiser(
+    model, diffusion: GaussianDiffusion, clip_denoised: bool
+) -> CompiledGuidedDenoiser:
+    """
+    Get the CompiledGuidedDenoiser for a model, creating it on first use.
 
-def karras_sample(*args, **kwargs):
+    Denoisers are stored on the model itself rather than in a global cache,
+    so their compiled graphs (and CUDA graph memory pools) are freed together
+    with the model instead of keeping it alive.
+    """
+    with _COMPILED_DENOISERS_LOCK:
+        denoisers = model.__dict__.setdefault("_compiled_guided_denoisers", {})
+        key = (diffusion, clip_denoised)
+        if key not in denoisers:
+            denoisers[key] = CompiledGuidedDenoiser(model, diffusion, clip_denoised)
+        return denoisers[key]
+
+
+class SamplingCancelled(Cancelled):
+    """
+    Raised by karras_sample() when its callback asks to stop sampling.
+    """
+
+
+def karras_sample(
+    *args,
+    callback: Optional[Callable[[Dict[str, Any]], Optional[bool]]] = None,
+    callback_steps: int = 1,
+    **kwargs,
+):
+    """
+    :param callback: if specified, called every callback_steps steps with the
+                     step's output, a dict with the step index "i", the
+                     current sample "x" and its denoised "pred_xstart". If it
+                     returns False, sampling stops with SamplingCancelled.
+    """
     last = None
     for x in karras_sample_progressive(*args, **kwargs):
+        if callback is not None and "i" in x and x["i"] % callback_steps == 0:
+            if callback(x) is False:
+                raise SamplingCancelled(f"sampling cancelled at step {x['i']}")
         last = x["x"]
     return last
 
@@ -133,21 +298,99 @@ def karras_sample_progressive(
     s_tmax=float("inf"),
     s_noise=1.0,
     guidance_scale=0.0,
+    generators=None,
+    compile_denoiser=False,
+    guidance_schedule=None,
+    cancel_token=None,
 ):
+    """
+    :param guidance_scale: a float, or a [batch_size] tensor giving every
+                           batch element its own guidance scale.
+    :param generators: an optional sequence of batch_size random generators,
+                       so that each batch element has its own noise stream.
+    :param compile_denoiser: if True and diffusion is a GaussianDiffusion, run
+                             the (guided) denoiser as a compiled region. See
+                             CompiledGuidedDenoiser.
+    :param guidance_schedule: an optional GuidanceSchedule restricting
+                              guidance to a range of noise levels.
+    :param cancel_token: an optional CancellationToken, checked before every
+                         denoiser call. Sampling stops by raising Cancelled.
+    """
     sigmas = get_sigmas_karras(steps, sigma_min, sigma_max, rho, device=device)
-    x_T = th.randn(*shape, device=device) * sigma_max
-    sample_fn = {"heun": sample_heun, "dpm": sample_dpm, "ancestral": sample_euler_ancestral}[
-        sampler
-    ]
-
-    if sampler != "ancestral":
+    noise_sampler = None
+    if generators is None:
+        x_T = th.randn(*shape, device=device) * sigma_max
+    else:
+        assert len(generators) == shape[0], "need exactly one generator per batch element"
+        noise_sampler = partial(_batched_randn_like, generators=generators)
+        x_T = _batched_randn(shape, generators, device=device) * sigma_max
+    sample_fn = {
+        "heun": sample_heun,
+        "dpm": sample_dpm,
+        "ancestral": sample_euler_ancestral,
+        "dpmpp_2m": sample_dpmpp_2m,
+        "dpmpp_3m": sample_dpmpp_3m,
+        "unipc": sample_unipc,
+    }[sampler]
+
+    if sampler in ("heun", "dpm"):
         sampler_args = dict(s_churn=s_churn, s_tmin=s_tmin, s_tmax=s_tmax, s_noise=s_noise)
     else:
         sampler_args = {}
+    if sampler in ("heun", "dpm", "ancestral"):
+        sampler_args["noise_sampler"] = noise_sampler
+    sampler_args["cancel_token"] = cancel_token
+
+    if isinstance(guidance_scale, th.Tensor):
+        guidance_scale = append_dims(guidance_scale, len(shape))
+        use_guidance = True
+    else:
+        use_guidance = guidance_scale != 0 and guidance_scale != 1
+
+    if compile_denoiser and isinstance(diffusion, GaussianDiffusion):
+        if use_guidance and not isinstance(guidance_scale, th.Tensor):
+            guidance_scale = th.full(
+                (shape[0], *([1] * (len(shape) - 1))), guidance_scale, device=device
+            )
+        denoiser = compiled_guided_denoiser(model, diffusion, clip_denoised)
+    else:
+        denoiser = _guided_denoiser(diffusion, model, clip_denoised=clip_denoised)
+
+    if not use_guidance:
+        guided_denoiser = partial(denoiser, guidance_scale=None, model_kwargs=model_kwargs)
+    elif guidance_schedule is None:
+        guided_denoiser = partial(
+            denoiser, guidance_scale=guidance_scale, model_kwargs=model_kwargs
+        )
+    else:
+        guided_denoiser = partial(
+            _scheduled_guided_denoiser,
+            denoiser,
+            guidance_scale=guidance_scale,
+            guidance_schedule=guidance_schedule,
+            model_kwargs=model_kwargs,
+        )
+
+    for obj in sample_fn(
+        guided_denoiser,
+        x_T,
+        sigmas,
+        progress=progress,
+        **sampler_args,
+    ):
+        if isinstance(diffusion, GaussianDiffusion):
+            yield diffusion.unscale_out_dict(obj)
+        else:
+            yield obj
 
+
+def _guided_denoiser(diffusion, model, clip_denoised):
+    """
+    Build an eager denoiser with the same signature as CompiledGuidedDenoiser.
+    """
     if isinstance(diffusion, KarrasDenoiser):
 
-        def denoiser(x_t, sigma):
+        def denoiser(x_t, sigma, model_kwargs):
             _, denoised = diffusion.denoise(model, x_t, sigma, **model_kwargs)
             if clip_denoised:
                 denoised = denoised.clamp(-1, 1)
@@ -156,7 +399,7 @@ def karras_sample_progressive(
     elif isinstance(diffusion, GaussianDiffusion):
         model = GaussianToKarrasDenoiser(model, diffusion)
 
-        def denoiser(x_t, sigma):
+        def denoiser(x_t, sigma, model_kwargs):
             _, denoised = model.denoise(
                 x_t, sigma, clip_denoised=clip_denoised, model_kwargs=model_kwargs
             )
@@ -165,30 +408,82 @@ def karras_sample_progressive(
     else:
         raise NotImplementedError
 
-    if guidance_scale != 0 and guidance_scale != 1:
+    def guided_denoiser(x_t, sigma, guidance_scale=None, model_kwargs=None):
+        if guidance_scale is None:
+            return denoiser(x_t, sigma, model_kwargs)
+        x_t = th.cat([x_t, x_t], dim=0)
+        sigma = th.cat([sigma, sigma], dim=0)
+        x_0 = denoiser(x_t, sigma, model_kwargs)
+        cond_x_0, uncond_x_0 = th.split(x_0, len(x_0) // 2, dim=0)
+        x_0 = uncond_x_0 + guidance_scale * (cond_x_0 - uncond_x_0)
+        return x_0
 
-        def guided_denoiser(x_t, sigma):
-            x_t = th.cat([x_t, x_t], dim=0)
-            sigma = th.cat([sigma, sigma], dim=0)
-            x_0 = denoiser(x_t, sigma)
-            cond_x_0, uncond_x_0 = th.split(x_0, len(x_0) // 2, dim=0)
-            x_0 = uncond_x_0 + guidance_scale * (cond_x_0 - uncond_x_0)
-            return x_0
+    return guided_denoiser
 
-    else:
-        guided_denoiser = denoiser
 
-    for obj in sample_fn(
-        guided_denoiser,
-        x_T,
-        sigmas,
-        progress=progress,
-        **sampler_args,
-    ):
-        if isinstance(diffusion, GaussianDiffusion):
-            yield diffusion.unscale_out_dict(obj)
-        else:
-            yield obj
+def _scheduled_guided_denoiser(
+    denoiser, x_t, sigma, guidance_scale, guidance_schedule, model_kwargs
+):
+    # Reading sigma back is one host sync per call, paid only with a schedule.
+    scale = guidance_schedule.scale_at(float(sigma[0]), guidance_scale)
+    if scale is None:
+        # Only the conditional half of the doubled conditioning is needed.
+        cond_kwargs = {k: v[: len(v) // 2] for k, v in model_kwargs.items()}
+        return denoiser(x_t, sigma, guidance_scale=None, model_kwargs=cond_kwargs)
+    return denoiser(x_t, sigma, guidance_scale=scale, model_kwargs=model_kwargs)
+
+
+class GuidanceSchedule:
+    """
+    Restricts classifier-free guidance to a window of noise levels, and
+    optionally ramps the guidance scale up across it.
+
+    Outside the window, only the conditional half of the batch is evaluated,
+    which is equivalent to a guidance scale of 1 at half the cost.
+
+    :param sigma_min: the lowest noise level to guide at.
+    :param sigma_max: the highest noise level to guide at.
+    :param ramp: how the scale grows from 1 at sigma_max to the full scale at
+                 sigma_min, in log-sigma: "constant" (full scale throughout
+                 the window), "linear" or "cosine". Ramps need a finite,
+                 positive window.
+    """
+
+    RAMPS = ("constant", "linear", "cosine")
+
+    def __init__(self, sigma_min=0.0, sigma_max=float("inf"), ramp="constant"):
+        assert sigma_min <= sigma_max, "empty guidance window"
+        assert ramp in self.RAMPS, f"unknown guidance ramp: {ramp}"
+        if ramp != "constant":
+            assert 0 < sigma_min and sigma_max < float("inf"), "ramps need a finite window"
+        self.sigma_min = sigma_min
+        self.sigma_max = sigma_max
+        self.ramp = ramp
+
+    def scale_at(self, sigma, guidance_scale):
+        """
+        Get the guidance scale to use at a noise level.
+
+        :param sigma: the noise level, as a float.
+        :param guidance_scale: the full guidance scale, as a float or tensor.
+        :return: the scale, like guidance_scale, or None if only the
+                 conditional model should be evaluated.
+        """
+        if not (self.sigma_min <= sigma <= self.sigma_max):
+            return None
+        if self.ramp == "constant" or self.sigma_min == self.sigma_max:
+            return guidance_scale
+        frac = (math.log(self.sigma_max) - math.log(sigma)) / (
+            math.log(self.sigma_max) - math.log(self.sigma_min)
+        )
+        if self.ramp == "cosine":
+            frac = (1 - math.cos(math.pi * frac)) / 2
+        if frac == 0:
+            return None
+        return 1 + (guidance_scale - 1) * frac
+
+    def __repr__(self):
+        return f"GuidanceSchedule({self.sigma_min}, {self.sigma_max}, {self.ramp!r})"
 
 
 def get_sigmas_karras(n, sigma_min, sigma_max, rho=7.0, device="cpu"):
@@ -214,8 +509,11 @@ def get_ancestral_step(sigma_from, sigma_to):
 
 
 @th.no_grad()
-def sample_euler_ancestral(model, x, sigmas, progress=False):
+def sample_euler_ancestral(
+    model, x, sigmas, progress=False, noise_sampler=None, cancel_token=None
+):
     """Ancestral sampling with Euler method steps."""
+    noise_sampler = th.randn_like if noise_sampler is None else noise_sampler
     s_in = x.new_ones([x.shape[0]])
     indices = range(len(sigmas) - 1)
     if progress:
@@ -224,6 +522,7 @@ def sample_euler_ancestral(model, x, sigmas, progress=False):
         indices = tqdm(indices)
 
     for i in indices:
+        check_cancelled(cancel_token)
         denoised = model(x, sigmas[i] * s_in)
         sigma_down, sigma_up = get_ancestral_step(sigmas[i], sigmas[i + 1])
         yield {"x": x, "i": i, "sigma": sigmas[i], "sigma_hat": sigmas[i], "pred_xstart": denoised}
@@ -231,7 +530,7 @@ def sample_euler_ancestral(model, x, sigmas, progress=False):
         # Euler method
         dt = sigma_down - sigmas[i]
         x = x + d * dt
-        x = x + th.randn_like(x) * sigma_up
+        x = x + noise_sampler(x) * sigma_up
     yield {"x": x, "pred_xstart": x}
 
 
@@ -245,8 +544,11 @@ def sample_heun(
     s_tmin=0.0,
     s_tmax=float("inf"),
     s_noise=1.0,
+    noise_sampler=None,
+    cancel_token=None,
 ):
     """Implements Algorithm 2 (Heun steps) from Karras et al. (2022)."""
+    noise_sampler = th.randn_like if noise_sampler is None else noise_sampler
     s_in = x.new_ones([x.shape[0]])
     indices = range(len(sigmas) - 1)
     if progress:
@@ -255,10 +557,11 @@ def sample_heun(
         indices = tqdm(indices)
 
     for i in indices:
+        check_cancelled(cancel_token)
         gamma = (
             min(s_churn / (len(sigmas) - 1), 2**0.5 - 1) if s_tmin <= sigmas[i] <= s_tmax else 0.0
         )
-        eps = th.randn_like(x) * s_noise
+        eps = noise_sampler(x) * s_noise
         sigma_hat = sigmas[i] * (gamma + 1)
         if gamma > 0:
             x = x + eps * (sigma_hat**2 - sigmas[i] ** 2) ** 0.5
@@ -272,6 +575,7 @@ def sample_heun(
         else:
             # Heun's method
             x_2 = x + d * dt
+            check_cancelled(cancel_token)
             denoised_2 = denoiser(x_2, sigmas[i + 1] * s_in)
             d_2 = to_d(x_2, sigmas[i + 1], denoised_2)
             d_prime = (d + d_2) / 2
@@ -289,8 +593,11 @@ def sample_dpm(
     s_tmin=0.0,
     s_tmax=float("inf"),
     s_noise=1.0,
+    noise_sampler=None,
+    cancel_token=None,
 ):
     """A sampler inspired by DPM-Solver-2 and Algorithm 2 from Karras et al. (2022)."""
+    noise_sampler = th.randn_like if noise_sampler is None else noise_sampler
     s_in = x.new_ones([x.shape[0]])
     indices = range(len(sigmas) - 1)
     if progress:
@@ -299,27 +606,165 @@ def sample_dpm(
         indices = tqdm(indices)
 
     for i in indices:
+        check_cancelled(cancel_token)
         gamma = (
             min(s_churn / (len(sigmas) - 1), 2**0.5 - 1) if s_tmin <= sigmas[i] <= s_tmax else 0.0
         )
-        eps = th.randn_like(x) * s_noise
+        eps = noise_sampler(x) * s_noise
         sigma_hat = sigmas[i] * (gamma + 1)
         if gamma > 0:
             x = x + eps * (sigma_hat**2 - sigmas[i] ** 2) ** 0.5
         denoised = denoiser(x, sigma_hat * s_in)
         d = to_d(x, sigma_hat, denoised)
-        yield {"x": x, "i": i, "sigma": sigmas[i], "sigma_hat": sigma_hat, "denoised": denoised}
+        yield {"x": x, "i": i, "sigma": sigmas[i], "sigma_hat": sigma_hat, "pred_xstart": denoised}
         # Midpoint method, where the midpoint is chosen according to a rho=3 Karras schedule
         sigma_mid = ((sigma_hat ** (1 / 3) + sigmas[i + 1] ** (1 / 3)) / 2) ** 3
         dt_1 = sigma_mid - sigma_hat
         dt_2 = sigmas[i + 1] - sigma_hat
         x_2 = x + d * dt_1
+        check_cancelled(cancel_token)
         denoised_2 = denoiser(x_2, sigma_mid * s_in)
         d_2 = to_d(x_2, sigma_mid, denoised_2)
         x = x + d_2 * dt_2
     yield {"x": x, "pred_xstart": denoised}
 
 
+@th.no_grad()
+def sample_dpmpp_2m(denoiser, x, sigmas, progress=False, cancel_token=None):
+    """DPM-Solver++(2M) from Lu et al. (2022), one denoiser call per step."""
+    s_in = x.new_ones([x.shape[0]])
+    indices = range(len(sigmas) - 1)
+    if progress:
+        from tqdm.auto import tqdm
+
+        indices = tqdm(indices)
+
+    old_denoised = None
+    for i in indices:
+        check_cancelled(cancel_token)
+        denoised = denoiser(x, sigmas[i] * s_in)
+        yield {"x": x, "i": i, "sigma": sigmas[i], "sigma_hat": sigmas[i], "pred_xstart": denoised}
+        if sigmas[i + 1] == 0:
+            x = denoised
+        else:
+            t, t_next = -sigmas[i].log(), -sigmas[i + 1].log()
+            h = t_next - t
+            if old_denoised is None:
+                denoised_d = denoised
+            else:
+                r = (t + sigmas[i - 1].log()) / h
+                denoised_d = (1 + 1 / (2 * r)) * denoised - (1 / (2 * r)) * old_denoised
+            x = (sigmas[i + 1] / sigmas[i]) * x - (-h).expm1() * denoised_d
+        old_denoised = denoised
+    yield {"x": x, "pred_xstart": denoised}
+
+
+@th.no_grad()
+def sample_dpmpp_3m(denoiser, x, sigmas, progress=False, cancel_token=None):
+    """DPM-Solver++(3M) from Lu et al. (2022), one denoiser call per step."""
+    s_in = x.new_ones([x.shape[0]])
+    indices = range(len(sigmas) - 1)
+    if progress:
+        from tqdm.auto import tqdm
+
+        indices = tqdm(indices)
+
+    denoised_1, denoised_2 = None, None
+    h_1, h_2 = None, None
+    for i in indices:
+        check_cancelled(cancel_token)
+        denoised = denoiser(x, sigmas[i] * s_in)
+        yield {"x": x, "i": i, "sigma": sigmas[i], "sigma_hat": sigmas[i], "pred_xstart": denoised}
+        if sigmas[i + 1] == 0:
+            x = denoised
+            continue
+        h = sigmas[i].log() - sigmas[i + 1].log()
+        x = (sigmas[i + 1] / sigmas[i]) * x - (-h).expm1() * denoised
+        phi_2 = (-h).expm1() / h + 1
+        if h_2 is not None:
+            r0 = h_1 / h
+            r1 = h_2 / h
+            d1_0 = (denoised - denoised_1) / r0
+            d1_1 = (denoised_1 - denoised_2) / r1
+            d1 = d1_0 + (d1_0 - d1_1) * r0 / (r0 + r1)
+            d2 = (d1_0 - d1_1) / (r0 + r1)
+            phi_3 = phi_2 / h - 0.5
+            x = x + phi_2 * d1 - phi_3 * d2
+        elif h_1 is not None:
+            x = x + phi_2 * (denoised - denoised_1) / (h_1 / h)
+        denoised_1, denoised_2 = denoised, denoised_1
+        h_1, h_2 = h, h_1
+    yield {"x": x, "pred_xstart": denoised}
+
+
+@th.no_grad()
+def sample_unipc(denoiser, x, sigmas, progress=False, cancel_token=None):
+    """
+    UniPC-2 with B(h) = e^h - 1 from Zhao et al. (2023), using data
+    prediction. The corrector for each step reuses the denoiser output of the
+    following step, so only one denoiser call is made per step.
+    """
+    s_in = x.new_ones([x.shape[0]])
+    indices = range(len(sigmas) - 1)
+    if progress:
+        from tqdm.auto import tqdm
+
+        indices = tqdm(indices)
+
+    history = []  # (sigma, denoised) pairs, newest first
+    x_prev = None
+    for i in indices:
+        check_cancelled(cancel_token)
+        denoised = denoiser(x, sigmas[i] * s_in)
+        yield {"x": x, "i": i, "sigma": sigmas[i], "sigma_hat": sigmas[i], "pred_xstart": denoised}
+        if x_prev is not None:
+            x = _unipc_update(x_prev, sigmas[i - 1], sigmas[i], history, denoised_next=denoised)
+        history = [(sigmas[i], denoised)] + history[:1]
+        if sigmas[i + 1] == 0:
+            x = denoised
+        else:
+            x_prev = x
+            x = _unipc_update(x, sigmas[i], sigmas[i + 1], history)
+    yield {"x": x, "pred_xstart": denoised}
+
+
+def _unipc_update(x, sigma, sigma_next, history, denoised_next=None):
+    """
+    Take one UniP-2 predictor step from sigma to sigma_next, or a UniC-2
+    corrector step if the denoiser output at sigma_next is given.
+
+    :param history: (sigma, denoised) pairs, newest first, where history[0]
+                    was evaluated at sigma.
+    """
+    denoised = history[0][1]
+    h = sigma.log() - sigma_next.log()
+    h_phi_1 = (-h).expm1()
+    b_h = h_phi_1
+    x_next = (sigma_next / sigma) * x - h_phi_1 * denoised
+
+    d1 = None
+    if len(history) > 1:
+        sigma_prev, denoised_prev = history[1]
+        r = (sigma.log() - sigma_prev.log()) / h
+        d1 = (denoised_prev - denoised) / r
+
+    if denoised_next is None:
+        if d1 is None:
+            return x_next
+        return x_next - b_h * 0.5 * d1
+
+    d1_next = denoised_next - denoised
+    if d1 is None:
+        return x_next - b_h * 0.5 * d1_next
+    # Solve [[1, 1], [r, 1]] @ [rho_0, rho_1] = [b_1, b_2] for the corrector weights.
+    h_phi_k = h_phi_1 / -h - 1
+    b_1 = h_phi_k / b_h
+    b_2 = (h_phi_k / -h - 0.5) * 2 / b_h
+    rho_0 = (b_1 - b_2) / (1 - r)
+    rho_1 = (b_2 - r * b_1) / (1 - r)
+    return x_next - b_h * (rho_0 * d1 + rho_1 * d1_next)
+
+
 def append_dims(x, target_dims):
     """Appends dimensions to the end of a tensor until it has target_dims dimensions."""
     dims_to_append = target_dims - x.ndim
@@ -330,3 +775,15 @@ def append_dims(x, target_dims):
 
 def append_zero(x):
     return th.cat([x, x.new_zeros([1])])
+
+
+def _batched_randn(shape, generators, device=None, dtype=None):
+    """Draw each batch element of a normal sample from its own generator."""
+    return th.cat(
+        [th.randn(1, *shape[1:], generator=g, device=device, dtype=dtype) for g in generators],
+        dim=0,
+    )
+
+
+def _batched_randn_like(x, generators):
+    return _batched_randn(x.shape, generators, device=x.device, dtype=x.dtype)
@@ -1,27 +1,53 @@
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Sequence, Union
 
 import torch
 import torch.nn as nn
 
+from ..models.generation.pretrained_clip import null_conditioning
+from ..util.cancellation import CancellationToken
 from .gaussian_diffusion import GaussianDiffusion
-from .k_diffusion import karras_sample
+from .k_diffusion import GuidanceSchedule, karras_sample
 
 DEFAULT_KARRAS_STEPS = 64
 DEFAULT_KARRAS_SIGMA_MIN = 1e-3
 DEFAULT_KARRAS_SIGMA_MAX = 160
 DEFAULT_KARRAS_S_CHURN = 0.0
+DEFAULT_KARRAS_SAMPLER = "heun"
 
 
 def uncond_guide_model(
-    model: Callable[..., torch.Tensor], scale: float
+    model: Callable[..., torch.Tensor],
+    scale: Union[float, torch.Tensor],
+    guidance_schedule: Optional[GuidanceSchedule] = None,
+    diffusion: Optional[GaussianDiffusion] = None,
 ) -> Callable[..., torch.Tensor]:
+    """
+    :param guidance_schedule: if specified, only guide at some noise levels.
+                              Requires diffusion, to map timesteps to sigmas.
+    """
+    if isinstance(scale, torch.Tensor):
+        scale = scale[:, None]
+    if guidance_schedule is not None:
+        assert diffusion is not None, "a guidance schedule needs the diffusion"
+        # The model sees unspaced timesteps, even for a SpacedDiffusion.
+        timestep_map = getattr(diffusion, "timestep_map", range(diffusion.num_timesteps))
+        sigmas = dict(zip(timestep_map, (1.0 / diffusion.alphas_cumprod - 1) ** 0.5))
+
     def model_fn(x_t, ts, **kwargs):
         half = x_t[: len(x_t) // 2]
+        step_scale = scale
+        if guidance_schedule is not None:
+            step_scale = guidance_schedule.scale_at(float(sigmas[int(ts[0])]), scale)
+        if step_scale is None:
+            # Only the conditional half of the batch needs a model call.
+            cond_kwargs = {k: v[: len(v) // 2] for k, v in kwargs.items()}
+            model_out = model(half, ts[: len(half)], **cond_kwargs)
+            return torch.cat([model_out, model_out], dim=0)
         combined = torch.cat([half, half], dim=0)
         model_out = model(combined, ts, **kwargs)
         eps, rest = model_out[:, :3], model_out[:, 3:]
         cond_eps, uncond_eps = torch.chunk(eps, 2, dim=0)
-        half_eps = uncond_eps + scale * (cond_eps - uncond_eps)
+        half_eps = uncond_eps + step_scale * (cond_eps - uncond_eps)
         eps = torch.cat([half_eps, half_eps], dim=0)
         return torch.cat([eps, rest], dim=1)
 
@@ -34,7 +60,7 @@ def sample_latents(
     model: nn.Module,
     diffusion: GaussianDiffusion,
     model_kwargs: Dict[str, Any],
-    guidance_scale: float,
+    guidance_scale: Union[float, Sequence[float]],
     clip_denoised: bool,
     use_fp16: bool,
     use_karras: bool,
@@ -44,20 +70,56 @@ def sample_latents(
     s_churn: float,
     device: Optional[torch.device] = None,
     progress: bool = False,
+    sampler: str = DEFAULT_KARRAS_SAMPLER,
+    generators: Optional[Sequence[torch.Generator]] = None,
+    compile_denoiser: bool = False,
+    guidance_schedule: Optional[GuidanceSchedule] = None,
+    callback: Optional[Callable[[Dict[str, Any]], Optional[bool]]] = None,
+    callback_steps: int = 1,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> torch.Tensor:
+    """
+    :param guidance_scale: a single guidance scale, or one per batch element.
+    :param generators: an optional random generator per batch element, so
+                       that every element has its own reproducible noise.
+    :param compile_denoiser: if True, run the Karras denoiser as a compiled
+                             region (a CUDA graph on GPU) for each batch size.
+    :param guidance_schedule: if specified, only apply classifier-free
+                              guidance within a window of noise levels.
+    :param callback: if specified, called every callback_steps sampling steps
+                     with a dict holding the step index "i", the current
+                     samples "x" and their denoised "pred_xstart", e.g. to
+                     preview the shape while it emerges. Returning False
+                     stops sampling by raising SamplingCancelled. Only
+                     supported by the Karras samplers.
+    :param cancel_token: if specified, checked between denoiser calls, so that
+                         an abandoned or overdue request raises Cancelled
+                         within one step.
+    """
     sample_shape = (batch_size, model.d_latent)
 
     if device is None:
         device = next(model.parameters()).device
 
+    guidance_scale = _batch_guidance_scale(guidance_scale, batch_size, device)
+    use_guidance = isinstance(guidance_scale, torch.Tensor) or guidance_scale not in (0.0, 1.0)
+
     if hasattr(model, "cached_model_kwargs"):
         model_kwargs = model.cached_model_kwargs(batch_size, model_kwargs)
-    if guidance_scale != 1.0 and guidance_scale != 0.0:
+    if use_guidance:
         for k, v in model_kwargs.copy().items():
-            model_kwargs[k] = torch.cat([v, torch.zeros_like(v)], dim=0)
+            model_kwargs[k] = torch.cat([v, null_conditioning(v)], dim=0)
 
     sample_shape = (batch_size, model.d_latent)
-    with torch.autocast(device_type=device.type, enabled=use_fp16):
+    # Models with reduced-precision weights always run under autocast, which
+    # lets them take the sampler's f32 inputs and keeps norms and softmax in f32.
+    model_dtype = next(model.parameters()).dtype
+    reduced_precision = model_dtype in (torch.float16, torch.bfloat16)
+    with torch.autocast(
+        device_type=device.type,
+        dtype=model_dtype if reduced_precision else None,
+        enabled=use_fp16 or reduced_precision,
+    ):
         if use_karras:
             samples = karras_sample(
                 diffusion=diffusion,
@@ -72,12 +134,24 @@ def sample_latents(
                 s_churn=s_churn,
                 guidance_scale=guidance_scale,
                 progress=progress,
+                sampler=sampler,
+                generators=generators,
+                compile_denoiser=compile_denoiser,
+                guidance_schedule=guidance_schedule,
+                callback=callback,
+                callback_steps=callback_steps,
+                cancel_token=cancel_token,
             )
         else:
+            assert callback is None, "step callbacks need use_karras=True"
             internal_batch_size = batch_size
-            if guidance_scale != 1.0:
-                model = uncond_guide_model(model, guidance_scale)
+            if use_guidance:
+                model = uncond_guide_model(
+                    model, guidance_scale, guidance_schedule=guidance_schedule, diffusion=diffusion
+                )
                 internal_batch_size *= 2
+            if cancel_token is not None:
+                model = _cancellable_model(model, cancel_token)
             samples = diffusion.p_sample_loop(
                 model,
                 shape=(internal_batch_size, *sample_shape[1:]),
@@ -88,3 +162,31 @@ def sample_latents(
             )
 
     return samples
+
+
+def _cancellable_model(
+    model: Callable[..., torch.Tensor], cancel_token: CancellationToken
+) -> Callable[..., torch.Tensor]:
+    def model_fn(*args, **kwargs):
+        cancel_token.check()
+        return model(*args, **kwargs)
+
+    return model_fn
+
+
+def _batch_guidance_scale(
+    guidance_scale: Union[float, Sequence[float]], batch_size: int, device: torch.device
+) -> Union[float, torch.Tensor]:
+    """
+    Collapse per-element guidance scales to a float when they all agree, and
+    otherwise return a [batch_size] tensor. A scale of 0 means "no guidance",
+    which is the same as a scale of 1 once the batch is guided as a whole.
+    """
+    if isinstance(guidance_scale, (int, float)):
+        return float(guidance_scale)
+    scales = [float(x) for x in guidance_scale]
+    assert len(scales) == batch_size, "need exactly one guidance scale per batch element"
+    if len(set(scales)) == 1:
+        return scales[0]
+    scales = [1.0 if x == 0.0 else x for x in scales]
+    return torch.tensor(scales, device=device)
@@ -6,7 +6,7 @@ import torch.nn as nn
 
 from ...models.nn.checkpoint import checkpoint
 
-from .transformer import MLP, Transformer, init_linear
+from .transformer import MLP, Transformer, init_linear, is_inference, qkv_attention
 from .util import timestep_embedding
 
 
@@ -42,7 +42,10 @@ class MultiheadCrossAttention(nn.Module):
     def forward(self, x, data):
         x = self.c_q(x)
         data = self.c_kv(data)
-        x = checkpoint(self.attention, (x, data), (), True)
+        if is_inference(self):
+            x = self.attention(x, data, fused=True)
+        else:
+            x = checkpoint(self.attention, (x, data), (), True)
         x = self.c_proj(x)
         return x
 
@@ -58,20 +61,15 @@ class QKVMultiheadCrossAttention(nn.Module):
         self.n_ctx = n_ctx
         self.n_data = n_data
 
-    def forward(self, q, kv):
+    def forward(self, q, kv, fused: bool = False):
         _, n_ctx, _ = q.shape
         bs, n_data, width = kv.shape
         attn_ch = width // self.heads // 2
-        scale = 1 / math.sqrt(math.sqrt(attn_ch))
         q = q.view(bs, n_ctx, self.heads, -1)
         kv = kv.view(bs, n_data, self.heads, -1)
         k, v = torch.split(kv, attn_ch, dim=-1)
-        weight = torch.einsum(
-            "bthc,bshc->bhts", q * scale, k * scale
-        )  # More stable with f16 than dividing afterwards
-        wdtype = weight.dtype
-        weight = torch.softmax(weight.float(), dim=-1).type(wdtype)
-        return torch.einsum("bhts,bshc->bthc", weight, v).reshape(bs, n_ctx, -1)
+        out = qkv_attention(q, k, v, fused=fused)
+        return out.reshape(bs, n_ctx, -1)
 
 
 class ResidualCrossAttentionBlock(nn.Module):
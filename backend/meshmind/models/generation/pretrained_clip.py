@@ -1,4 +1,8 @@
-from typing import Iterable, List, Optional, Union
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
@@ -169,9 +173,19 @@ class ImageCLIP(nn.Module):
         """
         Embed text prompts as an [N x D] tensor.
         """
-        enc = self.clip_model.encode_text(
-            self._tokenize(list(prompts), truncate=True).to(self.device)
-        ).float()
+        return self.embed_tokens(self.tokenize(prompts))
+
+    def tokenize(self, prompts: Iterable[str]) -> torch.Tensor:
+        """
+        Tokenize text prompts as an [N x T] tensor of token ids.
+        """
+        return self._tokenize(list(prompts), truncate=True)
+
+    def embed_tokens(self, tokens: torch.Tensor) -> torch.Tensor:
+        """
+        Embed tokenized prompts from tokenize() as an [N x D] tensor.
+        """
+        enc = self.clip_model.encode_text(tokens.to(self.device)).float()
         return enc / torch.linalg.norm(enc, dim=-1, keepdim=True)
 
     def embed_images_grid(self, xs: Iterable[Optional[ImageType]]) -> torch.Tensor:
@@ -217,10 +231,30 @@ class ImageCLIP(nn.Module):
 
 
 class FrozenImageCLIP:
-    def __init__(self, device: torch.device, **kwargs):
+    """
+    An inference-only ImageCLIP which memoizes embeddings, since the same
+    prompt or image is typically sampled many times with different seeds
+    and guidance scales.
+
+    :param text_cache_size: max number of text embeddings to keep.
+    :param image_cache_size: max number of image and image grid embeddings
+                             to keep. Grid embeddings are large, so this is
+                             kept small.
+    """
+
+    def __init__(
+        self,
+        device: torch.device,
+        text_cache_size: int = 1024,
+        image_cache_size: int = 32,
+        **kwargs,
+    ):
         self.model = ImageCLIP(device, dtype=None, ensure_used_params=False, **kwargs)
         for parameter in self.model.parameters():
             parameter.requires_grad_(False)
+        self.text_cache = EmbeddingCache(text_cache_size)
+        self.image_cache = EmbeddingCache(image_cache_size)
+        self.image_grid_cache = EmbeddingCache(image_cache_size)
 
     @property
     def feature_dim(self) -> int:
@@ -241,22 +275,165 @@ class FrozenImageCLIP:
         texts: Optional[Iterable[Optional[str]]] = None,
         embeddings: Optional[Iterable[Optional[torch.Tensor]]] = None,
     ) -> torch.Tensor:
+        if embeddings is None:
+            # Nothing to differentiate through, so use the cached encoders.
+            return self._cached_multimodal_embed(batch_size, images=images, texts=texts)
+
         # We don't do a no_grad() here so that gradients could still
         # flow to the input embeddings argument.
         # This behavior is currently not used, but it could be.
         return self.model(batch_size=batch_size, images=images, texts=texts, embeddings=embeddings)
 
+    def _cached_multimodal_embed(
+        self,
+        batch_size: int,
+        images: Optional[Iterable[Optional[ImageType]]] = None,
+        texts: Optional[Iterable[Optional[str]]] = None,
+    ) -> torch.Tensor:
+        """
+        Like ImageCLIP.forward() without precomputed embeddings, but going
+        through the embedding caches.
+        """
+        image_seq = [None] * batch_size if images is None else list(images)
+        text_seq = [None] * batch_size if texts is None else list(texts)
+        assert len(image_seq) == batch_size, "number of images should match batch size"
+        assert len(text_seq) == batch_size, "number of texts should match batch size"
+
+        result = torch.zeros((batch_size, self.feature_dim), device=self.model.device)
+        index_images = []
+        index_texts = []
+        for i, (image, text) in enumerate(zip(image_seq, text_seq)):
+            assert (
+                image is None or text is None
+            ), "only one modality may be non-None per batch element"
+            if image is not None:
+                index_images.append((i, image))
+            elif text is not None:
+                index_texts.append((i, text))
+
+        if len(index_images):
+            embs = self.embed_images(img for _, img in index_images)
+            for (i, _), emb in zip(index_images, embs):
+                result[i] = emb.to(result)
+        if len(index_texts):
+            embs = self.embed_text(text for _, text in index_texts)
+            for (i, _), emb in zip(index_texts, embs):
+                result[i] = emb.to(result)
+
+        return result
+
     def embed_images(self, xs: Iterable[Optional[ImageType]]) -> torch.Tensor:
+        xs = list(xs)
         with torch.no_grad():
-            return self.model.embed_images(xs)
+            return self.image_cache.lookup(
+                [self._cache_key(image_hash(x)) for x in xs],
+                lambda idxs: self.model.embed_images([xs[i] for i in idxs]),
+            )
 
     def embed_text(self, prompts: Iterable[str]) -> torch.Tensor:
+        tokens = self.model.tokenize(prompts)
         with torch.no_grad():
-            return self.model.embed_text(prompts)
+            return self.text_cache.lookup(
+                # Prompts differing only in case or whitespace share tokens.
+                [self._cache_key(tuple(row[row != 0].tolist())) for row in tokens],
+                lambda idxs: self.model.embed_tokens(tokens[idxs]),
+            )
 
     def embed_images_grid(self, xs: Iterable[Optional[ImageType]]) -> torch.Tensor:
+        xs = list(xs)
         with torch.no_grad():
-            return self.model.embed_images_grid(xs)
+            return self.image_grid_cache.lookup(
+                [self._cache_key(image_hash(x)) for x in xs],
+                lambda idxs: self.model.embed_images_grid([xs[i] for i in idxs]),
+            )
+
+    def _cache_key(self, content: Hashable) -> Hashable:
+        # Embeddings change if the model is cast to another precision.
+        return (self.model.clip_model.dtype, content)
+
+    def clear_cache(self):
+        self.text_cache.clear()
+        self.image_cache.clear()
+        self.image_grid_cache.clear()
+
+
+class EmbeddingCache:
+    """
+    A thread-safe LRU cache of per-example embedding tensors.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(
+        self, keys: Sequence[Hashable], compute_fn: Callable[[List[int]], torch.Tensor]
+    ) -> torch.Tensor:
+        """
+        Gather the embeddings for keys into one [N x ...] tensor.
+
+        :param keys: one cache key per example.
+        :param compute_fn: called once with the indices of all keys that are
+                           not cached, returning their embeddings as a batch.
+        :return: the stacked embeddings, in the order of keys.
+        """
+        results: List[Optional[torch.Tensor]] = [None] * len(keys)
+        missing: List[int] = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    results[i] = self._entries[key]
+                else:
+                    missing.append(i)
+
+        if missing:
+            # Duplicates within a batch are only computed once.
+            unique = list({keys[i]: i for i in reversed(missing)}.values())
+            computed = dict(zip((keys[i] for i in unique), compute_fn(unique)))
+            with self._lock:
+                for key, emb in computed.items():
+                    self._entries[key] = emb
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            for i in missing:
+                results[i] = computed[keys[i]]
+
+        return torch.stack(results, dim=0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def null_conditioning(cond: torch.Tensor) -> torch.Tensor:
+    """
+    Get the (zero) conditioning used for the unconditional half of a
+    classifier-free guidance batch, shaped like cond.
+
+    The returned tensor is a broadcast view of a shared buffer and must not
+    be written to.
+    """
+    return _null_buffer(tuple(cond.shape[1:]), cond.dtype, cond.device).expand_as(cond)
+
+
+@lru_cache(maxsize=16)
+def _null_buffer(shape: Tuple[int, ...], dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+    return torch.zeros((1, *shape), dtype=dtype, device=device)
+
+
+def image_hash(obj: Optional[ImageType]) -> str:
+    """
+    Hash the pixel content of an image, independent of how it is stored.
+    Used to key both cached image embeddings and cached latents.
+    """
+    img = _image_to_pil(obj)
+    h = hashlib.sha256()
+    h.update(f"{img.mode}:{img.size}".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
 
 
 def _image_to_pil(obj: Optional[ImageType]) -> Image.Image:
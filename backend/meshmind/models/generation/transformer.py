@@ -3,6 +3,7 @@ from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from ...models.nn.checkpoint import checkpoint
 
@@ -16,6 +17,48 @@ def init_linear(l, stddev):
         nn.init.constant_(l.bias, 0.0)
 
 
+def is_inference(module: nn.Module) -> bool:
+    """
+    Check if a module's forward pass will never be differentiated, so that
+    activations need not be kept or recomputed for a backward pass.
+    """
+    return not (module.training and torch.is_grad_enabled())
+
+
+def qkv_attention(
+    q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, fused: bool = False
+) -> torch.Tensor:
+    """
+    Multi-head dot-product attention.
+
+    Queries and keys are each scaled by 1/sqrt(sqrt(C)) before the dot
+    product, which is more stable with f16 than dividing afterwards.
+
+    :param q: a [N x T x H x C] tensor of queries.
+    :param k: a [N x S x H x C] tensor of keys.
+    :param v: a [N x S x H x C] tensor of values.
+    :param fused: if True, use scaled_dot_product_attention, which never
+                  materializes the [N x H x T x S] attention weights.
+    :return: a [N x T x H x C] tensor.
+    """
+    scale = 1 / math.sqrt(math.sqrt(q.shape[-1]))
+    if fused:
+        # The fused kernels accumulate the softmax in f32 internally.
+        out = F.scaled_dot_product_attention(
+            (q * scale).transpose(1, 2),
+            (k * scale).transpose(1, 2),
+            v.transpose(1, 2),
+            scale=1.0,
+        )
+        return out.transpose(1, 2)
+    weight = torch.einsum(
+        "bthc,bshc->bhts", q * scale, k * scale
+    )  # More stable with f16 than dividing afterwards
+    wdtype = weight.dtype
+    weight = torch.softmax(weight.float(), dim=-1).type(wdtype)
+    return torch.einsum("bhts,bshc->bthc", weight, v)
+
+
 class MultiheadAttention(nn.Module):
     def __init__(
         self,
@@ -39,7 +82,10 @@ class MultiheadAttention(nn.Module):
 
     def forward(self, x):
         x = self.c_qkv(x)
-        x = checkpoint(self.attention, (x,), (), True)
+        if is_inference(self):
+            x = self.attention(x, fused=True)
+        else:
+            x = checkpoint(self.attention, (x,), (), True)
         x = self.c_proj(x)
         return x
 
@@ -66,18 +112,13 @@ class QKVMultiheadAttention(nn.Module):
         self.heads = heads
         self.n_ctx = n_ctx
 
-    def forward(self, qkv):
+    def forward(self, qkv, fused: bool = False):
         bs, n_ctx, width = qkv.shape
         attn_ch = width // self.heads // 3
-        scale = 1 / math.sqrt(math.sqrt(attn_ch))
         qkv = qkv.view(bs, n_ctx, self.heads, -1)
         q, k, v = torch.split(qkv, attn_ch, dim=-1)
-        weight = torch.einsum(
-            "bthc,bshc->bhts", q * scale, k * scale
-        )  # More stable with f16 than dividing afterwards
-        wdtype = weight.dtype
-        weight = torch.softmax(weight.float(), dim=-1).type(wdtype)
-        return torch.einsum("bhts,bshc->bthc", weight, v).reshape(bs, n_ctx, -1)
+        out = qkv_attention(q, k, v, fused=fused)
+        return out.reshape(bs, n_ctx, -1)
 
 
 class ResidualAttentionBlock(nn.Module):
@@ -33,7 +33,11 @@ class MLPDensitySDFModel(MLPModel):
     ) -> AttrDict[str, Any]:
         # query.direction is None typically for SDF models and training
         h, _h_directionless = self._mlp(
-            query.position, query.direction, params=params, options=options
+            query.position,
+            query.direction,
+            params=params,
+            options=options,
+            position_encoding=query.position_encoding,
         )
         h_sdf, h_density = h.split(1, dim=-1)
         return AttrDict(
@@ -87,7 +91,11 @@ class MLPNeRSTFModel(MLPModel):
     ) -> AttrDict[str, Any]:
         options = AttrDict() if options is None else AttrDict(options)
         h, h_directionless = self._mlp(
-            query.position, query.direction, params=params, options=options
+            query.position,
+            query.direction,
+            params=params,
+            options=options,
+            position_encoding=query.position_encoding,
         )
         activations = map_indices_to_keys(self.h_map, h)
         activations.update(map_indices_to_keys(self.h_directionless_map, h_directionless))
@@ -1,5 +1,5 @@
 from functools import partial
-from typing import Any, Dict, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import torch
 
@@ -10,9 +10,16 @@ from ...models.nn.utils import to_torch
 from ...models.query import Query
 from ...models.renderer import RayRenderer, render_views_from_rays
 from ...models.stf.base import Model
-from ...models.stf.renderer import STFRendererBase, render_views_from_stf
+from ...models.stf.renderer import (
+    STFRendererBase,
+    _meta_batch_size,
+    extract_meshes_from_stf,
+    field_posenc_versions,
+    render_views_from_stf,
+)
 from ...models.volume import BoundingBoxVolume, Volume
 from ...rendering.blender.constants import BASIC_AMBIENT_COLOR, BASIC_DIFFUSE_COLOR
+from ...rendering.torch_mesh import TorchMesh
 from ...util.collections import AttrDict
 
 
@@ -266,6 +273,58 @@ class NeRSTFRenderer(RayRenderer, STFRendererBase):
 
         return output
 
+    def extract_mesh(
+        self,
+        params: Optional[Dict] = None,
+        options: Optional[AttrDict] = None,
+        grid_size: Optional[int] = None,
+        query_batch_size: int = 4096,
+        coarse_stride: Optional[int] = None,
+        coarse_band: float = 1.0,
+        memory_budget: Optional[int] = None,
+    ) -> List[TorchMesh]:
+        """
+        Decode meta parameters directly to textured meshes with the STF
+        branch, without rendering any views.
+
+        :param params: batched meta parameters, e.g. from bottleneck_to_params().
+        :param grid_size: SDF sampling resolution. Defaults to self.grid_size.
+        :param coarse_stride: if specified, sample the SDF coarse-to-fine with
+            this stride.
+        :param coarse_band: the distance from the surface, in coarse cell
+            diagonals, at which coarse-to-fine sampling refines the grid.
+        :param memory_budget: if specified, the approximate number of bytes
+            that SDF queries may use at once.
+        :return: one mesh per element of the meta batch.
+        """
+        batch_size = _meta_batch_size(params)
+        params = self.update(params)
+        options = AttrDict() if options is None else AttrDict(options)
+
+        sdf_fn = tf_fn = nerstf_fn = None
+        if self.nerstf is not None:
+            nerstf_fn = partial(self.nerstf.forward_batched, params=subdict(params, "nerstf"))
+        else:
+            sdf_fn = partial(self.sdf.forward_batched, params=subdict(params, "sdf"))
+            tf_fn = partial(self.tf.forward_batched, params=subdict(params, "tf"))
+
+        return extract_meshes_from_stf(
+            options,
+            sdf_fn=sdf_fn,
+            tf_fn=tf_fn,
+            nerstf_fn=nerstf_fn,
+            volume=self.volume,
+            grid_size=grid_size or self.grid_size,
+            batch_size=batch_size,
+            query_batch_size=query_batch_size,
+            texture_channels=self.texture_channels,
+            output_srgb=self.output_srgb,
+            coarse_stride=coarse_stride,
+            coarse_band=coarse_band,
+            memory_budget=memory_budget,
+            posenc_versions=field_posenc_versions(self.sdf if self.nerstf is None else self.nerstf),
+        )
+
     def get_signed_distance(
         self,
         query: Query,
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 
 import torch
 
@@ -13,12 +13,17 @@ class Query:
     t_min: Optional[torch.Tensor] = None
     t_max: Optional[torch.Tensor] = None
 
+    # Precomputed positional encodings of position, keyed by posenc version.
+    # Each is of shape [1 x ... x d] when shared by the whole batch.
+    position_encoding: Optional[Dict[str, torch.Tensor]] = None
+
     def copy(self) -> "Query":
         return Query(
             position=self.position,
             direction=self.direction,
             t_min=self.t_min,
             t_max=self.t_max,
+            position_encoding=self.position_encoding,
         )
 
     def map_tensors(self, f: Callable[[torch.Tensor], torch.Tensor]) -> "Query":
@@ -27,4 +32,9 @@ class Query:
             direction=f(self.direction) if self.direction is not None else None,
             t_min=f(self.t_min) if self.t_min is not None else None,
             t_max=f(self.t_max) if self.t_max is not None else None,
+            position_encoding=(
+                {k: f(v) for k, v in self.position_encoding.items()}
+                if self.position_encoding is not None
+                else None
+            ),
         )
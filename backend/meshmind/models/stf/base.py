@@ -5,6 +5,7 @@ import torch
 
 from ...models.query import Query
 from ...models.renderer import append_tensor
+from ...util.cancellation import check_cancelled
 from ...util.collections import AttrDict
 
 
@@ -39,6 +40,7 @@ class Model(ABC):
 
         results_list = AttrDict()
         for i in range(0, query.position.shape[1], query_batch_size):
+            check_cancelled(options.cancel_token)
             out = self(
                 query=query.map_tensors(lambda x, i=i: x[:, i : i + query_batch_size]),
                 params=params,
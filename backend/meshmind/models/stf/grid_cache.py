@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import torch
+
+GridEntry = Tuple[torch.Tensor, Dict[str, torch.Tensor]]
+
+
+class QueryGridCache:
+    """
+    A size-bounded LRU cache of query positions on a fixed grid, together
+    with their positional encodings.
+
+    Both only depend on the grid resolution, volume and posenc version, never
+    on the latent being decoded, so they can be shared by every decode at the
+    same resolution instead of being recomputed per request.
+
+    :param max_bytes: the total size of the cached tensors. Entries larger
+        than this are computed but never stored.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, GridEntry]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def get(self, key: Hashable, compute_fn: Callable[[], GridEntry]) -> GridEntry:
+        """
+        Look up an entry, computing and storing it on a miss.
+
+        :param key: a hashable description of the grid points, e.g. including
+            the grid size, volume bounds, device and index range.
+        :param compute_fn: returns a tuple (positions, encodings), where
+            encodings maps posenc versions to encoded positions.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = compute_fn()
+        size = _entry_bytes(entry)
+        with self._lock:
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = entry
+                self._sizes[key] = size
+                self._evict()
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def _evict(self):
+        total = sum(self._sizes.values())
+        while total > self.max_bytes and self._entries:
+            key, _ = self._entries.popitem(last=False)
+            total -= self._sizes.pop(key)
+
+
+def _entry_bytes(entry: GridEntry) -> int:
+    positions, encodings = entry
+    tensors = [positions, *encodings.values()]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+_QUERY_GRID_CACHE: Optional[QueryGridCache] = None
+
+
+def query_grid_cache() -> QueryGridCache:
+    """
+    Get the process-wide cache used by mesh extraction, which holds up to
+    1 GiB unless its max_bytes is changed.
+    """
+    global _QUERY_GRID_CACHE
+    if _QUERY_GRID_CACHE is None:
+        _QUERY_GRID_CACHE = QueryGridCache(max_bytes=1 << 30)
+    return _QUERY_GRID_CACHE
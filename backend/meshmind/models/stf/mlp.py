@@ -1,5 +1,5 @@
-from functools import partial
-from typing import Any, Dict, Optional, Tuple
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import torch
 import torch.nn as nn
@@ -118,17 +118,27 @@ class MLPModel(MetaModule, Model):
 
         # query.direction is None typically for SDF models and training
         h_final, _h_directionless = self._mlp(
-            query.position, query.direction, params=params, options=options
+            query.position,
+            query.direction,
+            params=params,
+            options=options,
+            position_encoding=query.position_encoding,
         )
         return self.output_activation(h_final)
 
     def _run_mlp(
-        self, position: torch.Tensor, direction: torch.Tensor, params: AttrDict[str, torch.Tensor]
+        self,
+        position: torch.Tensor,
+        direction: torch.Tensor,
+        params: AttrDict[str, torch.Tensor],
+        position_encoding: Optional[Dict[str, torch.Tensor]] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         """
+        :param position_encoding: precomputed positional encodings, which are
+            used instead of encoding position if they include posenc_version.
         :return: the final and directionless activations at the given query
         """
-        h_preact = h = encode_position(self.posenc_version, position=position)
+        h_preact = h = self._encode_position(position, position_encoding)
         h_directionless = None
         for i, layer in enumerate(self.mlp):
             if i == self.insert_direction_at:
@@ -149,23 +159,95 @@ class MLPModel(MetaModule, Model):
             h_directionless = h_preact
         return h_final, h_directionless
 
+    def _encode_position(
+        self,
+        position: torch.Tensor,
+        position_encoding: Optional[Dict[str, torch.Tensor]] = None,
+    ) -> torch.Tensor:
+        if position_encoding is not None and self.posenc_version in position_encoding:
+            h = position_encoding[self.posenc_version]
+            return h.expand(*position.shape[:-1], h.shape[-1])
+        return encode_position(self.posenc_version, position=position)
+
+    def fused_layers(
+        self, params: Optional[Dict[str, torch.Tensor]] = None
+    ) -> Optional[List[Tuple[torch.Tensor, Optional[torch.Tensor]]]]:
+        """
+        Resolve the weights of every layer for fused_mlp_stack().
+
+        :param params: Meta parameters
+        :return: a list of (weight, bias) pairs, where weight is a contiguous
+            [batch_size x d_in x d_out] tensor and bias is [batch_size x 1 x d_out]
+            or None. batch_size is 1 for layers without meta parameters. Returns
+            None if some layer cannot be expressed this way.
+        """
+        params = self.update(params)
+        layers = []
+        for i, layer in enumerate(self.mlp):
+            if isinstance(layer, MetaLinear):
+                layer_params = subdict(params, f"mlp.{i}")
+                if layer_params.scale is not None or layer_params.shift is not None:
+                    return None
+                weight, bias = layer_params.weight, layer_params.bias
+            else:
+                weight, bias = layer.weight, layer.bias
+            if weight.ndim == 2:
+                weight = weight[None]
+            if bias is not None:
+                bias = bias[:, None] if bias.ndim == 2 else bias[None, None]
+            layers.append((weight.transpose(1, 2).contiguous(), bias))
+        return layers
+
+    def _cached_fused_layers(
+        self, params: Optional[Dict[str, torch.Tensor]], options: AttrDict[str, Any]
+    ) -> Optional[List[Tuple[torch.Tensor, Optional[torch.Tensor]]]]:
+        """
+        Like fused_layers(), but reuse the result for the same params object
+        while options.cache lives, e.g. across the query batches of
+        forward_batched().
+        """
+        if options.cache is None:
+            return self.fused_layers(params)
+        key = f"fused_mlp_{id(self)}"
+        cached = options.cache[key]
+        if cached is None or cached[0] is not params:
+            # Keep params alive, so that its id cannot be reused by a new object.
+            cached = (params, self.fused_layers(params))
+            options.cache[key] = cached
+        return cached[1]
+
     def _mlp(
         self,
         position: torch.Tensor,
         direction: Optional[torch.Tensor] = None,
         params: Optional[Dict[str, torch.Tensor]] = None,
         options: Optional[Dict[str, Any]] = None,
+        position_encoding: Optional[Dict[str, torch.Tensor]] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         """
         :param position: [batch_size x ... x 3]
         :param params: Meta parameters
         :param options: Optional hyperparameters
+        :param position_encoding: see Query.position_encoding
         :return: the final and directionless activations at the given query
         """
-        params = self.update(params)
         options = AttrDict() if options is None else AttrDict(options)
+        if self.insert_direction_at is None and not torch.is_grad_enabled():
+            layers = self._cached_fused_layers(params, options)
+            if layers is not None:
+                h = self._encode_position(position, position_encoding)
+                stack = _compiled_fused_mlp_stack() if options.compile_fused_mlp else fused_mlp_stack
+                h_final = stack(h, layers, self.activation)
+                return h_final, h_final
 
-        mlp = partial(self._run_mlp, direction=direction, params=params)
+        params = self.update(params)
+
+        mlp = partial(
+            self._run_mlp,
+            direction=direction,
+            params=params,
+            position_encoding=position_encoding,
+        )
         parameters = []
         for i, layer in enumerate(self.mlp):
             if isinstance(layer, MetaLinear):
@@ -180,6 +262,38 @@ class MLPModel(MetaModule, Model):
         return h_final, h_directionless
 
 
+def fused_mlp_stack(
+    h: torch.Tensor,
+    layers: List[Tuple[torch.Tensor, Optional[torch.Tensor]]],
+    activation: Callable[[torch.Tensor], torch.Tensor],
+) -> torch.Tensor:
+    """
+    Run an MLP with per-batch-element weights as one batched matmul per layer.
+
+    :param h: [batch_size x ... x d_in] input features.
+    :param layers: see MLPModel.fused_layers().
+    :param activation: applied after every layer except the last.
+    :return: [batch_size x ... x d_out] outputs, without output activation.
+    """
+    batch_size, *shape, d_in = h.shape
+    h = h.reshape(batch_size, -1, d_in)
+    for i, (weight, bias) in enumerate(layers):
+        weight = weight.expand(batch_size, *weight.shape[1:])
+        if bias is None:
+            h = torch.bmm(h, weight)
+        else:
+            h = torch.baddbmm(bias, h, weight)
+        if i < len(layers) - 1:
+            h = activation(h)
+    return h.reshape(batch_size, *shape, -1)
+
+
+@lru_cache(maxsize=1)
+def _compiled_fused_mlp_stack() -> Callable:
+    # Query batches vary in size, so avoid recompiling for every new one.
+    return torch.compile(fused_mlp_stack, dynamic=True)
+
+
 class MLPSDFModel(MLPModel):
     def __init__(self, initial_bias: float = -0.1, **kwargs):
         super().__init__(n_output=1, output_activation="identity", **kwargs)
@@ -1,25 +1,28 @@
 import warnings
 from abc import ABC, abstractmethod
 from functools import partial
-from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
 import torch.nn.functional as F
 
 from ...models.nn.camera import DifferentiableCamera, DifferentiableProjectiveCamera
+from ...models.nn.encoding import encode_position
 from ...models.nn.meta import subdict
 from ...models.nn.utils import to_torch
 from ...models.query import Query
 from ...models.renderer import Renderer, get_camera_from_batch
 from ...models.volume import BoundingBoxVolume, Volume
 from ...rendering.blender.constants import BASIC_AMBIENT_COLOR, BASIC_DIFFUSE_COLOR
-from ...rendering.mc import marching_cubes
-from ...rendering.torch_mesh import TorchMesh
+from ...rendering.mc import marching_cubes_batched
+from ...rendering.torch_mesh import PackedTorchMesh, TorchMesh
 from ...rendering.view_data import ProjectiveCamera
+from ...util.cancellation import check_cancelled
 from ...util.collections import AttrDict
 
 from .base import Model
+from .grid_cache import query_grid_cache
 
 
 class STFRendererBase(ABC):
@@ -103,6 +106,50 @@ class STFRenderer(Renderer, STFRendererBase):
             device=self.device,
         )
 
+    def extract_mesh(
+        self,
+        params: Optional[Dict] = None,
+        options: Optional[Dict] = None,
+        grid_size: Optional[int] = None,
+        query_batch_size: int = 4096,
+        coarse_stride: Optional[int] = None,
+        coarse_band: float = 1.0,
+        memory_budget: Optional[int] = None,
+    ) -> List[TorchMesh]:
+        """
+        Decode meta parameters directly to textured meshes without rendering
+        any views.
+
+        :param params: batched meta parameters, e.g. from bottleneck_to_params().
+        :param grid_size: SDF sampling resolution. Defaults to self.grid_size.
+        :param coarse_stride: if specified, sample the SDF coarse-to-fine with
+            this stride. See _query_sdf_grid_coarse_to_fine().
+        :param coarse_band: see _query_sdf_grid_coarse_to_fine().
+        :param memory_budget: if specified, the approximate number of bytes
+            that SDF queries may use at once. See _query_sdf_points().
+        :return: one mesh per element of the meta batch.
+        """
+        batch_size = _meta_batch_size(params)
+        params = self.update(params)
+        options = AttrDict() if not options else AttrDict(options)
+
+        return extract_meshes_from_stf(
+            options,
+            sdf_fn=partial(self.sdf.forward_batched, params=subdict(params, "sdf")),
+            tf_fn=partial(self.tf.forward_batched, params=subdict(params, "tf")),
+            nerstf_fn=None,
+            volume=self.volume,
+            grid_size=grid_size or self.grid_size,
+            batch_size=batch_size,
+            query_batch_size=query_batch_size,
+            texture_channels=self.texture_channels,
+            output_srgb=self.output_srgb,
+            coarse_stride=coarse_stride,
+            coarse_band=coarse_band,
+            memory_budget=memory_budget,
+            posenc_versions=field_posenc_versions(self.sdf),
+        )
+
     def get_signed_distance(
         self,
         query: Query,
@@ -167,9 +214,6 @@ def render_views_from_stf(
     assert camera.x_fov == camera.y_fov, "only square views are supported"
     assert isinstance(camera, DifferentiableProjectiveCamera)
 
-    device = camera.origin.device
-    device_type = device.type
-
     TO_CACHE = ["fields", "raw_meshes", "raw_signed_distance", "raw_density", "mesh_mask", "meshes"]
     if options.cache is not None and all(key in options.cache for key in TO_CACHE):
         fields = options.cache.fields
@@ -179,72 +223,32 @@ def render_views_from_stf(
         mesh_mask = options.cache.mesh_mask
     else:
         query_batch_size = batch.get("query_batch_size", batch.get("ray_batch_size", 4096))
-        query_points = volume_query_points(volume, grid_size)
-        fn = nerstf_fn if sdf_fn is None else sdf_fn
-        sdf_out = fn(
-            query=Query(position=query_points[None].repeat(batch_size, 1, 1)),
+        sdf_out, fields = _query_sdf_grid(
+            nerstf_fn if sdf_fn is None else sdf_fn,
+            options,
+            volume=volume,
+            grid_size=grid_size,
+            batch_size=batch_size,
             query_batch_size=query_batch_size,
-            options=options,
         )
         raw_signed_distance = sdf_out.signed_distance
         raw_density = None
         if "density" in sdf_out:
             raw_density = sdf_out.density
-        with torch.autocast(device_type, enabled=False):
-            fields = sdf_out.signed_distance.float()
-            raw_signed_distance = sdf_out.signed_distance
-            assert (
-                len(fields.shape) == 3 and fields.shape[-1] == 1
-            ), f"expected [meta_batch x inner_batch] SDF results, but got {fields.shape}"
-            fields = fields.reshape(batch_size, *([grid_size] * 3))
-
-            # Force a negative border around the SDFs to close off all the models.
-            full_grid = torch.zeros(
-                batch_size,
-                grid_size + 2,
-                grid_size + 2,
-                grid_size + 2,
-                device=fields.device,
-                dtype=fields.dtype,
-            )
-            full_grid.fill_(-1.0)
-            full_grid[:, 1:-1, 1:-1, 1:-1] = fields
-            fields = full_grid
-
-            raw_meshes = []
-            mesh_mask = []
-            for field in fields:
-                raw_mesh = marching_cubes(field, volume.bbox_min, volume.bbox_max - volume.bbox_min)
-                if len(raw_mesh.faces) == 0:
-                    # DDP deadlocks when there are unused parameters on some ranks
-                    # and not others, so we make sure the field is a dependency in
-                    # the graph regardless of empty meshes.
-                    vertex_dependency = field.mean()
-                    raw_mesh = TorchMesh(
-                        verts=torch.zeros(3, 3, device=device) + vertex_dependency,
-                        faces=torch.tensor([[0, 1, 2]], dtype=torch.long, device=device),
-                    )
-                    # Make sure we only feed back zero gradients to the field
-                    # by masking out the final renderings of this mesh.
-                    mesh_mask.append(False)
-                else:
-                    mesh_mask.append(True)
-                raw_meshes.append(raw_mesh)
-            mesh_mask = torch.tensor(mesh_mask, device=device)
-
-        max_vertices = max(len(m.verts) for m in raw_meshes)
-
-        fn = nerstf_fn if tf_fn is None else tf_fn
-        tf_out = fn(
-            query=Query(
-                position=torch.stack(
-                    [m.verts[torch.arange(0, max_vertices) % len(m.verts)] for m in raw_meshes],
-                    dim=0,
-                )
-            ),
+        packed_meshes, mesh_mask = _fields_to_meshes(fields, volume)
+
+        tf_out = _query_vertex_textures(
+            nerstf_fn if tf_fn is None else tf_fn,
+            options,
+            raw_meshes=packed_meshes,
             query_batch_size=query_batch_size,
-            options=options,
         )
+        if output_srgb:
+            tf_out.channels = _convert_srgb_to_linear(tf_out.channels)
+
+        # Make sure the raw meshes have colors.
+        _set_vertex_channels(packed_meshes, tf_out.channels, texture_channels)
+        raw_meshes = packed_meshes.unpack()
 
         if "cache" in options:
             options.cache.fields = fields
@@ -253,19 +257,6 @@ def render_views_from_stf(
             options.cache.raw_density = raw_density
             options.cache.mesh_mask = mesh_mask
 
-    if output_srgb:
-        tf_out.channels = _convert_srgb_to_linear(tf_out.channels)
-
-    # Make sure the raw meshes have colors.
-    with torch.autocast(device_type, enabled=False):
-        textures = tf_out.channels.float()
-        assert len(textures.shape) == 3 and textures.shape[-1] == len(
-            texture_channels
-        ), f"expected [meta_batch x inner_batch x texture_channels] field results, but got {textures.shape}"
-        for m, texture in zip(raw_meshes, textures):
-            texture = texture[: len(m.verts)]
-            m.vertex_channels = {name: ch for name, ch in zip(texture_channels, texture.unbind(-1))}
-
     args = dict(
         options=options,
         texture_channels=texture_channels,
@@ -312,6 +303,434 @@ def render_views_from_stf(
     return out
 
 
+def extract_meshes_from_stf(
+    options: AttrDict[str, Any],
+    *,
+    sdf_fn: Optional[Callable],
+    tf_fn: Optional[Callable],
+    nerstf_fn: Optional[Callable],
+    volume: BoundingBoxVolume,
+    grid_size: int,
+    batch_size: int,
+    query_batch_size: int = 4096,
+    texture_channels: Sequence[str] = ("R", "G", "B"),
+    output_srgb: bool = False,
+    coarse_stride: Optional[int] = None,
+    coarse_band: float = 1.0,
+    memory_budget: Optional[int] = None,
+    posenc_versions: Sequence[str] = (),
+) -> List[TorchMesh]:
+    """
+    Like render_views_from_stf(), but only produce the textured meshes and
+    skip cameras, lighting, rasterization and auxiliary losses entirely.
+
+    :param options: controls checkpointing and caching of the field models.
+        If it has a cancel_token, that is checked between SDF query chunks and
+        before and after marching cubes.
+    :param sdf_fn: returns [batch_size, query_batch_size, n_output] where
+        n_output >= 1.
+    :param tf_fn: returns [batch_size, query_batch_size, n_channels]
+    :param volume: AABB volume
+    :param grid_size: SDF sampling resolution
+    :param batch_size: the number of meshes encoded in the meta parameters.
+    :param coarse_stride: if specified, only sample the SDF at full resolution
+        near the surface found on a grid with this stride. Unlike rendering,
+        extraction never needs the SDF everywhere. This is a heuristic, and
+        the mesh can differ from dense extraction; see
+        _query_sdf_grid_coarse_to_fine().
+    :param coarse_band: see _query_sdf_grid_coarse_to_fine().
+    :param memory_budget: if specified, stream SDF queries through sdf_fn in
+        chunks sized to use roughly this many bytes at once, instead of
+        querying every grid point in one call.
+    :param posenc_versions: the positional encodings used by the SDF model.
+        Grid positions and these encodings are taken from query_grid_cache()
+        where possible, rather than recomputed for every decode.
+    :return: a list of batch_size meshes with per-vertex texture channels.
+    """
+    if options.cache is None:
+        # Share one cache across every chunked query of this extraction, so
+        # that field models can resolve their weights once per mesh batch.
+        options = AttrDict(options)
+        options.cache = AttrDict()
+
+    if coarse_stride is None:
+        with torch.autocast(volume.bbox_min.device.type, enabled=False):
+            fields = _query_sdf_points(
+                nerstf_fn if sdf_fn is None else sdf_fn,
+                options,
+                volume=volume,
+                grid_size=grid_size,
+                batch_size=batch_size,
+                query_batch_size=query_batch_size,
+                memory_budget=memory_budget,
+                cache_key="dense",
+                posenc_versions=posenc_versions,
+            )
+            fields = _pad_fields(fields.reshape(batch_size, *([grid_size] * 3)))
+    else:
+        fields = _query_sdf_grid_coarse_to_fine(
+            nerstf_fn if sdf_fn is None else sdf_fn,
+            options,
+            volume=volume,
+            grid_size=grid_size,
+            batch_size=batch_size,
+            query_batch_size=query_batch_size,
+            coarse_stride=coarse_stride,
+            coarse_band=coarse_band,
+            memory_budget=memory_budget,
+            posenc_versions=posenc_versions,
+        )
+    check_cancelled(options.cancel_token)
+    raw_meshes, _ = _fields_to_meshes(fields, volume)
+    check_cancelled(options.cancel_token)
+    tf_out = _query_vertex_textures(
+        nerstf_fn if tf_fn is None else tf_fn,
+        options,
+        raw_meshes=raw_meshes,
+        query_batch_size=query_batch_size,
+    )
+    channels = tf_out.channels
+    if output_srgb:
+        # Keep the same vertex colors that render_views_from_stf() attaches
+        # to its raw meshes.
+        channels = _convert_srgb_to_linear(channels)
+    _set_vertex_channels(raw_meshes, channels, texture_channels)
+    return raw_meshes.unpack()
+
+
+def _query_sdf_grid(
+    fn: Callable,
+    options: AttrDict[str, Any],
+    *,
+    volume: BoundingBoxVolume,
+    grid_size: int,
+    batch_size: int,
+    query_batch_size: int,
+) -> Tuple[AttrDict, torch.Tensor]:
+    """
+    Evaluate the SDF on a dense grid inside the volume.
+
+    :return: a tuple (sdf_out, fields), where fields is a float tensor of
+        shape [batch_size, grid_size + 2, grid_size + 2, grid_size + 2].
+    """
+    query_points = volume_query_points(volume, grid_size)
+    sdf_out = fn(
+        query=Query(position=query_points[None].repeat(batch_size, 1, 1)),
+        query_batch_size=query_batch_size,
+        options=options,
+    )
+    with torch.autocast(query_points.device.type, enabled=False):
+        fields = sdf_out.signed_distance.float()
+        assert (
+            len(fields.shape) == 3 and fields.shape[-1] == 1
+        ), f"expected [meta_batch x inner_batch] SDF results, but got {fields.shape}"
+        fields = fields.reshape(batch_size, *([grid_size] * 3))
+        full_grid = _pad_fields(fields)
+    return sdf_out, full_grid
+
+
+def _query_sdf_grid_coarse_to_fine(
+    fn: Callable,
+    options: AttrDict[str, Any],
+    *,
+    volume: BoundingBoxVolume,
+    grid_size: int,
+    batch_size: int,
+    query_batch_size: int,
+    coarse_stride: int,
+    coarse_band: float = 1.0,
+    memory_budget: Optional[int] = None,
+    posenc_versions: Sequence[str] = (),
+) -> torch.Tensor:
+    """
+    Like _query_sdf_grid(), but only evaluate the SDF at full resolution
+    close to the surface.
+
+    The SDF is first evaluated on every coarse_stride-th grid point. Coarse
+    cells whose corners change sign, or come within a band of the surface,
+    are then evaluated at every grid point inside them. Everywhere else, the
+    field is trilinearly interpolated from the coarse samples.
+
+    This is a heuristic that assumes a roughly 1-Lipschitz field. For an
+    exact SDF, the surface cannot reach a cell whose corners are all farther
+    from it than half the cell diagonal, so the skipped cells hold no part
+    of the surface and marching cubes produces the same mesh as on the
+    dense grid. Learned SDFs are not exact, so small features inside
+    skipped cells can be missed and the mesh can differ from the dense one.
+
+    :param coarse_band: the distance from the surface at which coarse cells
+        are refined, in coarse cell diagonals. The default of 1 is twice
+        what an exact SDF needs; larger values trade speed for agreement
+        with dense extraction on less regular fields.
+    :param memory_budget: see _query_sdf_points().
+    :param posenc_versions: see _query_sdf_points(). Only the coarse samples
+        are cached, since the refined points depend on the surface.
+    :return: a float tensor of shape
+        [batch_size, grid_size + 2, grid_size + 2, grid_size + 2].
+    """
+    device = volume.bbox_min.device
+    size = volume.bbox_max - volume.bbox_min
+    band = coarse_band * float((size / (grid_size - 1) * coarse_stride).norm())
+
+    query = partial(
+        _query_sdf_points,
+        fn,
+        options,
+        volume=volume,
+        grid_size=grid_size,
+        batch_size=batch_size,
+        query_batch_size=query_batch_size,
+        memory_budget=memory_budget,
+        posenc_versions=posenc_versions,
+    )
+
+    # Coarse samples include the last grid point, so the last coarse cell may
+    # be narrower than the others.
+    coarse_idx = torch.arange(0, grid_size, coarse_stride, device=device)
+    if coarse_idx[-1] != grid_size - 1:
+        coarse_idx = torch.cat([coarse_idx, coarse_idx.new_tensor([grid_size - 1])])
+    num_coarse = len(coarse_idx)
+
+    with torch.autocast(device.type, enabled=False):
+        coarse_flat = (
+            coarse_idx[:, None, None] * grid_size**2
+            + coarse_idx[None, :, None] * grid_size
+            + coarse_idx[None, None, :]
+        )
+        coarse = query(flat_indices=coarse_flat.reshape(-1), cache_key=("coarse", coarse_stride))
+        coarse = coarse.reshape(batch_size, *([num_coarse] * 3))
+
+        # Gather the 8 corners of every coarse cell.
+        corners = torch.stack(
+            [
+                coarse[:, x : num_coarse - 1 + x, y : num_coarse - 1 + y, z : num_coarse - 1 + z]
+                for x in range(2)
+                for y in range(2)
+                for z in range(2)
+            ],
+            dim=1,
+        )
+        inside = corners > 0
+        crossing = inside.any(dim=1) & ~inside.all(dim=1)
+        near = corners.abs().amin(dim=1) < band
+        active = (crossing | near).any(dim=0)
+
+        # Map every grid point to the coarse cell it lies in.
+        fine_idx = torch.arange(grid_size, device=device)
+        cell = (fine_idx // coarse_stride).clamp(max=num_coarse - 2)
+        lo, hi = coarse_idx[cell], coarse_idx[cell + 1]
+        frac = (fine_idx - lo).float() / (hi - lo).float()
+
+        fields = coarse
+        for dim in range(1, 4):
+            shape = [1, 1, 1, 1]
+            shape[dim] = grid_size
+            weight = frac.view(shape)
+            fields = fields.index_select(dim, cell) * (1 - weight) + fields.index_select(
+                dim, cell + 1
+            ) * weight
+
+        # Points on the far faces of active cells belong to the next cell, so
+        # grow the mask by one point to include them.
+        fine_active = active[cell[:, None, None], cell[None, :, None], cell[None, None, :]]
+        fine_active = (
+            F.max_pool3d(fine_active[None, None].float(), 3, stride=1, padding=1)[0, 0] > 0
+        )
+        refine_idx = fine_active.view(-1).nonzero()[:, 0]
+        if len(refine_idx):
+            fields.view(batch_size, -1)[:, refine_idx] = query(flat_indices=refine_idx)
+
+        return _pad_fields(fields)
+
+
+# Cached grid chunks always have this many points, so that decodes with
+# different meta batch sizes or memory budgets still share them.
+_GRID_CACHE_CHUNK_SIZE = 2**15
+
+# Rough peak memory of querying one point for one meta-batch element. The
+# hidden activations of the field MLPs dominate, far ahead of the position
+# and output tensors.
+_QUERY_BYTES_PER_POINT = 4096
+
+
+def _query_sdf_points(
+    fn: Callable,
+    options: AttrDict[str, Any],
+    *,
+    volume: BoundingBoxVolume,
+    grid_size: int,
+    batch_size: int,
+    query_batch_size: int,
+    flat_indices: Optional[torch.Tensor] = None,
+    memory_budget: Optional[int] = None,
+    cache_key: Optional[Hashable] = None,
+    posenc_versions: Sequence[str] = (),
+) -> torch.Tensor:
+    """
+    Evaluate the SDF at points of a dense grid inside the volume.
+
+    Unlike _query_sdf_grid(), positions are generated and queried chunk by
+    chunk, so neither the full grid of positions nor the full set of field
+    outputs is ever materialized for the whole meta batch at once.
+
+    :param flat_indices: a 1-D long tensor of indices into the flattened
+        [grid_size x grid_size x grid_size] grid. Defaults to every point.
+    :param memory_budget: the approximate number of bytes a chunk may use.
+        Chunks also bound query_batch_size. If None, query every point in a
+        single call to fn.
+    :param cache_key: if specified, flat_indices only depends on this key and
+        the arguments of this function, so the positions of every chunk and
+        their encodings can be stored in query_grid_cache(). Caching needs
+        chunks of a fixed size, so it is skipped for small memory budgets.
+    :param posenc_versions: the positional encodings to cache and pass to fn
+        through Query.position_encoding.
+    :return: a float tensor of shape [batch_size, num_points].
+    """
+    device = volume.bbox_min.device
+    num_points = grid_size**3 if flat_indices is None else len(flat_indices)
+    chunk_size = max(num_points, 1)
+    if memory_budget is not None:
+        chunk_size = max(1, memory_budget // (batch_size * _QUERY_BYTES_PER_POINT))
+        query_batch_size = min(query_batch_size, chunk_size)
+
+    if cache_key is not None and chunk_size >= _GRID_CACHE_CHUNK_SIZE:
+        chunk_size = _GRID_CACHE_CHUNK_SIZE
+        cache_key = (
+            cache_key,
+            grid_size,
+            tuple(volume.bbox_min.tolist()),
+            tuple(volume.bbox_max.tolist()),
+            str(device),
+            tuple(sorted(posenc_versions)),
+        )
+    else:
+        cache_key = None
+
+    def query_points(start: int, end: int) -> Tuple[torch.Tensor, Dict[str, torch.Tensor]]:
+        if flat_indices is None:
+            indices = torch.arange(start, end, device=device)
+        else:
+            indices = flat_indices[start:end]
+        positions = grid_query_points(volume, grid_size, indices)
+        encodings = {
+            version: encode_position(version, position=positions)[None]
+            for version in posenc_versions
+        }
+        return positions, encodings
+
+    fields = torch.empty(batch_size, num_points, device=device)
+    for start in range(0, num_points, chunk_size):
+        check_cancelled(options.cancel_token)
+        end = min(start + chunk_size, num_points)
+        if cache_key is None:
+            positions, encodings = query_points(start, end)
+        else:
+            positions, encodings = query_grid_cache().get(
+                (*cache_key, start, end), partial(query_points, start, end)
+            )
+        sdf_out = fn(
+            query=Query(
+                position=positions[None].repeat(batch_size, 1, 1),
+                position_encoding=encodings or None,
+            ),
+            query_batch_size=query_batch_size,
+            options=options,
+        )
+        signed_distance = sdf_out.signed_distance
+        assert (
+            len(signed_distance.shape) == 3 and signed_distance.shape[-1] == 1
+        ), f"expected [meta_batch x inner_batch] SDF results, but got {signed_distance.shape}"
+        fields[:, start:end] = signed_distance[..., 0]
+    return fields
+
+
+def _pad_fields(fields: torch.Tensor) -> torch.Tensor:
+    """
+    Force a negative border around the SDFs to close off all the models.
+    """
+    batch_size, *grid_shape = fields.shape
+    full_grid = torch.zeros(
+        batch_size,
+        *[n + 2 for n in grid_shape],
+        device=fields.device,
+        dtype=fields.dtype,
+    )
+    full_grid.fill_(-1.0)
+    full_grid[:, 1:-1, 1:-1, 1:-1] = fields
+    return full_grid
+
+
+def _fields_to_meshes(
+    fields: torch.Tensor, volume: BoundingBoxVolume
+) -> Tuple[PackedTorchMesh, torch.Tensor]:
+    """
+    Run marching cubes on all fields of a [batch_size x X x Y x Z] tensor at
+    once.
+
+    :return: a tuple (raw_meshes, mesh_mask), where mesh_mask is False for
+        fields that produced an empty mesh.
+    """
+    device = fields.device
+    with torch.autocast(device.type, enabled=False):
+        raw_meshes = marching_cubes_batched(
+            fields, volume.bbox_min, volume.bbox_max - volume.bbox_min
+        )
+        # Make sure we only feed back zero gradients to the field by masking
+        # out the final renderings of empty meshes.
+        mesh_mask = raw_meshes.face_offsets.diff() > 0
+        if not mesh_mask.all():
+            meshes = raw_meshes.unpack()
+            for i in (~mesh_mask).nonzero()[:, 0].tolist():
+                # DDP deadlocks when there are unused parameters on some ranks
+                # and not others, so we make sure the field is a dependency in
+                # the graph regardless of empty meshes.
+                vertex_dependency = fields[i].mean()
+                meshes[i] = TorchMesh(
+                    verts=torch.zeros(3, 3, device=device) + vertex_dependency,
+                    faces=torch.tensor([[0, 1, 2]], dtype=torch.long, device=device),
+                )
+            raw_meshes = PackedTorchMesh.pack(meshes)
+    return raw_meshes, mesh_mask
+
+
+def _query_vertex_textures(
+    fn: Callable,
+    options: AttrDict[str, Any],
+    *,
+    raw_meshes: PackedTorchMesh,
+    query_batch_size: int,
+) -> AttrDict:
+    """
+    Query fn at every vertex of the packed meshes, with each mesh using its
+    own meta parameters.
+
+    :return: the outputs of fn, packed like raw_meshes.verts.
+    """
+    mesh_indices, local_indices = raw_meshes.vertex_batch_indices()
+    max_vertices = int(raw_meshes.vertex_offsets.diff().max())
+    position = raw_meshes.verts.new_zeros(len(raw_meshes), max_vertices, 3)
+    position[mesh_indices, local_indices] = raw_meshes.verts
+    out = fn(
+        query=Query(position=position),
+        query_batch_size=query_batch_size,
+        options=options,
+    )
+    return out.map(lambda _, v: v[mesh_indices, local_indices])
+
+
+def _set_vertex_channels(
+    raw_meshes: PackedTorchMesh, channels: torch.Tensor, texture_channels: Sequence[str]
+):
+    with torch.autocast(channels.device.type, enabled=False):
+        textures = channels.float()
+        assert len(textures.shape) == 2 and textures.shape[-1] == len(
+            texture_channels
+        ), f"expected [num_vertices x texture_channels] field results, but got {textures.shape}"
+        raw_meshes.vertex_channels = {
+            name: ch for name, ch in zip(texture_channels, textures.unbind(-1))
+        }
+
+
 def _render_with_pytorch3d(
     options: AttrDict,
     texture_channels: Sequence[str],
@@ -418,7 +837,9 @@ def _render_with_raycast(
                 TorchTriMesh(
                     faces=mesh.faces.long(),
                     vertices=mesh.verts.float(),
-                    vertex_colors=tf_out.channels[i, : len(mesh.verts)].float(),
+                    vertex_colors=torch.stack(
+                        [mesh.vertex_channels[name] for name in texture_channels], dim=-1
+                    ),
                 )
             )
         all_images = []
@@ -492,12 +913,43 @@ def slice_fields(fields: torch.Tensor, dim: int, start: int, end: int):
         raise ValueError(f"cannot slice dimension {dim}")
 
 
+def field_posenc_versions(*models: Optional[Model]) -> Tuple[str, ...]:
+    """
+    Collect the positional encodings that some field models apply to their
+    query positions, skipping models without one.
+    """
+    versions = {getattr(model, "posenc_version", None) for model in models}
+    return tuple(sorted(v for v in versions if v is not None))
+
+
+def _meta_batch_size(params: Optional[Dict[str, torch.Tensor]]) -> int:
+    """
+    Infer the meta batch size from batched meta parameters, which all have a
+    leading batch dimension before being merged with the module defaults.
+    """
+    if not params:
+        return 1
+    return next(iter(params.values())).shape[0]
+
+
 def volume_query_points(
     volume: Volume,
     grid_size: int,
 ):
     assert isinstance(volume, BoundingBoxVolume)
     indices = torch.arange(grid_size**3, device=volume.bbox_min.device)
+    return grid_query_points(volume, grid_size, indices)
+
+
+def grid_query_points(
+    volume: BoundingBoxVolume,
+    grid_size: int,
+    indices: torch.Tensor,
+) -> torch.Tensor:
+    """
+    Compute the positions of some points of volume_query_points(), given
+    their indices into the flattened grid.
+    """
     zs = indices % grid_size
     ys = torch.div(indices, grid_size, rounding_mode="trunc") % grid_size
     xs = torch.div(indices, grid_size**2, rounding_mode="trunc") % grid_size
@@ -0,0 +1,217 @@
+import json
+import struct
+from typing import BinaryIO, Optional, Tuple
+
+import numpy as np
+
+from ..util.io import buffered_writer
+from .meshopt import encode_index_sequence, encode_vertex_buffer
+
+GLB_MAGIC = b"glTF"
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+UNSIGNED_BYTE = 5121
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+
+def write_glb(
+    raw_f: BinaryIO,
+    coords: np.ndarray,
+    faces: np.ndarray,
+    rgb: Optional[np.ndarray] = None,
+    compress: bool = False,
+):
+    """
+    Write a binary glTF file with quantized attributes (KHR_mesh_quantization).
+
+    Positions are stored as 16-bit integers within the mesh bounding box, with
+    the node transform mapping them back; colors as normalized 8-bit values.
+    Triangles and vertices are reordered for locality first.
+
+    :param coords: an [N x 3] array of floating point coordinates.
+    :param faces: an [M x 3] array of triangles encoded as integer indices.
+    :param rgb: an [N x 3] array of vertex colors, in the range [0.0, 1.0],
+                or as uint8 in the range [0, 255].
+    :param compress: if True, also encode the buffers with the meshoptimizer
+                     codecs (EXT_meshopt_compression). Loaders then need a
+                     meshopt decoder.
+    """
+    vertex_order, faces = optimize_locality(coords, faces)
+    coords = coords[vertex_order]
+    positions, translation, scale = quantize_positions(coords)
+
+    attributes = [("POSITION", positions)]
+    if rgb is not None:
+        rgb = rgb[vertex_order]
+        if rgb.dtype != np.uint8:
+            rgb = (rgb * 255.499).round().astype(np.uint8)
+        attributes.append(("COLOR_0", rgb))
+
+    index_type = np.uint16 if len(coords) <= np.iinfo(np.uint16).max else np.uint32
+    indices = faces.astype(index_type).reshape(-1)
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "meshmind"},
+        "extensionsUsed": ["KHR_mesh_quantization"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0, "translation": translation, "scale": [scale] * 3}],
+        "meshes": [{"primitives": [{"attributes": {}, "indices": None}]}],
+        "accessors": [],
+        "bufferViews": [],
+        "buffers": [],
+    }
+    primitive = gltf["meshes"][0]["primitives"][0]
+
+    # Vertex attributes get one bufferView each, padded to a 4-byte stride.
+    views = []
+    for name, values in attributes:
+        row_bytes = values.itemsize * values.shape[1]
+        data = np.zeros((len(values), -(-row_bytes // 4) * 4), dtype=np.uint8)
+        data[:, :row_bytes] = values.view(np.uint8).reshape(len(values), row_bytes)
+        view = {"byteStride": data.shape[1], "target": ARRAY_BUFFER}
+        views.append((view, data, "ATTRIBUTES"))
+        accessor = {
+            "bufferView": len(views) - 1,
+            "componentType": UNSIGNED_SHORT if values.dtype == np.uint16 else UNSIGNED_BYTE,
+            "count": len(values),
+            "type": "VEC3",
+        }
+        if name == "POSITION":
+            accessor["min"] = values.min(axis=0).tolist() if len(values) else [0] * 3
+            accessor["max"] = values.max(axis=0).tolist() if len(values) else [0] * 3
+        else:
+            accessor["normalized"] = True
+        primitive["attributes"][name] = len(gltf["accessors"])
+        gltf["accessors"].append(accessor)
+
+    views.append(({"target": ELEMENT_ARRAY_BUFFER}, indices, "INDICES"))
+    primitive["indices"] = len(gltf["accessors"])
+    gltf["accessors"].append(
+        {
+            "bufferView": len(views) - 1,
+            "componentType": UNSIGNED_SHORT if index_type == np.uint16 else UNSIGNED_INT,
+            "count": len(indices),
+            "type": "SCALAR",
+        }
+    )
+
+    # Lay out the views in the (fallback) buffer, and in compressed form.
+    chunks = []
+    offset = 0
+    for view, data, mode in views:
+        view.update(buffer=0, byteOffset=offset, byteLength=data.nbytes)
+        offset += -(-data.nbytes // 4) * 4
+        if compress:
+            if mode == "ATTRIBUTES":
+                encoded = encode_vertex_buffer(data)
+                stride = data.shape[1]
+            else:
+                encoded = encode_index_sequence(data)
+                stride = data.itemsize
+            view["buffer"] = 1
+            view["extensions"] = {
+                "EXT_meshopt_compression": {
+                    "buffer": 0,
+                    "byteOffset": sum(len(c) for c in chunks),
+                    "byteLength": len(encoded),
+                    "byteStride": stride,
+                    "count": len(data),
+                    "mode": mode,
+                }
+            }
+            chunks.append(_pad(encoded, b"\0"))
+        else:
+            chunks.append(_pad(data.tobytes(), b"\0"))
+        gltf["bufferViews"].append(view)
+
+    body = b"".join(chunks)
+    gltf["buffers"].append({"byteLength": len(body)})
+    if compress:
+        # The uncompressed buffer is left out of the file, so the extension
+        # is required rather than an optional way to skip it.
+        gltf["buffers"].append(
+            {"byteLength": offset, "extensions": {"EXT_meshopt_compression": {"fallback": True}}}
+        )
+        for key in ("extensionsUsed", "extensionsRequired"):
+            gltf[key].append("EXT_meshopt_compression")
+
+    header = _pad(json.dumps(gltf, separators=(",", ":")).encode("utf-8"), b" ")
+    with buffered_writer(raw_f) as f:
+        length = 12 + 8 + len(header) + 8 + len(body)
+        f.write(struct.pack("<4sII", GLB_MAGIC, GLB_VERSION, length))
+        f.write(struct.pack("<II", len(header), CHUNK_JSON))
+        f.write(header)
+        f.write(struct.pack("<II", len(body), CHUNK_BIN))
+        f.write(body)
+
+
+def quantize_positions(coords: np.ndarray) -> Tuple[np.ndarray, list, float]:
+    """
+    Quantize coordinates to 16-bit integers spanning the bounding box, with
+    one scale for all axes to keep the mesh's proportions exact.
+
+    :return: a tuple (positions, translation, scale) such that
+             coords ~= positions * scale + translation.
+    """
+    if not len(coords):
+        return np.zeros((0, 3), dtype=np.uint16), [0.0] * 3, 1.0
+    lo = coords.min(axis=0)
+    extent = float((coords.max(axis=0) - lo).max())
+    scale = extent / np.iinfo(np.uint16).max if extent > 0 else 1.0
+    positions = np.clip(np.round((coords - lo) / scale), 0, np.iinfo(np.uint16).max)
+    return positions.astype(np.uint16), lo.tolist(), scale
+
+
+def optimize_locality(coords: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sort triangles along a Morton curve through their centroids, so that
+    neighbouring triangles share vertices while those are still in the GPU's
+    vertex cache, then number vertices in the order triangles first use them.
+    Both orders also make the index deltas small for compression.
+
+    Vertices no triangle uses are dropped.
+
+    :return: a tuple (vertex_order, faces), where the new vertex i is the old
+             vertex vertex_order[i] and faces index the new vertices.
+    """
+    if not len(faces):
+        return np.zeros(0, dtype=np.int64), faces.reshape(0, 3)
+    centroids = coords[faces].mean(axis=1)
+    lo = centroids.min(axis=0)
+    extent = np.maximum(centroids.max(axis=0) - lo, 1e-12)
+    cells = ((centroids - lo) / extent * 1023).astype(np.uint32)
+    keys = (
+        _spread_bits(cells[:, 0])
+        | (_spread_bits(cells[:, 1]) << 1)
+        | (_spread_bits(cells[:, 2]) << 2)
+    )
+    faces = faces[np.argsort(keys, kind="stable")]
+
+    used, first_use = np.unique(faces.reshape(-1), return_index=True)
+    vertex_order = used[np.argsort(first_use)]
+    remap = np.zeros(len(coords), dtype=np.int64)
+    remap[vertex_order] = np.arange(len(vertex_order))
+    return vertex_order, remap[faces]
+
+
+def _spread_bits(x: np.ndarray) -> np.ndarray:
+    """
+    Interleave two zero bits after each of the low 10 bits of x.
+    """
+    x = x & 0x3FF
+    x = (x | (x << 16)) & 0x030000FF
+    x = (x | (x << 8)) & 0x0300F00F
+    x = (x | (x << 4)) & 0x030C30C3
+    x = (x | (x << 2)) & 0x09249249
+    return x
+
+
+def _pad(data: bytes, fill: bytes) -> bytes:
+    return data + fill * (-len(data) % 4)
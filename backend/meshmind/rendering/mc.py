@@ -5,7 +5,7 @@ from typing import Tuple
 import torch
 
 from ._mc_table import MC_TABLE
-from .torch_mesh import TorchMesh
+from .torch_mesh import PackedTorchMesh, TorchMesh
 
 
 def marching_cubes(
@@ -25,92 +25,73 @@ def marching_cubes(
                  (0, 0, 0) field corner and the (-1, -1, -1) field corner.
     """
     assert len(field.shape) == 3, "input must be a 3D scalar field"
-    dev = field.device
+    return marching_cubes_batched(field[None], min_point, size).unpack()[0]
 
-    grid_size = field.shape
+
+def marching_cubes_batched(
+    fields: torch.Tensor,
+    min_point: torch.Tensor,
+    size: torch.Tensor,
+) -> PackedTorchMesh:
+    """
+    Like marching_cubes(), but for a batch of fields at once.
+
+    :param fields: a [batch_size x X x Y x Z] tensor of field values.
+    :param min_point: see marching_cubes().
+    :param size: see marching_cubes().
+    :return: the packed meshes. Each mesh is the same as marching_cubes()
+             would produce for its field.
+    """
+    assert len(fields.shape) == 4, "input must be a batch of 3D scalar fields"
+    dev = fields.device
+
+    batch_size, *grid_size = fields.shape
+    grid_size = tuple(grid_size)
     grid_size_tensor = torch.tensor(grid_size).to(size)
     lut = _lookup_table(dev)
 
     # Create bitmasks between 0 and 255 (inclusive) indicating the state
     # of the eight corners of each cube.
-    bitmasks = (field > 0).to(torch.uint8)
-    bitmasks = bitmasks[:-1, :, :] | (bitmasks[1:, :, :] << 1)
-    bitmasks = bitmasks[:, :-1, :] | (bitmasks[:, 1:, :] << 2)
-    bitmasks = bitmasks[:, :, :-1] | (bitmasks[:, :, 1:] << 4)
-
-    # Compute corner coordinates across the entire grid.
-    corner_coords = torch.empty(*grid_size, 3, device=dev, dtype=field.dtype)
-    corner_coords[range(grid_size[0]), :, :, 0] = torch.arange(
-        grid_size[0], device=dev, dtype=field.dtype
-    )[:, None, None]
-    corner_coords[:, range(grid_size[1]), :, 1] = torch.arange(
-        grid_size[1], device=dev, dtype=field.dtype
-    )[:, None]
-    corner_coords[:, :, range(grid_size[2]), 2] = torch.arange(
-        grid_size[2], device=dev, dtype=field.dtype
-    )
+    bitmasks = (fields > 0).to(torch.uint8)
+    bitmasks = bitmasks[:, :-1, :, :] | (bitmasks[:, 1:, :, :] << 1)
+    bitmasks = bitmasks[:, :, :-1, :] | (bitmasks[:, :, 1:, :] << 2)
+    bitmasks = bitmasks[:, :, :, :-1] | (bitmasks[:, :, :, 1:] << 4)
 
-    # Compute all vertices across all edges in the grid, even though we will
-    # throw some out later. We have (X-1)*Y*Z + X*(Y-1)*Z + X*Y*(Z-1) vertices.
-    # These are all midpoints, and don't account for interpolation (which is
-    # done later based on the used edge midpoints).
-    edge_midpoints = torch.cat(
-        [
-            ((corner_coords[:-1] + corner_coords[1:]) / 2).reshape(-1, 3),
-            ((corner_coords[:, :-1] + corner_coords[:, 1:]) / 2).reshape(-1, 3),
-            ((corner_coords[:, :, :-1] + corner_coords[:, :, 1:]) / 2).reshape(-1, 3),
-        ],
-        dim=0,
-    )
+    # Only cubes with corners on both sides of the surface produce triangles,
+    # and they form a thin shell, so everything below only scales with the
+    # surface area rather than the volume of the grid.
+    active = (bitmasks != 0) & (bitmasks != 255)
+    flat_cube_indices = active.nonzero()
+    cube_batch_indices = flat_cube_indices[:, 0]
+    # must cast to long for indexing to believe this not a mask
+    flat_bitmasks = bitmasks[active].long()
 
-    # Create a flat array of [X, Y, Z] indices for each cube.
-    cube_indices = torch.zeros(
-        grid_size[0] - 1, grid_size[1] - 1, grid_size[2] - 1, 3, device=dev, dtype=torch.long
-    )
-    cube_indices[range(grid_size[0] - 1), :, :, 0] = torch.arange(grid_size[0] - 1, device=dev)[
-        :, None, None
-    ]
-    cube_indices[:, range(grid_size[1] - 1), :, 1] = torch.arange(grid_size[1] - 1, device=dev)[
-        :, None
-    ]
-    cube_indices[:, :, range(grid_size[2] - 1), 2] = torch.arange(grid_size[2] - 1, device=dev)
-    flat_cube_indices = cube_indices.reshape(-1, 3)
-
-    # Create a flat array mapping each cube to 12 global edge indices.
-    edge_indices = _create_flat_edge_indices(flat_cube_indices, grid_size)
+    # Create a flat array mapping each active cube to 12 global edge indices.
+    # Edges of different fields are numbered one field after another.
+    num_edges = _num_edges(grid_size)
+    edge_indices = _create_flat_edge_indices(flat_cube_indices[:, 1:], grid_size)
+    edge_indices = edge_indices + (cube_batch_indices * num_edges)[:, None]
 
     # Apply the LUT to figure out the triangles.
-    flat_bitmasks = bitmasks.reshape(
-        -1
-    ).long()  # must cast to long for indexing to believe this not a mask
     local_tris = lut.cases[flat_bitmasks]
     local_masks = lut.masks[flat_bitmasks]
     # Compute the global edge indices for the triangles.
-    global_tris = torch.gather(
-        edge_indices, 1, local_tris.reshape(local_tris.shape[0], -1)
-    ).reshape(local_tris.shape)
+    global_tris = torch.gather(edge_indices, 1, local_tris.flatten(1)).reshape(local_tris.shape)
     # Select the used triangles for each cube.
     selected_tris = global_tris.reshape(-1, 3)[local_masks.reshape(-1)]
+    face_batch_indices = cube_batch_indices[:, None].expand(local_masks.shape)[local_masks]
 
-    # Now we have a bunch of indices into the full list of possible vertices,
-    # but we want to reduce this list to only the used vertices.
-    used_vertex_indices = torch.unique(selected_tris.view(-1))
-    used_edge_midpoints = edge_midpoints[used_vertex_indices]
-    old_index_to_new_index = torch.zeros(len(edge_midpoints), device=dev, dtype=torch.long)
-    old_index_to_new_index[used_vertex_indices] = torch.arange(
-        len(used_vertex_indices), device=dev, dtype=torch.long
-    )
-
-    # Rewrite the triangles to use the new indices
-    selected_tris = torch.gather(old_index_to_new_index, 0, selected_tris.view(-1)).reshape(
-        selected_tris.shape
-    )
+    # Now we have a bunch of indices into the full list of possible edges,
+    # but we want to reduce this list to only the used edges. These stay
+    # sorted, so vertices are grouped by field like the triangles.
+    used_edge_indices, selected_tris = torch.unique(selected_tris.view(-1), return_inverse=True)
+    selected_tris = selected_tris.reshape(-1, 3)
+    vert_batch_indices = torch.div(used_edge_indices, num_edges, rounding_mode="floor")
 
-    # Compute the actual interpolated coordinates corresponding to edge midpoints.
-    v1 = torch.floor(used_edge_midpoints).to(torch.long)
-    v2 = torch.ceil(used_edge_midpoints).to(torch.long)
-    s1 = field[v1[:, 0], v1[:, 1], v1[:, 2]]
-    s2 = field[v2[:, 0], v2[:, 1], v2[:, 2]]
+    # Compute the actual interpolated coordinates along the used edges.
+    v1, v2 = _edge_endpoints(used_edge_indices % num_edges, grid_size)
+    s1 = fields[vert_batch_indices, v1[:, 0], v1[:, 1], v1[:, 2]]
+    s2 = fields[vert_batch_indices, v2[:, 0], v2[:, 1], v2[:, 2]]
     p1 = (v1.float() / (grid_size_tensor - 1)) * size + min_point
     p2 = (v2.float() / (grid_size_tensor - 1)) * size + min_point
     # The signs of s1 and s2 should be different. We want to find
@@ -118,7 +99,56 @@ def marching_cubes(
     t = (s1 / (s1 - s2))[:, None]
     verts = t * p2 + (1 - t) * p1
 
-    return TorchMesh(verts=verts, faces=selected_tris)
+    return PackedTorchMesh(
+        verts=verts,
+        faces=selected_tris,
+        vertex_offsets=_batch_offsets(vert_batch_indices, batch_size),
+        face_offsets=_batch_offsets(face_batch_indices, batch_size),
+    )
+
+
+def _batch_offsets(batch_indices: torch.Tensor, batch_size: int) -> torch.Tensor:
+    counts = torch.bincount(batch_indices, minlength=batch_size)
+    return torch.cat([counts.new_zeros(1), counts.cumsum(0)])
+
+
+def _num_edges(grid_size: Tuple[int, int, int]) -> int:
+    return (
+        (grid_size[0] - 1) * grid_size[1] * grid_size[2]
+        + grid_size[0] * (grid_size[1] - 1) * grid_size[2]
+        + grid_size[0] * grid_size[1] * (grid_size[2] - 1)
+    )
+
+
+def _edge_endpoints(
+    edge_indices: torch.Tensor, grid_size: Tuple[int, int, int]
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Invert _create_flat_edge_indices(): map global edge indices to the grid
+    coordinates of their two endpoints.
+
+    :return: a tuple (v1, v2) of [N x 3] long tensors, where v1 is the lower
+             endpoint along the edge's axis.
+    """
+    dev = edge_indices.device
+    num_xs = (grid_size[0] - 1) * grid_size[1] * grid_size[2]
+    num_ys = grid_size[0] * (grid_size[1] - 1) * grid_size[2]
+
+    axis = (edge_indices >= num_xs).long() + (edge_indices >= num_xs + num_ys).long()
+    local = edge_indices - torch.tensor([0, num_xs, num_xs + num_ys], device=dev)[axis]
+    num_y = torch.tensor([grid_size[1], grid_size[1] - 1, grid_size[1]], device=dev)[axis]
+    num_z = torch.tensor([grid_size[2], grid_size[2], grid_size[2] - 1], device=dev)[axis]
+
+    v1 = torch.stack(
+        [
+            torch.div(local, num_y * num_z, rounding_mode="floor"),
+            torch.div(local, num_z, rounding_mode="floor") % num_y,
+            local % num_z,
+        ],
+        dim=-1,
+    )
+    v2 = v1 + torch.eye(3, device=dev, dtype=torch.long)[axis]
+    return v1, v2
 
 
 def _create_flat_edge_indices(
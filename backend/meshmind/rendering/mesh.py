@@ -1,9 +1,12 @@
+import io
 from dataclasses import dataclass, field
-from typing import BinaryIO, Dict, Optional, Union
+from typing import BinaryIO, Dict, Optional, TextIO, Union
 
 import blobfile as bf
 import numpy as np
 
+from ..util.io import buffered_writer
+from .gltf import write_glb
 from .ply_util import write_ply
 
 
@@ -87,21 +90,91 @@ class TriMesh:
             faces=self.faces,
         )
 
-    def write_obj(self, raw_f: BinaryIO):
-        if self.has_vertex_colors():
-            vertex_colors = np.stack([self.vertex_channels[x] for x in "RGB"], axis=1)
-            vertices = [
-                "{} {} {} {} {} {}".format(*coord, *color)
-                for coord, color in zip(self.verts.tolist(), vertex_colors.tolist())
-            ]
-        else:
-            vertices = ["{} {} {}".format(*coord) for coord in self.verts.tolist()]
+    def write_obj(self, raw_f: Union[BinaryIO, TextIO]):
+        write_obj(
+            raw_f,
+            coords=self.verts,
+            faces=self.faces,
+            rgb=(
+                np.stack([self.vertex_channels[x] for x in "RGB"], axis=1)
+                if self.has_vertex_colors()
+                else None
+            ),
+        )
 
-        faces = [
-            "f {} {} {}".format(str(tri[0] + 1), str(tri[1] + 1), str(tri[2] + 1))
-            for tri in self.faces.tolist()
-        ]
+    def write_stl(self, raw_f: BinaryIO):
+        write_stl(raw_f, coords=self.verts, faces=self.faces)
 
-        combined_data = ["v " + vertex for vertex in vertices] + faces
+    def write_glb(self, raw_f: BinaryIO, compress: bool = False):
+        write_glb(
+            raw_f,
+            coords=self.verts,
+            faces=self.faces,
+            rgb=(
+                np.stack([self.vertex_channels[x] for x in "RGB"], axis=1)
+                if self.has_vertex_colors()
+                else None
+            ),
+            compress=compress,
+        )
+
+
+# Rows formatted per string operation by write_obj().
+OBJ_CHUNK_SIZE = 65536
 
-        raw_f.writelines("\n".join(combined_data))
+
+def write_obj(
+    raw_f: Union[BinaryIO, TextIO],
+    coords: np.ndarray,
+    faces: np.ndarray,
+    rgb: Optional[np.ndarray] = None,
+):
+    """
+    Write a Wavefront OBJ file, formatting a chunk of rows per operation
+    rather than one row at a time.
+
+    :param raw_f: a binary or text file.
+    :param coords: an [N x 3] array of floating point coordinates, written
+                   with 9 significant digits (exact for float32).
+    :param faces: an [M x 3] array of triangles encoded as integer indices.
+    :param rgb: an [N x 3] array of vertex colors, in the range [0.0, 1.0].
+    """
+    text = isinstance(raw_f, io.TextIOBase)
+    if rgb is not None:
+        vertex_rows = np.concatenate([coords, rgb], axis=1)
+        vertex_format = "v %.9g %.9g %.9g %.6g %.6g %.6g\n"
+    else:
+        vertex_rows = coords
+        vertex_format = "v %.9g %.9g %.9g\n"
+    blocks = [(vertex_format, vertex_rows.astype(np.float64)), ("f %d %d %d\n", faces + 1)]
+
+    for row_format, rows in blocks:
+        for start in range(0, len(rows), OBJ_CHUNK_SIZE):
+            chunk = rows[start : start + OBJ_CHUNK_SIZE]
+            data = (row_format * len(chunk)) % tuple(chunk.ravel().tolist())
+            raw_f.write(data if text else data.encode("ascii"))
+
+
+def write_stl(raw_f: BinaryIO, coords: np.ndarray, faces: np.ndarray):
+    """
+    Write a binary STL file, with all triangle records packed as one
+    structured array.
+
+    :param coords: an [N x 3] array of floating point coordinates.
+    :param faces: an [M x 3] array of triangles encoded as integer indices.
+    """
+    tris = np.asarray(coords, dtype=np.float32)[faces]
+    normals = np.cross(tris[:, 1] - tris[:, 0], tris[:, 2] - tris[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    records = np.zeros(
+        len(faces),
+        dtype=[("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")],
+    )
+    records["normal"] = normals
+    records["vertices"] = tris
+    with buffered_writer(raw_f) as f:
+        f.write(b"binary STL".ljust(80, b" "))
+        f.write(np.uint32(len(faces)).tobytes())
+        f.write(records.tobytes())
@@ -0,0 +1,170 @@
+"""
+Encoders for the meshoptimizer vertex and index codecs, as used by the glTF
+EXT_meshopt_compression extension. The encoded streams are byte-oriented and
+compress well with a general purpose compressor (e.g. gzip over HTTP) on top.
+
+Both encoders work on whole arrays at once rather than vertex by vertex, and
+produce streams that any meshoptimizer decoder accepts.
+"""
+import numpy as np
+
+VERTEX_HEADER = 0xA0  # version 0
+INDEX_SEQUENCE_HEADER = 0xD1  # version 1
+
+BYTE_GROUP_SIZE = 16
+VERTEX_BLOCK_SIZE_BYTES = 8192
+VERTEX_BLOCK_MAX_SIZE = 256
+TAIL_MAX_SIZE = 32
+
+
+def encode_vertex_buffer(data: np.ndarray) -> bytes:
+    """
+    Encode vertex attributes with the meshoptimizer vertex codec (the
+    ATTRIBUTES mode of EXT_meshopt_compression).
+
+    Each byte of the vertex is delta coded against the previous vertex, and
+    the deltas are bit-packed in groups of 16 with 0, 2, 4 or 8 bits each.
+
+    :param data: an [N x stride] uint8 array holding one vertex per row, with
+                 stride a multiple of 4 of at most 256 bytes.
+    :return: the encoded stream.
+    """
+    count, stride = data.shape
+    assert stride % 4 == 0 and stride <= 256, "vertex size must be a multiple of 4 up to 256"
+    data = np.ascontiguousarray(data, dtype=np.uint8)
+    block_size = min(
+        (VERTEX_BLOCK_SIZE_BYTES // stride) & ~(BYTE_GROUP_SIZE - 1), VERTEX_BLOCK_MAX_SIZE
+    )
+    groups_per_block = block_size // BYTE_GROUP_SIZE
+    num_blocks = -(-count // block_size)
+    tail = np.zeros(max(TAIL_MAX_SIZE, stride), dtype=np.uint8)
+    if not count:
+        return bytes([VERTEX_HEADER]) + tail.tobytes()
+
+    # Deltas to the previous vertex, which for the first vertex is itself.
+    deltas = np.zeros((num_blocks * block_size, stride), dtype=np.uint8)
+    deltas[1:count] = data[1:] - data[:-1]
+    deltas = _zigzag8(deltas)
+
+    # [blocks x stride x groups x 16]: every byte of the vertex is encoded as
+    # its own stream per block.
+    groups = deltas.reshape(num_blocks, groups_per_block, BYTE_GROUP_SIZE, stride)
+    groups = groups.transpose(0, 3, 1, 2)
+    bits, encoded, sizes = _encode_byte_groups(groups)
+
+    # Blocks only hold the groups that overlap actual vertices.
+    valid_groups = np.full(num_blocks, groups_per_block)
+    valid_groups[-1] = -(-(count - (num_blocks - 1) * block_size) // BYTE_GROUP_SIZE)
+    sizes = np.where(
+        np.arange(groups_per_block) < valid_groups[:, None, None], sizes, 0
+    )
+
+    # Each stream starts with a 2 bit mode per group.
+    bitslog2 = np.select([bits == 1, bits == 2, bits == 4], [0, 1, 2], 3).astype(np.uint8)
+    padded_groups = -(-groups_per_block // 4) * 4
+    bitslog2 = np.pad(bitslog2, [(0, 0), (0, 0), (0, padded_groups - groups_per_block)])
+    bitslog2 = bitslog2.reshape(num_blocks, stride, padded_groups // 4, 4)
+    header = np.zeros(bitslog2.shape[:-1], dtype=np.uint8)
+    for i in range(4):
+        header |= bitslog2[..., i] << np.uint8(2 * i)
+    header_sizes = np.broadcast_to(
+        (-(-valid_groups // 4))[:, None], (num_blocks, stride)
+    )
+
+    # Lay every (block, byte) stream out as its header followed by its
+    # groups, as rows of up to 16 bytes, and keep the used part of each row.
+    rows = np.zeros((num_blocks, stride, 1 + groups_per_block, BYTE_GROUP_SIZE), dtype=np.uint8)
+    rows[:, :, 0, : header.shape[-1]] = header
+    rows[:, :, 1:] = encoded
+    row_sizes = np.concatenate([header_sizes[..., None], sizes], axis=-1)
+    body = rows[np.arange(BYTE_GROUP_SIZE) < row_sizes[..., None]]
+
+    # The first vertex goes at the end, padded to simplify decoder bounds checks.
+    tail[-stride:] = data[0]
+    return bytes([VERTEX_HEADER]) + body.tobytes() + tail.tobytes()
+
+
+def encode_index_sequence(indices: np.ndarray) -> bytes:
+    """
+    Encode an index buffer with the meshoptimizer index sequence codec (the
+    INDICES mode of EXT_meshopt_compression).
+
+    Each index is stored as a zigzag delta to the previous one in a variable
+    length integer, so a buffer whose triangles are sorted for locality (see
+    gltf.optimize_locality()) takes about one or two bytes per index.
+
+    :param indices: a flat array of unsigned indices.
+    :return: the encoded stream.
+    """
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    deltas = np.diff(indices, prepend=0)
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    # The low bit selects the baseline to add the delta to. Only one is used.
+    values = ((zigzag << 1) & 0xFFFFFFFF).astype(np.uint32)
+    return bytes([INDEX_SEQUENCE_HEADER]) + _encode_vbytes(values).tobytes() + bytes(4)
+
+
+def _zigzag8(v: np.ndarray) -> np.ndarray:
+    return (v.view(np.int8) >> 7).view(np.uint8) ^ (v << 1)
+
+
+def _encode_byte_groups(groups: np.ndarray):
+    """
+    Pick the smallest encoding for every group of 16 bytes.
+
+    :return: a tuple (bits, encoded, sizes), where bits is the bits per value
+             (1 standing for an all-zero group), encoded holds the encoded
+             groups padded to 16 bytes and sizes their lengths.
+    """
+    shape = groups.shape[:-1]
+    bits = np.full(shape, 8)
+    sizes = np.full(shape, BYTE_GROUP_SIZE)
+    encoded = groups.copy()
+
+    zero = ~groups.any(axis=-1)
+    bits[zero] = 1
+    sizes[zero] = 0
+
+    for candidate in (2, 4):
+        sentinel = (1 << candidate) - 1
+        outliers = groups >= sentinel
+        size = BYTE_GROUP_SIZE * candidate // 8 + outliers.sum(axis=-1)
+        better = size < sizes
+        bits[better] = candidate
+        sizes[better] = size[better]
+
+        # Fixed part: values packed from the high bits down, with the
+        # sentinel marking values stored in full in the variable part.
+        per_byte = 8 // candidate
+        fixed_size = BYTE_GROUP_SIZE // per_byte
+        packed = np.minimum(groups, sentinel).reshape(*shape, fixed_size, per_byte)
+        fixed = np.zeros((*shape, fixed_size), dtype=np.uint8)
+        for i in range(per_byte):
+            fixed |= packed[..., i] << np.uint8((per_byte - 1 - i) * candidate)
+
+        # Variable part: the outliers in order, after the fixed part. Other
+        # values are parked in a scratch column.
+        candidate_encoded = np.zeros((*shape, BYTE_GROUP_SIZE + 1), dtype=np.uint8)
+        slots = np.cumsum(outliers, axis=-1) - 1 + fixed_size
+        slots = np.where(outliers & (slots < BYTE_GROUP_SIZE), slots, BYTE_GROUP_SIZE)
+        np.put_along_axis(candidate_encoded, slots, groups, axis=-1)
+        candidate_encoded[..., :fixed_size] = fixed
+        encoded[better] = candidate_encoded[better][:, :BYTE_GROUP_SIZE]
+
+    return bits, encoded, sizes
+
+
+def _encode_vbytes(values: np.ndarray) -> np.ndarray:
+    """
+    Encode unsigned 32-bit integers as little-endian base 128 varints.
+    """
+    max_bytes = 5  # enough for 32 bits
+    out = np.empty((len(values), max_bytes), dtype=np.uint8)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for i in range(max_bytes):
+        out[:, i] = (values >> np.uint32(7 * i)) & np.uint32(127)
+        if i:
+            lengths += values >= np.uint32(1 << (7 * i))
+    positions = np.arange(max_bytes)
+    out[positions < lengths[:, None] - 1] |= 128
+    return out[positions < lengths[:, None]]
@@ -1,4 +1,3 @@
-import struct
 from typing import BinaryIO, Optional
 
 import numpy as np
@@ -16,7 +15,8 @@ def write_ply(
     Write a PLY file for a mesh or a point cloud.
 
     :param coords: an [N x 3] array of floating point coordinates.
-    :param rgb: an [N x 3] array of vertex colors, in the range [0.0, 1.0].
+    :param rgb: an [N x 3] array of vertex colors, in the range [0.0, 1.0],
+                or as uint8 in the range [0, 255].
     :param faces: an [N x 3] array of triangles encoded as integer indices.
     """
     with buffered_writer(raw_f) as f:
@@ -35,24 +35,20 @@ def write_ply(
             f.write(b"property list uchar int vertex_index\n")
         f.write(b"end_header\n")
 
+        # Whole vertex and face blocks are packed as structured arrays.
+        vertex_fields = [("xyz", "<f4", (3,))]
         if rgb is not None:
-            rgb = (rgb * 255.499).round().astype(int)
-            vertices = [
-                (*coord, *rgb)
-                for coord, rgb in zip(
-                    coords.tolist(),
-                    rgb.tolist(),
-                )
-            ]
-            format = struct.Struct("<3f3B")
-            for item in vertices:
-                f.write(format.pack(*item))
-        else:
-            format = struct.Struct("<3f")
-            for vertex in coords.tolist():
-                f.write(format.pack(*vertex))
+            vertex_fields.append(("rgb", "u1", (3,)))
+        vertices = np.empty(len(coords), dtype=vertex_fields)
+        vertices["xyz"] = coords
+        if rgb is not None:
+            if rgb.dtype != np.uint8:
+                rgb = (rgb * 255.499).round().astype(np.uint8)
+            vertices["rgb"] = rgb
+        f.write(vertices.tobytes())
 
         if faces is not None:
-            format = struct.Struct("<B3I")
-            for tri in faces.tolist():
-                f.write(format.pack(len(tri), *tri))
+            tris = np.empty(len(faces), dtype=[("count", "u1"), ("indices", "<i4", (3,))])
+            tris["count"] = 3
+            tris["indices"] = faces
+            f.write(tris.tobytes())
@@ -1,7 +1,8 @@
 from dataclasses import dataclass, field
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 import torch
+import torch.nn.functional as F
 
 from .mesh import TriMesh
 
@@ -40,3 +41,86 @@ class TorchMesh:
                 else None
             ),
         )
+
+
+@dataclass
+class PackedTorchMesh:
+    """
+    A batch of triangle meshes concatenated into flat tensors, so that they
+    can be processed together without padding.
+    """
+
+    # [N x 3] array of the vertex coordinates of every mesh, in batch order.
+    verts: torch.Tensor
+
+    # [M x 3] array of triangles, pointing to indices in verts. Indices are
+    # global, not relative to the first vertex of their mesh.
+    faces: torch.Tensor
+
+    # [batch_size + 1] long tensors, such that mesh i owns
+    # verts[vertex_offsets[i] : vertex_offsets[i + 1]] and
+    # faces[face_offsets[i] : face_offsets[i + 1]].
+    vertex_offsets: torch.Tensor
+    face_offsets: torch.Tensor
+
+    # Extra data per vertex, packed like verts.
+    vertex_channels: Optional[Dict[str, torch.Tensor]] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.vertex_offsets) - 1
+
+    @classmethod
+    def pack(cls, meshes: List[TorchMesh]) -> "PackedTorchMesh":
+        """
+        Concatenate a list of meshes, ignoring their vertex and face channels.
+        """
+        device = meshes[0].verts.device
+        num_verts = torch.tensor([len(m.verts) for m in meshes], device=device)
+        num_faces = torch.tensor([len(m.faces) for m in meshes], device=device)
+        vertex_offsets = F.pad(num_verts.cumsum(0), (1, 0))
+        face_offsets = F.pad(num_faces.cumsum(0), (1, 0))
+        face_shift = torch.repeat_interleave(vertex_offsets[:-1], num_faces)
+        return cls(
+            verts=torch.cat([m.verts for m in meshes]),
+            faces=torch.cat([m.faces for m in meshes]) + face_shift[:, None],
+            vertex_offsets=vertex_offsets,
+            face_offsets=face_offsets,
+        )
+
+    def vertex_batch_indices(self) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Locate every vertex within the batch.
+
+        :return: a tuple (mesh_indices, local_indices) of [N] long tensors,
+                 giving the mesh of each vertex and its index in that mesh.
+        """
+        num_verts = self.vertex_offsets.diff()
+        mesh_indices = torch.repeat_interleave(
+            torch.arange(len(self), device=num_verts.device), num_verts
+        )
+        local_indices = (
+            torch.arange(len(self.verts), device=num_verts.device)
+            - self.vertex_offsets[mesh_indices]
+        )
+        return mesh_indices, local_indices
+
+    def unpack(self) -> List[TorchMesh]:
+        """
+        Split into one mesh per batch element, with local face indices.
+        """
+        vertex_offsets = self.vertex_offsets.tolist()
+        face_offsets = self.face_offsets.tolist()
+        meshes = []
+        for i in range(len(self)):
+            v_start, v_end = vertex_offsets[i : i + 2]
+            f_start, f_end = face_offsets[i : i + 2]
+            meshes.append(
+                TorchMesh(
+                    verts=self.verts[v_start:v_end],
+                    faces=self.faces[f_start:f_end] - v_start,
+                    vertex_channels={
+                        k: v[v_start:v_end] for k, v in (self.vertex_channels or {}).items()
+                    },
+                )
+            )
+        return meshes
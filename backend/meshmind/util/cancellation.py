@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Optional, Sequence
+
+
+class Cancelled(Exception):
+    """
+    Raised when work is stopped through a CancellationToken.
+    """
+
+
+class DeadlineExceeded(Cancelled):
+    """
+    Raised when work runs past the deadline of its CancellationToken.
+    """
+
+
+class CancellationToken:
+    """
+    A thread-safe flag that long-running work checks between steps, so that
+    abandoned or overdue requests stop and release the GPU early.
+
+    :param timeout: if specified, the token also counts as cancelled once this
+        many seconds have passed since it was created.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = None if not timeout else time.monotonic() + timeout
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or self.expired
+
+    def check(self):
+        """
+        Raise Cancelled (or DeadlineExceeded) if the work should stop.
+        """
+        if self._event.is_set():
+            raise Cancelled("cancelled")
+        if self.expired:
+            raise DeadlineExceeded("deadline exceeded")
+
+
+class AllCancellationToken(CancellationToken):
+    """
+    A token for work shared by several requests, e.g. one sampling batch. It
+    only counts as cancelled once every request's token is.
+
+    :param tokens: the request tokens. None entries can never be cancelled.
+    """
+
+    def __init__(self, tokens: Sequence[Optional[CancellationToken]]):
+        super().__init__()
+        self.tokens = list(tokens)
+
+    @property
+    def expired(self) -> bool:
+        return all(t is not None and t.expired for t in self.tokens)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or all(t is not None and t.cancelled for t in self.tokens)
+
+    def check(self):
+        if self.expired:
+            raise DeadlineExceeded("deadline exceeded for every request")
+        if self.cancelled:
+            raise Cancelled("every request was cancelled")
+
+
+def check_cancelled(token: Optional[CancellationToken]):
+    """
+    Like token.check(), but does nothing without a token.
+    """
+    if token is not None:
+        token.check()
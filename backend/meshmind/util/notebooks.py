@@ -1,6 +1,6 @@
 import base64
 import io
-from typing import Union
+from typing import Dict, Optional, Union
 
 import ipywidgets as widgets
 import numpy as np
@@ -10,6 +10,7 @@ from PIL import Image
 from ..models.nn.camera import DifferentiableCameraBatch, DifferentiableProjectiveCamera
 from ..models.transmitter.base import Transmitter, VectorDecoder
 from ..rendering.torch_mesh import TorchMesh
+from ..util.cancellation import CancellationToken
 from ..util.collections import AttrDict
 
 
@@ -43,6 +44,25 @@ def create_pan_cameras(size: int, device: torch.device) -> DifferentiableCameraB
     )
 
 
+def latent_to_params(
+    xm: Union[Transmitter, VectorDecoder],
+    latent: torch.Tensor,
+) -> AttrDict:
+    """
+    Project a batch of latents to renderer parameters.
+
+    The projection may be stored in reduced precision, but the returned
+    parameters are always f32, as the renderer's fields expect.
+    """
+    encoder = xm.encoder if isinstance(xm, Transmitter) else xm
+    dtype = next(encoder.parameters()).dtype
+    with torch.autocast(
+        device_type=latent.device.type, dtype=dtype, enabled=dtype != torch.float32
+    ):
+        params = encoder.bottleneck_to_params(latent)
+    return params.map(lambda _, v: v.float())
+
+
 @torch.no_grad()
 def decode_latent_images(
     xm: Union[Transmitter, VectorDecoder],
@@ -52,9 +72,7 @@ def decode_latent_images(
 ):
     decoded = xm.renderer.render_views(
         AttrDict(cameras=cameras),
-        params=(xm.encoder if isinstance(xm, Transmitter) else xm).bottleneck_to_params(
-            latent[None]
-        ),
+        params=latent_to_params(xm, latent[None]),
         options=AttrDict(rendering_mode=rendering_mode, render_with_direction=False),
     )
     arr = decoded.channels.clamp(0, 255).to(torch.uint8)[0].cpu().numpy()
@@ -65,15 +83,36 @@ def decode_latent_images(
 def decode_latent_mesh(
     xm: Union[Transmitter, VectorDecoder],
     latent: torch.Tensor,
+    grid_size: Optional[int] = None,
+    coarse_stride: Optional[int] = None,
+    coarse_band: float = 1.0,
+    memory_budget: Optional[int] = None,
+    options: Optional[Dict] = None,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> TorchMesh:
-    decoded = xm.renderer.render_views(
-        AttrDict(cameras=create_pan_cameras(2, latent.device)),  # lowest resolution possible
-        params=(xm.encoder if isinstance(xm, Transmitter) else xm).bottleneck_to_params(
-            latent[None]
-        ),
-        options=AttrDict(rendering_mode="stf", render_with_direction=False),
-    )
-    return decoded.raw_meshes[0]
+    """
+    Decode a single latent into a textured mesh.
+
+    :param grid_size: SDF sampling resolution. Defaults to the renderer's.
+    :param coarse_stride: if specified, sample the SDF coarse-to-fine.
+    :param coarse_band: the distance from the surface, in coarse cell
+        diagonals, at which coarse-to-fine sampling refines the grid.
+    :param memory_budget: if specified, the approximate number of bytes that
+        SDF queries may use at once.
+    :param options: passed to the field models, e.g. compile_fused_mlp.
+    :param cancel_token: if specified, checked between decode stages and SDF
+        query chunks. Decoding stops by raising Cancelled.
+    """
+    if cancel_token is not None:
+        options = dict(options or {}, cancel_token=cancel_token)
+    return xm.renderer.extract_mesh(
+        latent_to_params(xm, latent[None]),
+        options=options,
+        grid_size=grid_size,
+        coarse_stride=coarse_stride,
+        coarse_band=coarse_band,
+        memory_budget=memory_budget,
+    )[0]
 
 
 def gif_widget(images):
@@ -0,0 +1,174 @@
+import multiprocessing
+import threading
+import uuid
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pymeshfix
+
+
+def repair_arrays(vertices, faces, verbose=False):
+    """
+    Runs PyMeshFix on [N x 3] vertices and [M x 3] faces.
+
+    Returns:
+        tuple: Repaired (float64 vertices, int64 faces).
+    """
+    meshfix = pymeshfix.MeshFix(vertices, faces)
+    meshfix.repair(verbose=verbose)  # fixes holes, non-manifold edges
+    return (
+        np.ascontiguousarray(meshfix.v, dtype=np.float64),
+        np.ascontiguousarray(meshfix.f, dtype=np.int64),
+    )
+
+
+class RepairPool:
+    """
+    Runs mesh repairs in worker processes, so that a long repair neither
+    holds the GIL against sampling and decoding threads nor hangs the app.
+
+    Every repair gets a process of its own, at most max_workers at a time.
+    Vertex and face arrays are passed to and from it through shared memory
+    blocks named by the caller rather than pickled. A repair that runs past
+    the timeout is abandoned by killing just its process and freeing its
+    blocks; callers then fall back to the unrepaired mesh.
+
+    Args:
+        max_workers (int): Concurrent repair processes. 0 repairs in the
+            calling thread, without a timeout.
+        timeout (float): Seconds a repair may take, or None for no limit.
+    """
+
+    def __init__(self, max_workers=2, timeout=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(max_workers, 1))
+        # Forking a process that has initialized CUDA is unsafe
+        self._context = multiprocessing.get_context("spawn")
+
+    def repair(self, vertices, faces, verbose=False):
+        """
+        Returns repaired (vertices, faces) arrays, or None if repair failed
+        or timed out.
+        """
+        if self.max_workers == 0:
+            try:
+                return repair_arrays(vertices, faces, verbose)
+            except Exception as e:
+                print(f"Mesh repair failed: {e}")
+                return None
+
+        with self._slots:
+            return self._run(vertices, faces, verbose)
+
+    def _run(self, vertices, faces, verbose):
+        inputs = [_share(vertices), _share(faces)]
+        # The worker creates the output blocks under these names, so they can
+        # be freed even if it is killed after creating them
+        job = uuid.uuid4().hex[:16]
+        output_names = (f"meshmind_{job}_v", f"meshmind_{job}_f")
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_repair_job,
+            args=(inputs[0][1], inputs[1][1], output_names, verbose, sender),
+            name="meshmind-repair",
+            daemon=True,
+        )
+        result = None
+        try:
+            process.start()
+            sender.close()
+            if not receiver.poll(self.timeout):
+                print(f"Mesh repair timed out after {self.timeout}s")
+                return None
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                print(f"Mesh repair process exited with code {process.exitcode}")
+                return None
+            if status != "ok":
+                print(f"Mesh repair failed: {payload}")
+                return None
+            result = _take(payload[0]), _take(payload[1])
+            return result
+        finally:
+            if process.is_alive():
+                # A stuck repair never returns, so stop the process itself
+                process.terminate()
+            process.join()
+            receiver.close()
+            for shm, _ in inputs:
+                shm.close()
+                shm.unlink()
+            if result is None:
+                for name in output_names:
+                    _unlink(name)
+
+
+def _share(array, name=None):
+    """
+    Copies an array into a new shared memory block.
+
+    Returns:
+        tuple: (SharedMemory, (name, shape, dtype) to attach to it by)
+    """
+    array = np.ascontiguousarray(array)
+    shm = SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _take(spec):
+    """
+    Copies an array out of a shared memory block and frees the block.
+    """
+    name, shape, dtype = spec
+    shm = SharedMemory(name=name)
+    try:
+        return np.array(np.ndarray(shape, dtype, buffer=shm.buf))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _unlink(name):
+    """
+    Frees a shared memory block if it exists.
+    """
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _repair_job(vertex_spec, face_spec, output_names, verbose, conn):
+    """
+    Worker process side of RepairPool.repair(). Sends ("ok", output specs)
+    or ("error", message); the caller frees the output blocks with _take().
+    """
+    try:
+        blocks = []
+        arrays = []
+        for name, shape, dtype in (vertex_spec, face_spec):
+            shm = SharedMemory(name=name)
+            blocks.append(shm)
+            arrays.append(np.ndarray(shape, dtype, buffer=shm.buf))
+        try:
+            vertices, faces = repair_arrays(*arrays, verbose=verbose)
+        finally:
+            del arrays
+            for shm in blocks:
+                shm.close()
+
+        specs = []
+        for array, name in zip((vertices, faces), output_names):
+            shm, spec = _share(array, name=name)
+            shm.close()
+            specs.append(spec)
+        conn.send(("ok", tuple(specs)))
+    except Exception as e:
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+from backend.meshmind.util.cancellation import CancellationToken
+
+
+@dataclass
+class GenerationRequest:
+    """
+    A single text-to-3D request waiting to be batched.
+    """
+    prompt: str
+    seed: int
+    guidance_scale: float
+    steps: Optional[int] = None
+    sigma_min: Optional[float] = None
+    sigma_max: Optional[float] = None
+    sampler: Optional[str] = None
+    precision: Optional[str] = None
+    # Step callback for live previews, see TextModel.sample_batch()
+    on_step: Optional[Callable] = field(default=None, repr=False)
+    # Stops the request early once cancelled or past its deadline
+    cancel_token: Optional[CancellationToken] = field(default=None, repr=False)
+    future: Future = field(default_factory=Future, repr=False)
+    submitted_at: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def batch_key(self):
+        """
+        Requests can share a sampling run only if they share a sigma schedule
+        and model precision.
+        """
+        return (self.steps, self.sigma_min, self.sigma_max, self.sampler, self.precision)
+
+
+class BatchScheduler:
+    """
+    Collects generation requests for a short window and runs compatible ones
+    as a single batch on a background worker thread.
+
+    Args:
+        run_batch (callable): Takes a list of GenerationRequest sharing one
+            batch_key and returns one result per request, in order.
+        max_batch_size (int): Run a group as soon as it reaches this size.
+        window_ms (float): How long the oldest request may wait for company.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[GenerationRequest]], List[Any]],
+        max_batch_size: int = 4,
+        window_ms: float = 100,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self._queue: List[GenerationRequest] = []
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._loop, name="meshmind-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, request: GenerationRequest) -> Future:
+        """
+        Queues a request and returns a future resolving to its result.
+        """
+        with self._cond:
+            self._queue.append(request)
+            self._cond.notify()
+        return request.future
+
+    def _next_batch(self) -> List[GenerationRequest]:
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            key = self._queue[0].batch_key
+            deadline = self._queue[0].submitted_at + self.window
+            while True:
+                batch = [r for r in self._queue if r.batch_key == key][: self.max_batch_size]
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            for request in batch:
+                self._queue.remove(request)
+
+        # Drop requests whose callers gave up while they were queued
+        return [r for r in batch if self._start(r)]
+
+    @staticmethod
+    def _start(request: GenerationRequest) -> bool:
+        """
+        Marks a request as running, unless it was cancelled while queued.
+        """
+        if not request.future.set_running_or_notify_cancel():
+            return False
+        token = request.cancel_token
+        if token is not None and token.cancelled:
+            try:
+                token.check()
+            except Exception as e:
+                request.future.set_exception(e)
+            return False
+        return True
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            print(f"Running batch of {len(batch)} request(s): {batch[0].batch_key}")
+            try:
+                results = self.run_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
@@ -1,9 +1,19 @@
+from ..meshmind.diffusion.k_diffusion import GuidanceSchedule
 from ..meshmind.diffusion.sample import sample_latents
+from ..meshmind.models.generation.pretrained_clip import image_hash
 from ..meshmind.util.notebooks import decode_latent_mesh
-from backend.config import device
+from backend.config import device, compile_denoiser, guidance_interval, guidance_ramp
+from backend.config import (
+    compile_fields,
+    decode_coarse_band,
+    decode_coarse_stride,
+    decode_memory_mb,
+)
+from backend.latent_cache import get_latent_cache, latent_cache_key
 from rembg import remove
 from io import BytesIO
 from PIL import Image
+import torch
 
 
 class DiffusionModel:
@@ -12,6 +22,8 @@ class DiffusionModel:
         self.model = model
         self.diffusion = diffusion
         self.xm = xm
+        # Checkpoint name in MODEL_PATHS, used to key cached latents
+        self.checkpoint = "d_model"
 
         # Default generation parameters
         self.guidance_scale = 3.5
@@ -20,11 +32,24 @@ class DiffusionModel:
         self.sigma_min = 1e-3
         self.sigma_max = 80
         self.s_churn = 0
+        self.sampler = "heun"
+        # Only guide within a sigma window, if one is configured
+        self.guidance_schedule = (
+            GuidanceSchedule(*guidance_interval, ramp=guidance_ramp) if guidance_interval else None
+        )
         self.clip_denoised = True
         self.use_fp16 = False
         self.progress = True
+        # SDF grid size for mesh decoding (None: the transmitter's default)
+        self.resolution = None
+
+    def generate(self, resolution=None, **kwargs):
+        """
+        Like sample(), but decodes the latent into a mesh.
+        """
+        return self.decode(self.sample(**kwargs), resolution)
 
-    def generate(
+    def sample(
         self,
         guidance_scale=None,
         karras_steps=None,
@@ -34,8 +59,23 @@ class DiffusionModel:
         use_karras=None,
         clip_denoised=None,
         use_fp16=None,
-        progress=None
+        progress=None,
+        sampler=None,
+        seed=None,
+        on_step=None,
+        cancel_token=None
     ):
+        """
+        Samples a latent conditioned on self.image. Seeded latents are looked
+        up in and stored to the latent cache.
+
+        Args:
+            on_step (callable): Optional step callback, called as
+                on_step(step, total_steps, denoised_latent). Returning False
+                stops sampling with SamplingCancelled.
+            cancel_token (CancellationToken): Optional token checked between
+                denoiser calls.
+        """
         # Update parameters if provided
         guidance_scale = guidance_scale or self.guidance_scale
         karras_steps = karras_steps or self.karras_steps
@@ -46,10 +86,37 @@ class DiffusionModel:
         clip_denoised = clip_denoised if clip_denoised is not None else self.clip_denoised
         use_fp16 = use_fp16 if use_fp16 is not None else self.use_fp16
         progress = progress if progress is not None else self.progress
+        sampler = sampler or self.sampler
 
         # Prepare input for Shap-E
         model_kwargs = {"images": [self.image]}
 
+        cache = get_latent_cache()
+        key = None
+        generators = None
+        if seed is not None:
+            # Seeded requests are reproducible, so they can use the latent cache
+            key = latent_cache_key(
+                self.checkpoint,
+                image=self.image_hash(),
+                seed=int(seed),
+                guidance_scale=float(guidance_scale),
+                karras_steps=int(karras_steps),
+                sigma_min=float(sigma_min),
+                sigma_max=float(sigma_max),
+                s_churn=float(s_churn),
+                sampler=sampler,
+                use_karras=use_karras,
+                clip_denoised=clip_denoised,
+                use_fp16=use_fp16,
+                dtype=str(next(self.model.parameters()).dtype),
+                guidance_schedule=repr(self.guidance_schedule),
+            )
+            latent = cache.get(key, device)
+            if latent is not None:
+                return latent
+            generators = [torch.Generator(device=device).manual_seed(seed)]
+
         # Generate latent 3D representation
         latents = sample_latents(
             batch_size=1,
@@ -65,12 +132,49 @@ class DiffusionModel:
             karras_steps=karras_steps,
             sigma_min=sigma_min,
             sigma_max=sigma_max,
-            s_churn=s_churn
+            s_churn=s_churn,
+            sampler=sampler,
+            generators=generators,
+            compile_denoiser=compile_denoiser,
+            guidance_schedule=self.guidance_schedule,
+            callback=(
+                None if on_step is None
+                else lambda out: on_step(out["i"], karras_steps, out["pred_xstart"][0])
+            ),
+            cancel_token=cancel_token
         )
+        if key is not None:
+            cache.put(key, latents[0])
+
+        return latents[0]
+
+    def decode(self, latent, resolution=None, cancel_token=None):
+        """
+        Decodes a latent into a mesh.
+
+        Args:
+            resolution (int): SDF grid size for marching cubes. Defaults to
+                self.resolution, or the transmitter's own grid size.
+            cancel_token (CancellationToken): Optional token checked between
+                decode stages.
+        """
+        return decode_latent_mesh(
+            self.xm,
+            latent,
+            grid_size=resolution or self.resolution,
+            coarse_stride=decode_coarse_stride,
+            coarse_band=decode_coarse_band,
+            memory_budget=int(decode_memory_mb * 1024**2),
+            options=dict(compile_fused_mlp=compile_fields),
+            cancel_token=cancel_token,
+        )
+
+    def image_hash(self):
+        """
+        Content hash of the conditioning image, independent of its file name.
+        """
+        return image_hash(self.image)
 
-        mesh = decode_latent_mesh(self.xm, latents[0])
-        return mesh
-        
     def gen_image(self, prompt, pipe):
         image_b = BytesIO()
         image_s = pipe(prompt, guidance_scale=7.5).images[0]
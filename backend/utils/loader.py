@@ -3,12 +3,57 @@ import streamlit as st
 from diffusers import StableDiffusionPipeline
 from ..meshmind.models.download import load_model, load_config
 from ..meshmind.diffusion.gaussian_diffusion import diffusion_from_config
-from backend.config import device
+from ..meshmind.diffusion.sample import sample_latents
+from ..meshmind.models.generation.pretrained_clip import FrozenImageCLIP
+from backend.config import device, max_batch_size, precision as default_precision
+from PIL import Image
 from pathlib import Path
 
 
 SAVE_PATH = Path(__file__).parent.parent / "model" / "diffuser_model"
 
+PRECISIONS = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+def resolve_dtype(precision, device=device):
+    """
+    Maps a precision name to the dtype the model weights are loaded in.
+    f16 matmuls are slow or unsupported on CPU, so fp16 becomes bf16 there.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {list(PRECISIONS)}")
+    dtype = PRECISIONS[precision]
+    if dtype == torch.float16 and torch.device(device).type == "cpu":
+        dtype = torch.bfloat16
+    return dtype
+
+
+def cast_diffusion_model(model, dtype):
+    """
+    Casts a latent diffusion model to dtype, including its frozen CLIP
+    encoder, which is not a registered submodule.
+    """
+    model.to(dtype)
+    for module in model.modules():
+        clip = getattr(module, "clip", None)
+        if isinstance(clip, FrozenImageCLIP):
+            clip.model.to(dtype)
+    return model
+
+
+def cast_transmitter(xm, dtype):
+    """
+    Casts the transmitter's latent-to-parameters projection to dtype. The
+    renderer (SDF and texture fields, marching cubes) stays in f32.
+    """
+    xm.encoder.to(dtype)
+    return xm
+
+
 @st.cache_resource
 def load_diffusion_pipeline(device=device):
     """
@@ -33,10 +78,62 @@ def load_diffusion_pipeline(device=device):
         print(f"Model saved for next session to: {SAVE_PATH}")
     return pipe
 
-@st.cache_resource
-def get_models(device):
+def get_models(device, precision=default_precision):
+    """
+    Returns (d_model, text_model, xm, diffusion) in a precision, loaded once
+    per process. Precisions resolving to the same dtype (fp16 and bf16 on
+    CPU) share one model set.
+    """
+    dtype = resolve_dtype(precision, device)
+    return _load_models(device, str(dtype).replace("torch.", ""))
+
+
+# One model set per dtype, so sessions on different precisions don't evict
+# each other's. All three sets together take twice the fp32 weights.
+@st.cache_resource(max_entries=len(PRECISIONS))
+def _load_models(device, dtype_name):
+    dtype = getattr(torch, dtype_name)
     d_model = load_model("d_model", device=device)
     text_model = load_model("text_model", device=device)
     xm = load_model("transmitter", device=device)
     diffusion = diffusion_from_config(load_config("diffusion"))
+    if dtype != torch.float32:
+        print(f"Casting models to {dtype}")
+        cast_diffusion_model(d_model, dtype)
+        cast_diffusion_model(text_model, dtype)
+        cast_transmitter(xm, dtype)
     return d_model, text_model, xm, diffusion
+
+
+@st.cache_resource
+def warmup_denoisers(device, precision=default_precision):
+    """
+    Compiles (and on GPU, captures) the guided denoisers for every batch size
+    the scheduler can form, so the first real requests don't pay for it.
+    """
+    d_model, text_model, _, diffusion = get_models(device, precision)
+    warmups = [
+        (text_model, batch_size, dict(texts=[""] * batch_size))
+        for batch_size in range(1, max_batch_size + 1)
+    ]
+    warmups.append((d_model, 1, dict(images=[Image.new("RGB", (256, 256))])))
+
+    for model, batch_size, model_kwargs in warmups:
+        print(f"Warming up denoiser for batch size {batch_size}")
+        sample_latents(
+            batch_size=batch_size,
+            model=model,
+            diffusion=diffusion,
+            guidance_scale=3.0,
+            model_kwargs=model_kwargs,
+            clip_denoised=True,
+            use_fp16=False,
+            use_karras=True,
+            karras_steps=2,
+            sigma_min=1e-3,
+            sigma_max=160,
+            s_churn=0,
+            device=device,
+            compile_denoiser=True,
+        )
+    return True
@@ -1,12 +1,24 @@
+from ..meshmind.diffusion.k_diffusion import GuidanceSchedule
 from ..meshmind.diffusion.sample import sample_latents
+from ..meshmind.util.cancellation import AllCancellationToken
 from ..meshmind.util.notebooks import decode_latent_mesh
-from backend.config import device
+from backend.config import device, compile_denoiser, guidance_interval, guidance_ramp
+from backend.config import (
+    compile_fields,
+    decode_coarse_band,
+    decode_coarse_stride,
+    decode_memory_mb,
+)
+from backend.latent_cache import get_latent_cache, latent_cache_key
+import torch
 
 class TextModel:
     def __init__(self, model, diffusion, xm):
         self.model = model
         self.diffusion = diffusion
         self.xm = xm
+        # Checkpoint name in MODEL_PATHS, used to key cached latents
+        self.checkpoint = "text_model"
 
         # Default generation parameters
         self.guidance_scale = 15.5
@@ -15,9 +27,16 @@ class TextModel:
         self.sigma_min = 1e-3
         self.sigma_max = 256
         self.s_churn = 0
+        self.sampler = "heun"
+        # Only guide within a sigma window, if one is configured
+        self.guidance_schedule = (
+            GuidanceSchedule(*guidance_interval, ramp=guidance_ramp) if guidance_interval else None
+        )
         self.clip_denoised = True
         self.use_fp16 = False
         self.progress = True
+        # SDF grid size for mesh decoding (None: the transmitter's default)
+        self.resolution = None
 
     def generate(
         self,
@@ -30,8 +49,29 @@ class TextModel:
         use_karras=None,
         clip_denoised=None,
         use_fp16=None,
-        progress=None
+        progress=None,
+        sampler=None,
+        seed=None,
+        resolution=None
     ):
+        if seed is not None:
+            # Seeded requests are reproducible, so they can use the latent cache
+            return self.generate_batch(
+                [prompt],
+                [seed],
+                guidance_scales=[guidance_scale or self.guidance_scale],
+                karras_steps=karras_steps,
+                sigma_min=sigma_min,
+                sigma_max=sigma_max,
+                s_churn=s_churn,
+                use_karras=use_karras,
+                clip_denoised=clip_denoised,
+                use_fp16=use_fp16,
+                progress=progress,
+                sampler=sampler,
+                resolutions=[resolution]
+            )[0]
+
         # Update parameters if provided
         guidance_scale = guidance_scale or self.guidance_scale
         karras_steps = karras_steps or self.karras_steps
@@ -42,6 +82,7 @@ class TextModel:
         clip_denoised = clip_denoised if clip_denoised is not None else self.clip_denoised
         use_fp16 = use_fp16 if use_fp16 is not None else self.use_fp16
         progress = progress if progress is not None else self.progress
+        sampler = sampler or self.sampler
 
         # Generate latent 3D representation
         latents = sample_latents(
@@ -57,9 +98,169 @@ class TextModel:
             karras_steps=karras_steps,
             sigma_min=sigma_min,
             sigma_max=sigma_max,
-            s_churn=s_churn
+            s_churn=s_churn,
+            sampler=sampler,
+            compile_denoiser=compile_denoiser,
+            guidance_schedule=self.guidance_schedule
         )
 
-        mesh = decode_latent_mesh(self.xm, latents[0])
+        mesh = self.decode(latents[0], resolution)
         return mesh
 
+    def generate_batch(self, prompts, seeds, resolutions=None, **kwargs):
+        """
+        Like sample_batch(), but decodes every latent into its own mesh at its
+        own resolution.
+        """
+        latents = self.sample_batch(prompts, seeds, **kwargs)
+        resolutions = resolutions or [None] * len(prompts)
+        return [
+            self.decode(latent, resolution) for latent, resolution in zip(latents, resolutions)
+        ]
+
+    def sample_batch(
+        self,
+        prompts,
+        seeds,
+        guidance_scales=None,
+        karras_steps=None,
+        sigma_min=None,
+        sigma_max=None,
+        s_churn=None,
+        use_karras=None,
+        clip_denoised=None,
+        use_fp16=None,
+        progress=None,
+        sampler=None,
+        callbacks=None,
+        cancel_tokens=None
+    ):
+        """
+        Samples one latent per prompt in a single diffusion run, giving each
+        prompt its own seed and guidance scale. Latents found in the latent
+        cache are not resampled.
+
+        Args:
+            callbacks (list): Optional step callback per prompt (or None),
+                called as callback(step, total_steps, denoised_latent). The
+                run stops with SamplingCancelled once every prompt's callback
+                has returned False.
+            cancel_tokens (list): Optional CancellationToken per prompt (or
+                None). Likewise, the run stops with Cancelled once every
+                prompt's token is cancelled or past its deadline.
+        """
+        assert len(prompts) == len(seeds), "need exactly one seed per prompt"
+
+        # Update parameters if provided
+        guidance_scales = guidance_scales or [self.guidance_scale] * len(prompts)
+        karras_steps = karras_steps or self.karras_steps
+        sigma_min = sigma_min or self.sigma_min
+        sigma_max = sigma_max or self.sigma_max
+        s_churn = s_churn or self.s_churn
+        use_karras = use_karras if use_karras is not None else self.use_karras
+        clip_denoised = clip_denoised if clip_denoised is not None else self.clip_denoised
+        use_fp16 = use_fp16 if use_fp16 is not None else self.use_fp16
+        progress = progress if progress is not None else self.progress
+        sampler = sampler or self.sampler
+
+        cache = get_latent_cache()
+        keys = [
+            latent_cache_key(
+                self.checkpoint,
+                prompt=prompt,
+                seed=int(seed),
+                guidance_scale=float(scale),
+                karras_steps=int(karras_steps),
+                sigma_min=float(sigma_min),
+                sigma_max=float(sigma_max),
+                s_churn=float(s_churn),
+                sampler=sampler,
+                use_karras=use_karras,
+                clip_denoised=clip_denoised,
+                use_fp16=use_fp16,
+                dtype=str(next(self.model.parameters()).dtype),
+                guidance_schedule=repr(self.guidance_schedule),
+            )
+            for prompt, seed, scale in zip(prompts, seeds, guidance_scales)
+        ]
+        latents = [cache.get(key, device) for key in keys]
+        misses = [i for i, latent in enumerate(latents) if latent is None]
+        print(f"Latent cache: {len(prompts) - len(misses)} hit(s), {len(misses)} miss(es)")
+
+        if misses:
+            # One noise stream per prompt, so results match single-prompt runs
+            generators = [torch.Generator(device=device).manual_seed(seeds[i]) for i in misses]
+
+            sampled = sample_latents(
+                batch_size=len(misses),
+                model=self.model,
+                diffusion=self.diffusion,
+                guidance_scale=[guidance_scales[i] for i in misses],
+                model_kwargs=dict(texts=[prompts[i] for i in misses]),
+                progress=progress,
+                clip_denoised=clip_denoised,
+                use_fp16=use_fp16,
+                device=device,
+                use_karras=use_karras,
+                karras_steps=karras_steps,
+                sigma_min=sigma_min,
+                sigma_max=sigma_max,
+                s_churn=s_churn,
+                sampler=sampler,
+                generators=generators,
+                compile_denoiser=compile_denoiser,
+                guidance_schedule=self.guidance_schedule,
+                callback=_batch_step_callback(callbacks, misses, karras_steps),
+                cancel_token=(
+                    AllCancellationToken([cancel_tokens[i] for i in misses])
+                    if cancel_tokens is not None else None
+                )
+            )
+            for i, latent in zip(misses, sampled):
+                cache.put(keys[i], latent)
+                latents[i] = latent
+
+        return latents
+
+    def decode(self, latent, resolution=None, cancel_token=None):
+        """
+        Decodes a latent into a mesh.
+
+        Args:
+            resolution (int): SDF grid size for marching cubes. Defaults to
+                self.resolution, or the transmitter's own grid size.
+            cancel_token (CancellationToken): Optional token checked between
+                decode stages.
+        """
+        return decode_latent_mesh(
+            self.xm,
+            latent,
+            grid_size=resolution or self.resolution,
+            coarse_stride=decode_coarse_stride,
+            coarse_band=decode_coarse_band,
+            memory_budget=int(decode_memory_mb * 1024**2),
+            options=dict(compile_fused_mlp=compile_fields),
+            cancel_token=cancel_token,
+        )
+
+
+def _batch_step_callback(callbacks, rows, total_steps):
+    """
+    Fans a sample_latents() step out to the per-prompt callbacks of the given
+    batch rows. Sampling only stops once all of them want it to, since other
+    prompts in the batch may still be wanted.
+    """
+    if callbacks is None or all(callbacks[i] is None for i in rows):
+        return None
+    row_callbacks = [callbacks[i] for i in rows]
+
+    def callback(out):
+        keep_going = False
+        for j, row_callback in enumerate(row_callbacks):
+            if row_callback is None:
+                keep_going = True
+            elif row_callback(out["i"], total_steps, out["pred_xstart"][j]) is not False:
+                keep_going = True
+        return keep_going
+
+    return callback
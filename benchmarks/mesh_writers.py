@@ -0,0 +1,143 @@
+"""
+Compares the vectorized PLY, OBJ and STL writers with the per-row writers
+they replaced, and the quantized GLB writer with trimesh's. Run from the
+repository root:
+
+    python -m benchmarks.mesh_writers [--faces 500000]
+"""
+import argparse
+import io
+import struct
+import time
+
+import numpy as np
+import trimesh
+
+from backend.meshmind.rendering.gltf import write_glb
+from backend.meshmind.rendering.mesh import write_obj, write_stl
+from backend.meshmind.rendering.ply_util import write_ply
+
+from .meshopt_roundtrip import check_glb
+
+
+def legacy_write_ply(f, coords, rgb, faces):
+    """
+    Body of ply_util.write_ply() before vectorization, minus the header.
+    """
+    rgb = (rgb * 255.499).round().astype(int)
+    vertices = [(*coord, *rgb) for coord, rgb in zip(coords.tolist(), rgb.tolist())]
+    format = struct.Struct("<3f3B")
+    for item in vertices:
+        f.write(format.pack(*item))
+    format = struct.Struct("<B3I")
+    for tri in faces.tolist():
+        f.write(format.pack(len(tri), *tri))
+
+
+def legacy_write_obj(f, coords, rgb, faces):
+    """
+    TriMesh.write_obj() before vectorization.
+    """
+    vertices = [
+        "{} {} {} {} {} {}".format(*coord, *color)
+        for coord, color in zip(coords.tolist(), rgb.tolist())
+    ]
+    faces = [
+        "f {} {} {}".format(str(tri[0] + 1), str(tri[1] + 1), str(tri[2] + 1))
+        for tri in faces.tolist()
+    ]
+    combined_data = ["v " + vertex for vertex in vertices] + faces
+    f.writelines("\n".join(combined_data))
+
+
+def trimesh_write_stl(f, coords, faces):
+    f.write(trimesh.Trimesh(coords, faces, process=False).export(file_type="stl"))
+
+
+def trimesh_write_glb(f, coords, rgb, faces):
+    mesh = trimesh.Trimesh(coords, faces, vertex_colors=rgb, process=False)
+    f.write(mesh.export(file_type="glb"))
+
+
+def bumpy_sphere(num_faces, seed=0):
+    """
+    A closed mesh with smoothly varying colors, standing in for a decoded one.
+    """
+    rng = np.random.default_rng(seed)
+    count = int(np.sqrt(num_faces / 4))
+    mesh = trimesh.creation.uv_sphere(count=[count, count])
+    frequencies = rng.uniform(2, 6, size=3)
+    bumps = 1 + 0.1 * np.sin(mesh.vertices @ np.diag(frequencies)).sum(axis=1, keepdims=True)
+    coords = (mesh.vertices * bumps).astype(np.float32)
+    rgb = (0.5 + 0.5 * np.sin(coords * frequencies)).astype(np.float32)
+    return coords, rgb, mesh.faces
+
+
+def best_time(fn, *args, repeat=3):
+    """
+    Returns the fastest of a few runs in seconds, and the bytes written.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        f = io.BytesIO()
+        start = time.perf_counter()
+        fn(f, *args)
+        best = min(best, time.perf_counter() - start)
+    return best, f.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--faces", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # The reference decoders are slow, so check a small mesh of the same kind
+    small_coords, small_rgb, small_faces = bumpy_sphere(20_000)
+    check_glb(small_coords, small_faces, rgb=small_rgb)
+
+    coords, rgb, faces = bumpy_sphere(args.faces)
+    print(f"{len(coords)} vertices, {len(faces)} faces")
+
+    def new_ply_body(f, coords, rgb, faces):
+        header = io.BytesIO()
+        write_ply(header, coords, rgb=rgb, faces=faces)
+        f.write(header.getvalue().split(b"end_header\n", 1)[1])
+
+    def new_obj(f, coords, rgb, faces):
+        text = io.TextIOWrapper(f, write_through=True)
+        write_obj(text, coords, faces, rgb=rgb)
+        text.detach()
+
+    def legacy_obj(f, coords, rgb, faces):
+        text = io.TextIOWrapper(f, write_through=True)
+        legacy_write_obj(text, coords, rgb, faces)
+        text.detach()
+
+    def new_glb(f, coords, rgb, faces):
+        write_glb(f, coords, faces, rgb=rgb)
+
+    def new_glb_meshopt(f, coords, rgb, faces):
+        write_glb(f, coords, faces, rgb=rgb, compress=True)
+
+    cases = [
+        ("ply", legacy_write_ply, new_ply_body, (coords, rgb, faces)),
+        ("obj", legacy_obj, new_obj, (coords, rgb, faces)),
+        ("stl (vs trimesh)", trimesh_write_stl, write_stl, (coords, faces)),
+        ("glb (vs trimesh)", trimesh_write_glb, new_glb, (coords, rgb, faces)),
+        ("glb+meshopt", trimesh_write_glb, new_glb_meshopt, (coords, rgb, faces)),
+    ]
+    for name, old, new, case_args in cases:
+        old_time, old_bytes = best_time(old, *case_args, repeat=args.repeat)
+        new_time, new_bytes = best_time(new, *case_args, repeat=args.repeat)
+        print(
+            f"{name:>16}: {old_time:7.3f}s -> {new_time:7.3f}s "
+            f"({old_time / new_time:5.1f}x), "
+            f"{len(old_bytes) / 1024**2:5.1f} -> {len(new_bytes) / 1024**2:5.1f} MiB"
+        )
+        if name == "ply":
+            assert old_bytes == new_bytes, "PLY output differs from the legacy writer"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Checks that the meshopt encoders in rendering/meshopt.py round-trip, using
+straightforward decoders written from the EXT_meshopt_compression spec, and
+that a compressed GLB decodes to the same buffers as an uncompressed one.
+Run from the repository root:
+
+    python -m benchmarks.meshopt_roundtrip
+"""
+import io
+import json
+import struct
+
+import numpy as np
+
+from backend.meshmind.rendering.gltf import write_glb
+from backend.meshmind.rendering.meshopt import (
+    BYTE_GROUP_SIZE,
+    INDEX_SEQUENCE_HEADER,
+    TAIL_MAX_SIZE,
+    VERTEX_BLOCK_MAX_SIZE,
+    VERTEX_BLOCK_SIZE_BYTES,
+    VERTEX_HEADER,
+    encode_index_sequence,
+    encode_vertex_buffer,
+)
+
+
+def decode_vertex_buffer(data, count, stride):
+    """
+    Reference decoder for the vertex codec (version 0), one value at a time.
+    """
+    assert data[0] == VERTEX_HEADER, "bad vertex stream header"
+    block_size = min(
+        (VERTEX_BLOCK_SIZE_BYTES // stride) & ~(BYTE_GROUP_SIZE - 1), VERTEX_BLOCK_MAX_SIZE
+    )
+    tail_size = max(TAIL_MAX_SIZE, stride)
+    last = list(data[len(data) - stride :])
+    out = np.zeros((count, stride), dtype=np.uint8)
+    pos = 1
+    for start in range(0, count, block_size):
+        size = min(block_size, count - start)
+        num_groups = -(-size // BYTE_GROUP_SIZE)
+        for k in range(stride):
+            header = data[pos : pos + -(-num_groups // 4)]
+            pos += len(header)
+            values = []
+            for g in range(num_groups):
+                mode = (header[g // 4] >> (2 * (g % 4))) & 3
+                if mode == 0:
+                    values += [0] * BYTE_GROUP_SIZE
+                elif mode == 3:
+                    values += list(data[pos : pos + BYTE_GROUP_SIZE])
+                    pos += BYTE_GROUP_SIZE
+                else:
+                    bits = 2 if mode == 1 else 4
+                    sentinel = (1 << bits) - 1
+                    variable = pos + BYTE_GROUP_SIZE * bits // 8
+                    for byte in data[pos : pos + BYTE_GROUP_SIZE * bits // 8]:
+                        for shift in range(8 - bits, -1, -bits):
+                            value = (byte >> shift) & sentinel
+                            if value == sentinel:
+                                value = data[variable]
+                                variable += 1
+                            values.append(value)
+                    pos = variable
+            previous = last[k]
+            for i in range(size):
+                delta = (values[i] >> 1) ^ (-(values[i] & 1) & 0xFF)
+                previous = (previous + delta) & 0xFF
+                out[start + i, k] = previous
+        last = out[start + size - 1].tolist()
+    assert len(data) - pos == tail_size, "vertex stream has trailing data"
+    return out
+
+
+def decode_index_sequence(data, count):
+    """
+    Reference decoder for the index sequence codec (version 1).
+    """
+    assert data[0] == INDEX_SEQUENCE_HEADER, "bad index stream header"
+    last = [0, 0]
+    out = np.zeros(count, dtype=np.int64)
+    pos = 1
+    for i in range(count):
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 127) << shift
+            shift += 7
+            if byte < 128:
+                break
+        baseline = value & 1
+        value >>= 1
+        delta = (value >> 1) ^ -(value & 1)
+        out[i] = last[baseline] = (last[baseline] + delta) & 0xFFFFFFFF
+    assert len(data) - pos == 4, "index stream has trailing data"
+    return out
+
+
+def check_codecs(seed=0):
+    rng = np.random.default_rng(seed)
+    for count, stride in [(0, 4), (1, 4), (17, 8), (300, 4), (1000, 8), (5000, 12), (700, 256)]:
+        # Mostly small deltas, with some outliers to exercise every group mode
+        data = np.cumsum(rng.integers(-3, 4, (count, stride)), axis=0).astype(np.uint8)
+        data[::37] = rng.integers(0, 256, data[::37].shape)
+        decoded = decode_vertex_buffer(encode_vertex_buffer(data), count, stride)
+        assert (decoded == data).all(), f"vertex codec mismatch for {count}x{stride}"
+
+    indices = rng.integers(0, 2**30, 3000)
+    indices[100:200] = np.arange(100)
+    decoded = decode_index_sequence(encode_index_sequence(indices), len(indices))
+    assert (decoded == indices).all(), "index codec mismatch"
+
+
+def check_glb(coords, faces, rgb=None):
+    """
+    Checks that every compressed bufferView of a GLB decodes to the same
+    bytes as the matching view of the uncompressed GLB.
+    """
+    plain, compressed = io.BytesIO(), io.BytesIO()
+    write_glb(plain, coords, faces, rgb=rgb)
+    write_glb(compressed, coords, faces, rgb=rgb, compress=True)
+    plain_json, plain_bin = _parse_glb(plain.getvalue())
+    compressed_json, compressed_bin = _parse_glb(compressed.getvalue())
+
+    for plain_view, view in zip(plain_json["bufferViews"], compressed_json["bufferViews"]):
+        ext = view["extensions"]["EXT_meshopt_compression"]
+        data = compressed_bin[ext["byteOffset"] : ext["byteOffset"] + ext["byteLength"]]
+        if ext["mode"] == "ATTRIBUTES":
+            decoded = decode_vertex_buffer(data, ext["count"], ext["byteStride"]).tobytes()
+        else:
+            dtype = "<u2" if ext["byteStride"] == 2 else "<u4"
+            decoded = decode_index_sequence(data, ext["count"]).astype(dtype).tobytes()
+        start = plain_view["byteOffset"]
+        expected = plain_bin[start : start + plain_view["byteLength"]]
+        assert decoded == expected, f"{ext['mode']} view decodes differently"
+
+
+def _parse_glb(data):
+    json_length, _ = struct.unpack_from("<II", data, 12)
+    bin_length, _ = struct.unpack_from("<II", data, 20 + json_length)
+    body = 28 + json_length
+    return json.loads(data[20 : 20 + json_length]), data[body : body + bin_length]
+
+
+def main():
+    check_codecs()
+    rng = np.random.default_rng(0)
+    for num_vertices, num_faces in [(1000, 2000), (70_000, 20_000)]:
+        coords = rng.standard_normal((num_vertices, 3)).astype(np.float32)
+        rgb = rng.random((num_vertices, 3)).astype(np.float32)
+        check_glb(coords, rng.integers(0, num_vertices, (num_faces, 3)), rgb)
+    print("meshopt round trip OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,24 @@
-import os
 import streamlit as st
-import numpy as np
-import trimesh
 import pyvista as pv
 from stpyvista import stpyvista
+from frontend.viewer import show_download_button
+
+
+def render_thumbnail(mesh):
+    """
+    Renders a small off-screen preview image of a MeshArtifact.
+    """
+    plotter = pv.Plotter(off_screen=True, window_size=[150, 150])
+    if mesh.colors is not None:
+        plotter.add_mesh(mesh.pyvista(), scalars="colors", rgb=True, show_edges=False)
+    else:
+        plotter.add_mesh(mesh.pyvista(), show_edges=False)
+    plotter.view_isometric()
+    plotter.background_color = "black"
+    img_array = plotter.screenshot(return_img=True)
+    plotter.close()
+    return img_array
+
 
 def show_history(viewer_panel, download_panel):
     """
@@ -18,46 +33,25 @@ def show_history(viewer_panel, download_panel):
         for i, item in enumerate(reversed(st.session_state.history)):
             st.markdown("---") if i!=0 else 0
             col1, col2, col3 = st.columns([1, 3, 1])
-            
+
             with col1:
-                reloaded_trimesh = trimesh.load(item["file_path"])
-                pv_mesh = pv.wrap(reloaded_trimesh)
-                plotter = pv.Plotter(off_screen=True, window_size=[150, 150])
-                plotter.add_mesh(
-                    pv_mesh,
-                    scalars=reloaded_trimesh.visual.vertex_colors[:, :3],
-                    rgb=True,
-                    show_edges=False
-                )
-                plotter.view_isometric()
-                plotter.background_color = "black"
-                img_array = plotter.screenshot(return_img=True)
-                plotter.close()
-                st.image(img_array)
+                # Rendered once per model rather than on every rerun
+                if "thumbnail" not in item:
+                    item["thumbnail"] = render_thumbnail(item["mesh"])
+                st.image(item["thumbnail"])
 
             with col2:
-                st.write(f"**File:** `{item['file_path']}`")
+                st.write(f"**Model:** `{item['name']}`")
                 st.caption(f"Generated at: {item['timestamp']}")
 
-                # Download button for saved .obj
-                with open(item['file_path'], "rb") as f:
-                    hist_file_bytes = f.read()
-
-                st.download_button(
-                    label=f"Download .{item["format"]}",
-                    data=hist_file_bytes,
-                    file_name=os.path.basename(item['file_path']),
-                    key=f"hist_dl_{i}"
-                )
+                # Encoded only once a format is picked
+                show_download_button(item, st, key=f"hist_dl_{item['id']}")
 
             with col3:
-                if st.button("Load in Viewer", key=f"hist_view_{i}"):
-                    reloaded_trimesh = trimesh.load(item["file_path"])
-                    pv_mesh = pv.wrap(reloaded_trimesh)
-
+                if st.button("Load in Viewer", key=f"hist_view_{item['id']}"):
                     with viewer_panel.container():
                         st.info(f"`{item['prompt']}`")
-                        pv_mesh = pv.wrap(reloaded_trimesh)
+                        pv_mesh = item["mesh"].pyvista()
                         plotter = pv.Plotter(window_size=[600, 600], border=False)
                         plotter.add_mesh(pv_mesh, show_edges=True)
                         plotter.view_isometric()
@@ -65,14 +59,8 @@ def show_history(viewer_panel, download_panel):
                         stpyvista(plotter, key="main_viewer")
 
                     # update download button for the reloaded model
-                    with open(item['file_path'], "rb") as f:
-                        reloaded_bytes = f.read()
-
-                    with download_panel.container():
-                        st.download_button(
-                            label=f"⬇️ Download .{item["format"]} file",
-                            data=reloaded_bytes,
-                            file_name=os.path.basename(item['file_path']),
-                            mime="application/octet-stream"
-                        )
+                    st.session_state.current = item
+                    show_download_button(
+                        item, download_panel, key=f"loaded_{item['id']}", format=item["format"]
+                    )
                     st.success("Model loaded into the viewer!")
@@ -1,6 +1,9 @@
 import streamlit as st
 import random
 
+from backend.config import decimation as default_decimation
+from backend.mesh_utils import DECIMATION_PRESETS, EXPORT_FORMATS
+
 
 def sidebar_controls():
     """
@@ -119,10 +122,30 @@ def sidebar_controls():
                 help="More steps = more detail but slower"
             )
 
-            render_frame_size = st.slider(
-                "Render Frame Size",
+            sigma_max = st.slider(
+                "Noise Level (Sigma Max)",
                 min_value=64, max_value=256, value=160, step=32,
-                help="Higher values = more detail but more GPU memory"
+                help="Starting noise level of the sampler"
+            )
+
+            mesh_resolution = st.slider(
+                "Mesh Resolution",
+                min_value=64, max_value=256, value=128, step=32,
+                help="Higher values = more detail but slower decoding and more GPU memory"
+            )
+
+            decimation = st.selectbox(
+                "Mesh Simplification",
+                options=list(DECIMATION_PRESETS),
+                index=list(DECIMATION_PRESETS).index(default_decimation),
+                help="Fewer triangles = smaller files and a faster viewer, at some loss of detail"
+            )
+
+            precision = st.selectbox(
+                "Precision",
+                options=["fp32", "fp16", "bf16"],
+                index=0,
+                help="fp16/bf16 halve GPU memory and speed up generation (fp16 runs as bf16 on CPU)"
             )
 
         format_col1, format_col2 = st.columns([1, 1], gap="small")
@@ -136,8 +159,9 @@ def sidebar_controls():
             chosen_format = st.selectbox(
                 "Choose a file format",
                 label_visibility="collapsed",
-                options=['obj', 'ply', 'stl', 'glb'],
-                index=0
+                options=EXPORT_FORMATS,
+                index=0,
+                help="Format offered for download first; the others stay available"
             )
         # The submit button for the form
         generate_button = st.form_submit_button("Generate 3D Model", type="primary")
@@ -156,9 +180,12 @@ def sidebar_controls():
         "intended_use": intended_use,
         "guidance_scale": guidance_scale,
         "steps": num_inference_steps,
-        "frame_size": render_frame_size,
+        "sigma_max": sigma_max,
+        "resolution": mesh_resolution,
+        "decimation": decimation,
         "is_diffusion": diffusion,
         "seed": seeding,
+        "precision": precision,
         "colors": colors,
         "format": chosen_format,
         "generate_button": generate_button
@@ -1,37 +1,74 @@
 import streamlit as st
 import pyvista as pv
 from stpyvista import stpyvista
+from backend.export_cache import get_export_cache
+from backend.mesh_utils import EXPORT_FORMATS
 
 pv.start_xvfb()
 
-def show_viewer(trimesh_obj, container):
+def show_viewer(mesh, container, key="main_viewer"):
     """
-    Displays a 3D trimesh object in the Streamlit PyVista viewer.
+    Displays a MeshArtifact in the Streamlit PyVista viewer.
+    Use a distinct key for each mesh shown during the same script run.
     """
     with container.container():
-        pv_mesh = pv.wrap(trimesh_obj)
+        pv_mesh = mesh.pyvista()
         plotter = pv.Plotter(window_size=[600, 600], border=False)
-        plotter.add_mesh(
-            pv_mesh,
-            scalars=trimesh_obj.visual.vertex_colors[:, :3],
-            rgb=True,
-            show_edges=False
-        )
+        if mesh.colors is not None:
+            plotter.add_mesh(pv_mesh, scalars="colors", rgb=True, show_edges=False)
+        else:
+            plotter.add_mesh(pv_mesh, show_edges=False)
         # plotter.add_mesh(pv_mesh, show_edges=True)
         plotter.view_isometric()
         plotter.background_color = "black"
-        stpyvista(plotter, key="main_viewer")
+        stpyvista(plotter, key=key)
+
+
+def show_preview(mesh, container, key):
+    """
+    Like show_viewer(), for an intermediate preview of a model still being
+    generated. Empty previews, e.g. of a thin part at a coarse resolution,
+    are skipped, and rendering errors are only logged, so that a bad preview
+    never stops the generation.
 
-def show_download_button(file_path, container, format):
+    Returns:
+        bool: Whether the preview was shown.
     """
-    Displays a download button for the generated OBJ file.
+    if mesh.is_empty:
+        return False
+    try:
+        show_viewer(mesh, container, key=key)
+    except Exception as e:
+        print(f"Preview rendering failed: {e}")
+        return False
+    return True
+
+def show_download_button(item, container, key, format=None):
+    """
+    Displays a format picker and a download button for a generated mesh.
+    The file is encoded only once a format is picked, and cached across
+    reruns and sessions (see backend/export_cache.py).
+
+    Args:
+        item (dict): History entry with the "id", "name" and "mesh".
+        key (str): Prefix for the widget keys, distinct per button.
+        format (str): Format picked initially, or None for none.
     """
-    with open(file_path, "rb") as f:
-        file_bytes = f.read()
     with container.container():
+        chosen_format = st.selectbox(
+            "Download format",
+            options=EXPORT_FORMATS,
+            index=EXPORT_FORMATS.index(format) if format else None,
+            placeholder="Download as...",
+            label_visibility="collapsed",
+            key=f"{key}_format",
+        )
+        if chosen_format is None:
+            return
         st.download_button(
-            label=f"⬇️ Download .{format} file",
-            data=file_bytes,
-            file_name=file_path.split("/")[-1],
-            mime="application/octet-stream"
+            label=f"⬇️ Download .{chosen_format} file",
+            data=get_export_cache().get(item["id"], item["mesh"], chosen_format),
+            file_name=f"{item['name']}.{chosen_format}",
+            mime="application/octet-stream",
+            key=f"{key}_download",
         )
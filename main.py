@@ -1,24 +1,27 @@
 import os
 import time
+import uuid
 import torch
 import random
 import traceback
 import numpy as np
+from functools import partial
 import streamlit as st
 from datetime import datetime
-from backend.config import device
+from backend.config import device, live_preview_steps, live_preview_resolution
 from backend.gemini_prompt import (
     text_model_prompt,
     diffusion_model_prompt,
     gen_file_name,
 )
-from backend.mesh_utils import build_trimesh, save_mesh_as
-from backend.file_utils import ensure_output_dir, safe_join
+from backend.mesh_utils import MeshArtifact, finalize_mesh
 from backend.generate import GenerateModel
 from backend.cleaner import clear_memory
+from backend.live_preview import LivePreview
+from backend.meshmind.util.cancellation import Cancelled, DeadlineExceeded
 
 from frontend.ui import sidebar_controls
-from frontend.viewer import show_viewer, show_download_button
+from frontend.viewer import show_viewer, show_preview, show_download_button
 from frontend.history import show_history
 
 # --- Clean Startup --- 
@@ -33,6 +36,82 @@ st.title("🤖 AI Product Designer Pro")
 if "history" not in st.session_state:
     st.session_state.history = []
 
+if "pending" not in st.session_state:
+    st.session_state.pending = None
+
+if "current" not in st.session_state:
+    # History entry of the model whose download button is shown
+    st.session_state.current = None
+
+if st.session_state.get("stop_generation"):
+    # The click reran the script, which stopped the sampling run it interrupted
+    if st.session_state.pending is not None:
+        st.session_state.pending["cancel"]()
+        st.session_state.pending = None
+    st.toast("⏹️ Generation stopped.")
+
+
+def wait_for_latent(generate, future, live, viewer_panel):
+    """
+    Waits for a latent from GenerateModel.submit_latent(), showing coarse
+    live previews of the emerging shape meanwhile. The generation is
+    cancelled if this script run ends early, e.g. when the user clicks
+    "Stop", resubmits the form or closes the tab.
+    """
+    progress_bar = st.progress(0.0, text="Sampling...")
+    st.button("⏹️ Stop generation", key="stop_generation")
+    try:
+        while not future.done():
+            update = live.poll()
+            if update is not None:
+                step, total, mesh = update
+                show_preview(
+                    MeshArtifact.from_decoder_output(mesh), viewer_panel, key=f"live_preview_{step}"
+                )
+            if live.progress is not None:
+                step, total = live.progress
+                progress_bar.progress((step + 1) / total, text=f"Sampling step {step + 1}/{total}")
+            time.sleep(0.25)
+    except BaseException:
+        # Streamlit stops a script run by raising from the next st call
+        generate.cancel()
+        raise
+    finally:
+        live.close()
+    progress_bar.empty()
+    return future.result()
+
+
+def complete_generation(viewer_panel, download_panel):
+    """
+    Waits for the full-resolution mesh decoding in the background, then
+    swaps it into the viewer in place of the preview.
+    """
+    pending = st.session_state.pending
+    mesh = pending["future"].result().compact()
+    st.session_state.pending = None
+
+    # Update session history. It keeps the mesh itself, download files are
+    # only encoded on request
+    item = {
+        "id": uuid.uuid4().hex,
+        "prompt": pending["prompt"],
+        "name": pending["name"],
+        "format": pending["format"],
+        "mesh": mesh,
+        "timestamp": datetime.now().strftime("%I:%M:%S %p"),
+    }
+    st.session_state.history.append(item)
+    st.session_state.current = item
+
+    # Display in viewer
+    show_viewer(mesh, viewer_panel)
+
+    # Download button
+    show_download_button(item, download_panel, key=f"panel_{item['id']}", format=item["format"])
+    clear_memory()
+
+
 # --- Sidebar controls ---
 controls = sidebar_controls()
 
@@ -48,6 +127,11 @@ with viewer_tab:
     download_panel = st.empty()
 
     if controls["generate_button"]:
+        if st.session_state.pending is not None:
+            # The previous generation is superseded, free the GPU for this one
+            st.session_state.pending["cancel"]()
+            st.session_state.pending = None
+
         seed = controls["seed"]
         torch.manual_seed(seed)
         torch.cuda.manual_seed_all(seed)
@@ -88,52 +172,92 @@ with viewer_tab:
                         prompt,
                         guidance_scale=controls["guidance_scale"],
                         num_inference_steps=controls["steps"],
-                        frame_size=controls["frame_size"],
+                        sigma_max=controls["sigma_max"],
+                        resolution=controls["resolution"],
                         output_type="mesh",
                         return_dict=True,
+                        seed=seed,
+                        precision=controls["precision"],
+                    )
+                    live = LivePreview(
+                        generate.decode, live_preview_resolution, every=live_preview_steps
+                    )
+                    latent = wait_for_latent(
+                        generate,
+                        generate.submit_latent(controls["is_diffusion"], on_step=live),
+                        live,
+                        viewer_panel,
                     )
-                    if controls["is_diffusion"]:
-                        decoder_output = generate.diffusion()
-                    else:
-                        decoder_output = generate.text()
-    
-                    # Build mesh
-                    trimesh_obj = build_trimesh(decoder_output)
-                    st.write(" - 3D model was generated.")
 
-                    # File management
-                    output_dir = ensure_output_dir()
+                    # Download name, without the extension of the format
                     format = controls["format"]
-                    file_name = gen_file_name(prompt, format)
-                    file_path = safe_join(output_dir, file_name)
-                    save_mesh_as(decoder_output, file_path)
-    
+                    name = os.path.splitext(gen_file_name(prompt, format))[0]
+
+                    # Show a coarse preview while the full-resolution mesh is
+                    # decoded and repaired in the background
+                    preview, full_mesh = generate.decode_progressive(
+                        latent,
+                        finish=partial(
+                            finalize_mesh,
+                            decimation=controls["decimation"],
+                            cancel_token=generate.cancel_token,
+                        ),
+                    )
+                    st.session_state.pending = {
+                        "future": full_mesh,
+                        "cancel": generate.cancel,
+                        "prompt": prompt,
+                        "name": name,
+                        "format": format,
+                    }
+                    if preview is not None and show_preview(
+                        MeshArtifact.from_decoder_output(preview),
+                        viewer_panel,
+                        key="preview_viewer",
+                    ):
+                        st.write(" - Preview ready, refining the full-resolution model...")
+
+                    complete_generation(viewer_panel, download_panel)
+                    st.write(" - 3D model was generated.")
                     status.update(
                         label="✅ Generation complete!", state="complete", expanded=False
                     )
 
-                    # Update session history
-                    st.session_state.history.append(
-                        {
-                            "prompt": prompt,
-                            "file_path": file_path,
-                            "format": format,
-                            "timestamp": datetime.now().strftime("%I:%M:%S %p"),
-                        }
-                    )
-    
-                    # Display in viewer
-                    show_viewer(trimesh_obj, viewer_panel)
-    
-                    # Download button
-                    show_download_button(file_path, download_panel, format)
+                except Cancelled as e:
+                    st.session_state.pending = None
                     clear_memory()
+                    if isinstance(e, DeadlineExceeded):
+                        st.warning("⏱️ Generation took too long and was stopped.")
+                    else:
+                        st.warning("⏹️ Generation stopped.")
+                    status.update(label="Generation stopped", state="error", expanded=False)
 
                 except Exception as e:
+                    st.session_state.pending = None
                     clear_memory()
                     st.error(f"❌ An error occurred while generating the model: {e}")
                     traceback.print_exc()
 
+    elif st.session_state.pending is not None:
+        # A rerun interrupted the wait for the full-resolution mesh
+        try:
+            with st.spinner("Refining the full-resolution model..."):
+                complete_generation(viewer_panel, download_panel)
+        except Cancelled:
+            st.session_state.pending = None
+            clear_memory()
+            st.warning("⏹️ Generation stopped.")
+        except Exception as e:
+            st.session_state.pending = None
+            clear_memory()
+            st.error(f"❌ An error occurred while generating the model: {e}")
+            traceback.print_exc()
+
+    elif st.session_state.current is not None:
+        # Keep offering the last model for download across reruns
+        item = st.session_state.current
+        show_download_button(item, download_panel, key=f"panel_{item['id']}", format=item["format"])
+
 # ---------------------------
 # History Tab
 # ---------------------------